@@ -0,0 +1,103 @@
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from catalog import Catalog, normalize_name
+
+WORDS = [
+    'love', 'night', 'heart', 'fire', 'dream', 'baby', 'summer', 'rain', 'city', 'blue',
+    'gold', 'wild', 'home', 'light', 'dance', 'moon', 'road', 'river', 'ghost', 'paradise',
+]
+
+
+def synthetic_records(count, seed=0):
+    rng = random.Random(seed)
+    # Real catalogs repeat some titles ("Intro") but most are rare; mix both.
+    vocabulary = WORDS + [f"{a}{b}" for a in WORDS for b in WORDS] + [f"{a}{b}{c}" for a in WORDS for b in WORDS for c in WORDS[:5]]
+    artists = [f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}" for _ in range(max(1, count // 20))]
+    albums = [' '.join(rng.choice(WORDS) for _ in range(3)).title() for _ in range(max(1, count // 10))]
+    for i in range(count):
+        yield {
+            'id': str(1000000000 + i),
+            'name': ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(1, 4))).title(),
+            'artist': rng.choice(artists),
+            'album': rng.choice(albums),
+            'duration_ms': rng.randint(90000, 420000),
+            'release_year': rng.randint(1960, 2026),
+        }
+
+
+def build_dict_baseline(records):
+    """The naive layout: one dict of str per song plus a name index."""
+    by_id = {}
+    by_name = {}
+    for record in records:
+        song = dict(record)
+        by_id[song['id']] = song
+        by_name.setdefault(normalize_name(song['name']), []).append(song)
+    return by_id, by_name
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, elapsed
+
+
+def time_lookups(lookup, keys):
+    start = time.perf_counter()
+    for key in keys:
+        lookup(key)
+    return (time.perf_counter() - start) / len(keys) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the compact catalog against a dict-of-str baseline.")
+    parser.add_argument("feed", nargs='?', default=None, help="Song feed parquet file. Uses synthetic songs if omitted.")
+    parser.add_argument("--songs", type=int, default=1000000, help="Number of synthetic songs (default: 1000000)")
+    parser.add_argument("--lookups", type=int, default=100000, help="Number of lookups to time (default: 100000)")
+    args = parser.parse_args()
+
+    # Each build gets freshly created strings so neither side is credited
+    # with memory owned by the other.
+    if args.feed:
+        print(f"Loading records from {args.feed}...")
+        source_catalog = Catalog.from_feed(args.feed)
+        records = lambda: (song.to_dict() for song in source_catalog)
+    else:
+        print(f"Generating {args.songs} synthetic songs...")
+        records = lambda: synthetic_records(args.songs)
+
+    (by_id, by_name), dict_bytes, dict_peak, dict_build = measure(lambda: build_dict_baseline(records()))
+    catalog, compact_bytes, compact_peak, compact_build = measure(lambda: Catalog.from_records(records()))
+
+    rng = random.Random(1)
+    rows = list(by_id.values())
+    id_keys = [rng.choice(rows)['id'] for _ in range(args.lookups)]
+    name_keys = [rng.choice(rows)['name'] for _ in range(args.lookups)]
+
+    dict_id_us = time_lookups(by_id.get, id_keys)
+    compact_id_us = time_lookups(catalog.get, id_keys)
+    dict_name_us = time_lookups(lambda name: by_name.get(normalize_name(name)), name_keys)
+    compact_name_us = time_lookups(catalog.find_by_name, name_keys)
+
+    print(f"\n--- {len(catalog)} songs ---")
+    print(f"{'':<22} {'dict baseline':>15} {'compact':>15}")
+    print(f"{'memory (MB)':<22} {dict_bytes / 1e6:>15.1f} {compact_bytes / 1e6:>15.1f}")
+    print(f"{'build peak (MB)':<22} {dict_peak / 1e6:>15.1f} {compact_peak / 1e6:>15.1f}")
+    print(f"{'build time (s)':<22} {dict_build:>15.2f} {compact_build:>15.2f}")
+    print(f"{'lookup by id (us)':<22} {dict_id_us:>15.2f} {compact_id_us:>15.2f}")
+    print(f"{'lookup by name (us)':<22} {dict_name_us:>15.2f} {compact_name_us:>15.2f}")
+    print(f"\nCompact catalog uses {dict_bytes / max(compact_bytes, 1):.1f}x less memory.")
+
+
+if __name__ == "__main__":
+    main()
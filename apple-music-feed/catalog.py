@@ -0,0 +1,335 @@
+import hashlib
+import re
+import sys
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+# Default mapping from catalog fields to columns in the Apple Music song feed.
+# Override with `columns=` when loading a feed with a different schema.
+FEED_COLUMNS = {
+    'id': 'id',
+    'name': 'nameDefault',
+    'artist': 'primaryArtists',
+    'album': 'album',
+    'duration_ms': 'durationInMillis',
+    'release_date': 'releaseDate',
+}
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_name(text):
+    """Lowercase, strip accents and punctuation, and collapse whitespace."""
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = _PUNCTUATION.sub(' ', text.casefold())
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def _name_hash(normalized):
+    # Stable across processes, unlike the builtin str hash.
+    digest = hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+class StringPool:
+    """Dictionary-coded strings stored back to back in one UTF-8 buffer."""
+
+    __slots__ = ('_buffer', '_offsets', '_codes')
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offsets = array('Q', [0])
+        self._codes = {}
+
+    def add(self, text):
+        """Return the code for `text`, appending it to the buffer if new."""
+        text = text or ''
+        code = self._codes.get(text)
+        if code is None:
+            code = len(self._offsets) - 1
+            self._buffer += text.encode('utf-8')
+            self._offsets.append(len(self._buffer))
+            self._codes[text] = code
+        return code
+
+    def freeze(self):
+        """Drop the build-time dictionary and make the buffer immutable."""
+        self._codes = None
+        self._buffer = bytes(self._buffer)
+
+    def get(self, code):
+        return self._buffer[self._offsets[code]:self._offsets[code + 1]].decode('utf-8')
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def nbytes(self):
+        return len(self._buffer) + self._offsets.itemsize * len(self._offsets)
+
+
+class Song:
+    """Lightweight view over one catalog row, created on access."""
+
+    __slots__ = ('_catalog', '_row')
+
+    def __init__(self, catalog, row):
+        self._catalog = catalog
+        self._row = row
+
+    @property
+    def id(self):
+        return self._catalog._ids[self._row]
+
+    @property
+    def name(self):
+        return self._catalog._strings.get(self._catalog._name_codes[self._row])
+
+    @property
+    def artist(self):
+        return self._catalog._strings.get(self._catalog._artist_codes[self._row])
+
+    @property
+    def album(self):
+        return self._catalog._strings.get(self._catalog._album_codes[self._row])
+
+    @property
+    def duration_ms(self):
+        return self._catalog._durations[self._row]
+
+    @property
+    def release_year(self):
+        return self._catalog._release_years[self._row]
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'artist': self.artist,
+            'album': self.album,
+            'duration_ms': self.duration_ms,
+            'release_year': self.release_year,
+        }
+
+    def __eq__(self, other):
+        return isinstance(other, Song) and self._catalog is other._catalog and self._row == other._row
+
+    def __hash__(self):
+        return hash((id(self._catalog), self._row))
+
+    def __repr__(self):
+        return f"Song(id={self.id}, name={self.name!r}, artist={self.artist!r})"
+
+
+class Catalog:
+    """
+    Column-oriented song catalog for long-running lookup services.
+
+    Strings (names, artists, albums) share one dictionary-coded StringPool and
+    every other column is a typed `array`, so a row costs a few dozen bytes
+    instead of a dict of Python objects. Rows are materialized as `Song` views
+    only when looked up.
+    """
+
+    def __init__(self):
+        self._strings = StringPool()
+        self._ids = array('q')
+        self._name_codes = array('I')
+        self._artist_codes = array('I')
+        self._album_codes = array('I')
+        self._durations = array('I')
+        self._release_years = array('H')
+        # Lookup indexes, built by finalize()
+        self._id_order = None
+        self._sorted_ids = None
+        self._name_order = None
+        self._sorted_name_hashes = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        for row in range(len(self._ids)):
+            yield Song(self, row)
+
+    def add(self, song_id, name, artist='', album='', duration_ms=0, release_year=0):
+        """
+        Append one song. Raises ValueError for non-numeric values and
+        OverflowError for ones outside their column's type, leaving the
+        catalog unchanged, so every column stays aligned row for row.
+        """
+        if self._sorted_ids is not None:
+            raise RuntimeError("Catalog is finalized; create a new one to add songs.")
+        song_id = _in_range(int(song_id), self._ids, 'id')
+        duration_ms = _in_range(max(0, int(duration_ms or 0)), self._durations, 'duration_ms')
+        release_year = _in_range(max(0, int(release_year or 0)), self._release_years, 'release_year')
+        self._ids.append(song_id)
+        self._name_codes.append(self._strings.add(name))
+        self._artist_codes.append(self._strings.add(artist))
+        self._album_codes.append(self._strings.add(album))
+        self._durations.append(duration_ms)
+        self._release_years.append(release_year)
+
+    def finalize(self):
+        """Build the sorted ID and name-hash indexes. Call once after loading."""
+        ids = self._ids
+        id_order = sorted(range(len(ids)), key=ids.__getitem__)
+        self._id_order = array('I', id_order)
+        self._sorted_ids = array('q', (ids[i] for i in id_order))
+
+        strings = self._strings
+        name_hash_by_code = {}
+        hashes = array('Q')
+        for code in self._name_codes:
+            h = name_hash_by_code.get(code)
+            if h is None:
+                h = name_hash_by_code[code] = _name_hash(normalize_name(strings.get(code)))
+            hashes.append(h)
+        name_order = sorted(range(len(hashes)), key=hashes.__getitem__)
+        self._name_order = array('I', name_order)
+        self._sorted_name_hashes = array('Q', (hashes[i] for i in name_order))
+
+        strings.freeze()
+        return self
+
+    def get(self, song_id):
+        """Return the Song with this Apple Music ID, or None."""
+        try:
+            key = int(song_id)
+        except (TypeError, ValueError):
+            return None
+        i = bisect_left(self._sorted_ids, key)
+        if i < len(self._sorted_ids) and self._sorted_ids[i] == key:
+            return Song(self, self._id_order[i])
+        return None
+
+    def find_by_name(self, name):
+        """Return every Song whose normalized name matches `name`."""
+        normalized = normalize_name(name)
+        key = _name_hash(normalized)
+        hashes = self._sorted_name_hashes
+        i = bisect_left(hashes, key)
+        matches = []
+        verified = {}
+        while i < len(hashes) and hashes[i] == key:
+            row = self._name_order[i]
+            code = self._name_codes[row]
+            # Guard against hash collisions, once per distinct name
+            if code not in verified:
+                verified[code] = normalize_name(self._strings.get(code)) == normalized
+            if verified[code]:
+                matches.append(Song(self, row))
+            i += 1
+        return matches
+
+    def nbytes(self):
+        """Approximate memory held by the catalog's buffers and indexes."""
+        columns = [
+            self._ids, self._name_codes, self._artist_codes, self._album_codes,
+            self._durations, self._release_years,
+            self._id_order, self._sorted_ids, self._name_order, self._sorted_name_hashes,
+        ]
+        total = self._strings.nbytes()
+        for column in columns:
+            if column is not None:
+                total += column.itemsize * len(column)
+        return total
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a catalog from an iterable of dicts keyed like `FEED_COLUMNS`."""
+        catalog = cls()
+        for record in records:
+            catalog.add(
+                record['id'],
+                record.get('name', ''),
+                record.get('artist', ''),
+                record.get('album', ''),
+                record.get('duration_ms', 0),
+                record.get('release_year', 0),
+            )
+        return catalog.finalize()
+
+    @classmethod
+    def from_feed(cls, file_path, columns=None, batch_size=65536, limit=None):
+        """Stream a downloaded Apple Music song feed (parquet) into a catalog."""
+        import pyarrow.parquet as pq
+
+        columns = {**FEED_COLUMNS, **(columns or {})}
+        parquet_file = pq.ParquetFile(file_path)
+        available = set(parquet_file.schema_arrow.names)
+        if columns['id'] not in available:
+            raise ValueError(f"Feed has no '{columns['id']}' column; available: {sorted(available)}")
+        wanted = [c for c in columns.values() if c in available]
+
+        catalog = cls()
+        loaded = 0
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=wanted):
+            for row in batch.to_pylist():
+                if limit is not None and loaded >= limit:
+                    return catalog.finalize()
+                song_id = row.get(columns['id'])
+                if song_id is None:
+                    continue
+                try:
+                    catalog.add(
+                        song_id,
+                        _feed_text(row.get(columns['name'])),
+                        _feed_text(row.get(columns['artist'])),
+                        _feed_text(row.get(columns['album'])),
+                        row.get(columns['duration_ms']) or 0,
+                        _release_year(row.get(columns['release_date'])),
+                    )
+                except (ValueError, OverflowError):
+                    # Non-numeric IDs are not Apple Music catalog songs, and
+                    # malformed durations or years would not fit their columns
+                    continue
+                loaded += 1
+        return catalog.finalize()
+
+
+def _in_range(value, column, field):
+    """Return `value` if the typed `column` can hold it (lowercase typecodes are signed)."""
+    bits = 8 * column.itemsize
+    low, high = (-(1 << (bits - 1)), (1 << (bits - 1)) - 1) if column.typecode.islower() else (0, (1 << bits) - 1)
+    if not low <= value <= high:
+        raise OverflowError(f"{field} {value} is outside {low}..{high}")
+    return value
+
+
+def _feed_text(value):
+    """Flatten a feed value (str, struct or list of structs) to display text."""
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        for key in ('name', 'nameDefault', 'value'):
+            if value.get(key):
+                return _feed_text(value[key])
+        return ''
+    if isinstance(value, (list, tuple)):
+        return ', '.join(t for t in (_feed_text(v) for v in value) if t)
+    return str(value)
+
+
+def _release_year(value):
+    if value is None:
+        return 0
+    if hasattr(value, 'year'):
+        return value.year
+    match = re.match(r"(\d{4})", str(value))
+    return int(match.group(1)) if match else 0
+
+
+if __name__ == "__main__":
+    file_to_load = sys.argv[1] if len(sys.argv) > 1 else "song_song_2026-01-19T16-06_part0.parquet.gz"
+    catalog = Catalog.from_feed(file_to_load)
+    print(f"Loaded {len(catalog)} songs ({catalog.nbytes() / 1e6:.1f} MB)")
+    for query in sys.argv[2:]:
+        for song in catalog.find_by_name(query):
+            print(song.to_dict())
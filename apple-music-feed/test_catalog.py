@@ -0,0 +1,44 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from catalog import Catalog
+
+#   python -m pytest test_catalog.py
+
+
+def test_add_rejects_malformed_row_without_partial_append():
+    catalog = Catalog()
+    catalog.add('1', 'Hey Jude', 'The Beatles', 'Hey Jude', 431000, 1968)
+    with pytest.raises(ValueError):
+        catalog.add('2', 'Bad', duration_ms='abc')
+    with pytest.raises(OverflowError):
+        catalog.add('3', 'Too Long', duration_ms=2 ** 40)
+    with pytest.raises(OverflowError):
+        catalog.add(2 ** 64, 'Huge ID')
+    catalog.add('4', 'Yesterday', 'The Beatles', 'Help!', 125000, 1965)
+    catalog.finalize()
+
+    assert len(catalog) == 2
+    assert catalog.get(4).to_dict() == {
+        'id': 4, 'name': 'Yesterday', 'artist': 'The Beatles', 'album': 'Help!',
+        'duration_ms': 125000, 'release_year': 1965,
+    }
+    assert catalog.get(2) is None and catalog.get(3) is None
+
+
+def test_from_feed_skips_malformed_rows(tmp_path):
+    path = tmp_path / "feed.parquet"
+    pq.write_table(pa.table({
+        'id': ['1', 'x', '2', '3', '4'],
+        'nameDefault': ['One', 'Not a song', 'Two', 'Three', 'Four'],
+        'primaryArtists': ['A', 'B', 'C', 'D', 'E'],
+        'durationInMillis': [1000, 2000, 2 ** 40, 3000, 4000],
+        'releaseDate': ['2001-01-01', '2002-01-01', '2003-01-01', '1999-01-01', '2004-06-01'],
+    }), path)
+    catalog = Catalog.from_feed(path)
+
+    assert [song.id for song in catalog] == [1, 3, 4]
+    assert [(song.name, song.duration_ms, song.release_year) for song in catalog] == [
+        ('One', 1000, 2001), ('Three', 3000, 1999), ('Four', 4000, 2004),
+    ]
@@ -0,0 +1,164 @@
+import argparse
+import json
+import math
+import os
+
+import torch
+from torch import nn
+
+# Parameter-efficient continual fine-tuning: train LoRA adapters or only the
+# top-k transformer layers (plus the classifier), save just those weights as a
+# small delta, and merge the delta into the base model for export.
+#
+#   python train.py configs/finetune3_lora.json
+#   python adapters.py merge --base ./model --delta ./model2_delta --output ./model2
+
+DELTA_WEIGHTS = "delta.safetensors"
+DELTA_CONFIG = "delta_config.json"
+DEFAULT_LORA_TARGETS = ("q_lin", "k_lin", "v_lin", "out_lin")
+
+
+class LoRALinear(nn.Module):
+    """A frozen nn.Linear plus a trainable low-rank update: W x + (alpha / r) B A x."""
+
+    def __init__(self, base, rank=8, alpha=16, dropout=0.0):
+        super().__init__()
+        self.base = base
+        self.rank = rank
+        self.scaling = alpha / rank
+        self.lora_A = nn.Parameter(torch.empty(rank, base.in_features))
+        self.lora_B = nn.Parameter(torch.zeros(base.out_features, rank))
+        nn.init.kaiming_uniform_(self.lora_A, a=math.sqrt(5))
+        self.dropout = nn.Dropout(dropout) if dropout else nn.Identity()
+        base.weight.requires_grad_(False)
+        if base.bias is not None:
+            base.bias.requires_grad_(False)
+
+    def forward(self, x):
+        return self.base(x) + (self.dropout(x) @ self.lora_A.t() @ self.lora_B.t()) * self.scaling
+
+    def merged(self):
+        """The base Linear with the low-rank update folded into its weight."""
+        with torch.no_grad():
+            self.base.weight += (self.lora_B @ self.lora_A) * self.scaling
+        return self.base
+
+
+def transformer_layers(model):
+    """The stack of transformer blocks of a DistilBERT (or BERT-style) token classifier."""
+    backbone = getattr(model, model.base_model_prefix)
+    if hasattr(backbone, "transformer"):
+        return backbone.transformer.layer
+    return backbone.encoder.layer
+
+
+def add_lora(model, rank=8, alpha=16, dropout=0.0, targets=DEFAULT_LORA_TARGETS):
+    """Wrap every Linear named in `targets` inside the transformer blocks with LoRALinear."""
+    for layer in transformer_layers(model):
+        for parent in layer.modules():
+            for name, child in list(parent.named_children()):
+                if name in targets and isinstance(child, nn.Linear):
+                    setattr(parent, name, LoRALinear(child, rank, alpha, dropout))
+    return model
+
+
+def merge_lora(model):
+    """Replace every LoRALinear with its merged Linear, leaving a plain model."""
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, LoRALinear):
+                setattr(parent, name, child.merged())
+    return model
+
+
+def classifier_prefixes(model):
+    return [name for name, _ in model.named_children() if name != model.base_model_prefix]
+
+
+def prepare_model(model, delta_config):
+    """
+    Set up `model` for a delta fine-tune and freeze everything else.
+
+    Modes: "lora" trains adapters on the transformer blocks, "top_k" trains
+    the last `top_k_layers` blocks. Both also train the classification head.
+    """
+    mode = delta_config["mode"]
+    for parameter in model.parameters():
+        parameter.requires_grad_(False)
+
+    if mode == "lora":
+        add_lora(model, delta_config["lora_rank"], delta_config["lora_alpha"],
+                 delta_config.get("lora_dropout", 0.0), delta_config["lora_targets"])
+        trainable = [p for n, p in model.named_parameters() if "lora_" in n]
+    elif mode == "top_k":
+        layers = transformer_layers(model)
+        trainable = [p for layer in layers[len(layers) - delta_config["top_k_layers"]:] for p in layer.parameters()]
+    else:
+        raise ValueError(f"Unknown delta mode '{mode}'; expected 'lora' or 'top_k'")
+
+    for prefix in classifier_prefixes(model):
+        trainable.extend(getattr(model, prefix).parameters())
+    for parameter in trainable:
+        parameter.requires_grad_(True)
+    return model
+
+
+def delta_state_dict(model):
+    """Only the trainable weights: what a delta fine-tune changed."""
+    return {name: p.detach().contiguous() for name, p in model.named_parameters() if p.requires_grad}
+
+
+def save_delta(model, output_dir, delta_config):
+    from safetensors.torch import save_file
+
+    os.makedirs(output_dir, exist_ok=True)
+    state = delta_state_dict(model)
+    save_file(state, os.path.join(output_dir, DELTA_WEIGHTS))
+    with open(os.path.join(output_dir, DELTA_CONFIG), 'w', encoding='utf-8') as f:
+        json.dump(delta_config, f, indent=2)
+    return sum(t.numel() * t.element_size() for t in state.values())
+
+
+def load_delta(model, delta_dir):
+    """Apply a saved delta to a freshly loaded base model, returning the adapted model."""
+    from safetensors.torch import load_file
+
+    with open(os.path.join(delta_dir, DELTA_CONFIG), 'r', encoding='utf-8') as f:
+        delta_config = json.load(f)
+    prepare_model(model, delta_config)
+    missing, unexpected = model.load_state_dict(load_file(os.path.join(delta_dir, DELTA_WEIGHTS)), strict=False)
+    if unexpected:
+        raise ValueError(f"Delta has weights the model does not: {unexpected[:5]}")
+    return model
+
+
+def merge(base_path, delta_dir, output_path):
+    """Write base + delta as a plain Hugging Face model that export_coreml.py can convert."""
+    from transformers import AutoTokenizer, AutoModelForTokenClassification
+
+    model = AutoModelForTokenClassification.from_pretrained(base_path)
+    load_delta(model, delta_dir)
+    merge_lora(model)
+    for parameter in model.parameters():
+        parameter.requires_grad_(True)
+    model.save_pretrained(output_path)
+    AutoTokenizer.from_pretrained(base_path).save_pretrained(output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge a delta fine-tune into its base model.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    merge_parser = subparsers.add_parser("merge", help="Write base + delta as a full model directory")
+    merge_parser.add_argument("--base", type=str, default="./model", help="Base model directory (default: ./model)")
+    merge_parser.add_argument("--delta", type=str, required=True, help="Delta directory written by train.py")
+    merge_parser.add_argument("--output", type=str, required=True, help="Where to write the merged model")
+    args = parser.parse_args()
+
+    if args.command == "merge":
+        print(f"Merging '{args.delta}' into '{args.base}'...")
+        merge(args.base, args.delta, args.output)
+        print(f"✅ Merged model saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+import torch
+
+from decoding import decode_batch, word_id_matrix
+from inference import BACKENDS, load_backend
+from inference_cache import InferenceCache, cached_predict_batch, model_fingerprint, tokenizer_lowercases
+
+# Batch NER over a file of queries: JSONL (one object per line, the query in
+# --field), CSV (the query in column --field) or plain text / stdin (one query
+# per line). Queries are tokenized once, sorted by length into dynamically
+# padded batches and run on worker threads under torch.inference_mode().
+# Repeated queries are predicted once (inference_cache.py).
+# Each input record is written back as JSONL with an "entities" list of
+# {"entity", "label", "start", "end", "score"}, in input order.
+#
+#   python batch_predict.py queries.csv --output labelled.jsonl
+#   cat queries.txt | python batch_predict.py --backend onnx > labelled.jsonl
+
+
+def input_format(path, requested=None):
+    if requested:
+        return requested
+    if path in (None, "-"):
+        return "text"
+    extension = os.path.splitext(path)[1].lower()
+    return {".jsonl": "jsonl", ".ndjson": "jsonl", ".csv": "csv"}.get(extension, "text")
+
+
+def read_records(stream, fmt, field="query"):
+    """(records, queries) from an input stream; records are dicts written back with their entities."""
+    records, queries = [], []
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        column = field if field in (reader.fieldnames or []) else (reader.fieldnames or [field])[0]
+        for row in reader:
+            records.append(row)
+            queries.append(row.get(column) or "")
+        return records, queries
+    for line_number, line in enumerate(stream, start=1):
+        line = line.rstrip("\n")
+        if not line.strip():
+            continue
+        if fmt == "jsonl":
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Line {line_number} is not valid JSON: {e}") from e
+            if isinstance(record, str):
+                record = {field: record}
+            records.append(record)
+            queries.append(str(record.get(field) or ""))
+        else:
+            records.append({field: line})
+            queries.append(line)
+    return records, queries
+
+
+def length_batches(lengths, batch_size):
+    """Indices grouped into batches of similar token length, so padding stays small."""
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def run_batch(model, encoding, queries, indices, id2label, pad_token_id):
+    """Entities for the queries at `indices`, as [(index, entities)]."""
+    word_ids = word_id_matrix(encoding, indices)
+    input_ids = torch.full(word_ids.shape, pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros_like(input_ids)
+    offsets = numpy.zeros(word_ids.shape + (2,), dtype=numpy.int64)
+    for row, i in enumerate(indices):
+        ids = encoding["input_ids"][i]
+        input_ids[row, :len(ids)] = torch.tensor(ids)
+        attention_mask[row, :len(ids)] = 1
+        offsets[row, :len(ids)] = encoding["offset_mapping"][i]
+    with torch.inference_mode():
+        logits = model(input_ids=input_ids, attention_mask=attention_mask).logits.float().numpy()
+    texts = [queries[i] for i in indices]
+    return list(zip(indices, decode_batch(texts, logits, word_ids, offsets, id2label)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Label a file of queries with the NER model, writing JSONL entities.")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL, CSV or text file; '-' or omitted for stdin")
+    parser.add_argument("--output", type=str, default="-", help="JSONL output file (default: stdout)")
+    parser.add_argument("--format", choices=("jsonl", "csv", "text"), default=None,
+                        help="Input format (default: from the extension; text for stdin)")
+    parser.add_argument("--field", type=str, default="query", help="JSON key or CSV column holding the query (default: query)")
+    parser.add_argument("--model", type=str, default="./model", help="Path to the model directory (default: ./model)")
+    parser.add_argument("--backend", choices=BACKENDS[:2], default="pytorch", help="Runtime (default: pytorch)")
+    parser.add_argument("--path", type=str, default=None, help="ONNX file for the onnx backend (default: <model>.onnx)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Queries per batch (default: 64)")
+    parser.add_argument("--workers", type=int, default=2, help="Batches run concurrently (default: 2)")
+    parser.add_argument("--cache-path", type=str, default=None,
+                        help="Keep results here across runs (e.g. ./cache/ner_results.json); reset when the model changes")
+    parser.add_argument("--cache-entries", type=int, default=1_000_000, help="Most cached queries (default: 1000000)")
+    args = parser.parse_args()
+
+    from transformers import AutoConfig, AutoTokenizer
+
+    start = time.perf_counter()
+    fmt = input_format(args.input, args.format)
+    if args.input == "-":
+        records, queries = read_records(sys.stdin, fmt, args.field)
+    else:
+        with open(args.input, encoding="utf-8", newline="" if fmt == "csv" else None) as f:
+            records, queries = read_records(f, fmt, args.field)
+    if not queries:
+        print("⚠️  No queries to label.", file=sys.stderr)
+        return
+
+    # Workers split the cores instead of each using all of them
+    threads = max(1, (os.cpu_count() or 1) // max(1, args.workers))
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = load_backend(args.model, args.backend, args.path, threads, tokenizer)
+    id2label = {int(k): v for k, v in AutoConfig.from_pretrained(args.model).id2label.items()}
+    loaded = time.perf_counter()
+
+    def predict_batch(texts):
+        encoding = tokenizer(texts, truncation=True, return_offsets_mapping=True)
+        batches = length_batches([len(ids) for ids in encoding["input_ids"]], args.batch_size)
+        results = [None] * len(texts)
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            futures = [pool.submit(run_batch, model, encoding, texts, indices, id2label, tokenizer.pad_token_id)
+                       for indices in batches]
+            for future in futures:
+                for i, found in future.result():
+                    results[i] = found
+        return results
+
+    # Logs repeat queries; the cache runs each distinct normalized query once
+    cache = InferenceCache(args.cache_entries, path=args.cache_path,
+                           fingerprint=model_fingerprint(args.model, args.backend) if args.cache_path else None)
+    entities = cached_predict_batch(predict_batch, cache, tokenizer_lowercases(tokenizer))(queries)
+    cache.save()
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        for record, found in zip(records, entities):
+            out.write(json.dumps({**record, "entities": found}, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - loaded
+    print(f"✅ Labelled {len(queries)} queries in {elapsed:.2f}s ({len(queries) / max(elapsed, 1e-9):.0f} queries/s, "
+          f"startup {loaded - start:.2f}s, {args.workers} worker(s) x {threads} thread(s), "
+          f"cache hit rate {cache.stats()['hit_rate']:.1%})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import math
+import random
+import time
+
+from torch.utils.data import DataLoader, Sampler
+from transformers import Trainer
+
+# Token-budget batching for the fine-tuning scripts: examples of similar length
+# share a batch, and each batch holds as many as fit under `max_tokens`
+# padded tokens, so short music queries are not padded to the longest one.
+
+
+class TokenBudgetBatchSampler(Sampler):
+    """
+    Yields batches of dataset indices whose padded size stays under `max_tokens`.
+
+    Examples are bucketed by length rounded up to `bucket_width`; every batch
+    comes from one bucket and holds `max_tokens // bucket_length` examples
+    (capped at `max_batch_size`). Each epoch shuffles examples within buckets
+    and the order of batches, while the number of batches stays fixed so
+    Trainer's step and scheduler arithmetic holds.
+    """
+
+    def __init__(self, lengths, max_tokens, bucket_width=8, max_batch_size=None, shuffle=True, seed=0):
+        if max_tokens < max(lengths, default=0):
+            raise ValueError(f"max_tokens={max_tokens} is smaller than the longest example ({max(lengths)} tokens)")
+        self.max_tokens = max_tokens
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+        buckets = {}
+        for index, length in enumerate(lengths):
+            bucket_length = max(1, math.ceil(length / bucket_width)) * bucket_width
+            buckets.setdefault(min(bucket_length, max_tokens), []).append(index)
+        self.buckets = []
+        for bucket_length, indices in sorted(buckets.items()):
+            batch_size = max(1, max_tokens // bucket_length)
+            if max_batch_size is not None:
+                batch_size = min(batch_size, max_batch_size)
+            self.buckets.append((indices, batch_size))
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __iter__(self):
+        rng = random.Random(self.seed + self.epoch)
+        batches = []
+        for indices, batch_size in self.buckets:
+            if self.shuffle:
+                indices = indices.copy()
+                rng.shuffle(indices)
+            batches.extend(indices[i:i + batch_size] for i in range(0, len(indices), batch_size))
+        if self.shuffle:
+            rng.shuffle(batches)
+        # Advance on our own too, in case no wrapper forwards set_epoch
+        self.epoch += 1
+        return iter(batches)
+
+    def __len__(self):
+        return sum(math.ceil(len(indices) / batch_size) for indices, batch_size in self.buckets)
+
+
+class TokenBudgetTrainer(Trainer):
+    """
+    Trainer that batches training data with `TokenBudgetBatchSampler`.
+
+    Training logs also report `padding_ratio` (share of padded positions in
+    the batches since the last log) and `train_tokens_per_second` (real,
+    non-padding tokens processed per second).
+    """
+
+    def __init__(self, *args, max_tokens=512, bucket_width=8, max_batch_size=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_tokens = max_tokens
+        self.bucket_width = bucket_width
+        self.max_batch_size = max_batch_size
+        self._reset_token_counts()
+
+    def _reset_token_counts(self):
+        self._real_tokens = 0
+        self._padded_tokens = 0
+        self._tokens_since = time.perf_counter()
+
+    def get_train_dataloader(self):
+        if self.train_dataset is None:
+            raise ValueError("Trainer: training requires a train_dataset.")
+        train_dataset = self._remove_unused_columns(self.train_dataset, description="training")
+        batch_sampler = TokenBudgetBatchSampler(
+            [len(ids) for ids in train_dataset["input_ids"]],
+            max_tokens=self.max_tokens,
+            bucket_width=self.bucket_width,
+            max_batch_size=self.max_batch_size,
+            seed=self.args.seed,
+        )
+        self._reset_token_counts()
+        dataloader = DataLoader(
+            train_dataset,
+            batch_sampler=batch_sampler,
+            collate_fn=self.data_collator,
+            num_workers=self.args.dataloader_num_workers,
+            pin_memory=self.args.dataloader_pin_memory,
+            persistent_workers=self.args.dataloader_persistent_workers and self.args.dataloader_num_workers > 0,
+        )
+        return self.accelerator.prepare(dataloader)
+
+    def training_step(self, model, inputs, *args, **kwargs):
+        attention_mask = inputs.get("attention_mask")
+        if attention_mask is not None:
+            self._real_tokens += int(attention_mask.sum())
+            self._padded_tokens += attention_mask.numel()
+        return super().training_step(model, inputs, *args, **kwargs)
+
+    def log(self, logs, *args, **kwargs):
+        if self._padded_tokens and "loss" in logs:
+            elapsed = time.perf_counter() - self._tokens_since
+            logs["padding_ratio"] = round(1 - self._real_tokens / self._padded_tokens, 4)
+            logs["train_tokens_per_second"] = round(self._real_tokens / max(elapsed, 1e-9), 1)
+            self._reset_token_counts()
+        super().log(logs, *args, **kwargs)
+
+
+def padding_ratio(lengths, batches):
+    """Share of padded positions when each batch is padded to its longest example."""
+    padded = sum(max(lengths[i] for i in batch) * len(batch) for batch in batches)
+    return 1 - sum(lengths) / padded if padded else 0.0
+
+
+def fixed_size_batches(num_examples, batch_size, seed=0):
+    """Shuffled fixed-size batches, like the default Trainer sampler, for comparison."""
+    indices = list(range(num_examples))
+    random.Random(seed).shuffle(indices)
+    return [indices[i:i + batch_size] for i in range(0, num_examples, batch_size)]
+
+
+if __name__ == "__main__":
+    # Compare padding of fixed-size batches with token-budget batches
+    import argparse
+    from transformers import AutoTokenizer
+    from bio_data import list_dataset_dirs, load_bio_splits
+    from tokenized_data import tokenize_dataset
+
+    parser = argparse.ArgumentParser(description="Report padding for fixed-size vs token-budget batches.")
+    parser.add_argument("data", nargs="+", help="Dataset directories (or base directories with --expand)")
+    parser.add_argument("--expand", action="store_true", help="Treat data arguments as base directories of datasets")
+    parser.add_argument("--model", type=str, default="./model", help="Tokenizer directory (default: ./model)")
+    parser.add_argument("--batch-size", type=int, default=16, help="Fixed batch size to compare against (default: 16)")
+    parser.add_argument("--max-tokens", type=int, default=512, help="Token budget per batch (default: 512)")
+    args = parser.parse_args()
+
+    dataset_dirs = list_dataset_dirs(args.data) if args.expand else args.data
+    train_dataset, _ = load_bio_splits(dataset_dirs)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    lengths = [len(ids) for ids in tokenize_dataset(train_dataset, tokenizer)["input_ids"]]
+
+    fixed = fixed_size_batches(len(lengths), args.batch_size)
+    budget = list(TokenBudgetBatchSampler(lengths, args.max_tokens))
+    print(f"\n{len(lengths)} examples, mean length {sum(lengths) / len(lengths):.1f} tokens")
+    print(f"Fixed batch size {args.batch_size}: {len(fixed)} batches, padding ratio {padding_ratio(lengths, fixed):.1%}")
+    print(f"Token budget {args.max_tokens}: {len(budget)} batches, padding ratio {padding_ratio(lengths, budget):.1%}")
@@ -0,0 +1,91 @@
+import argparse
+import random
+import time
+
+from tokenized_data import align_labels, align_labels_loop, pad_labels, pad_word_ids
+
+# Checks that the vectorized label alignment matches the original per-token
+# loop exactly on a generated corpus, then compares their throughput. The
+# edge cases are covered by test_alignment.py (python -m pytest test_alignment.py).
+
+
+def align_lists(word_ids_batch, labels_batch):
+    """Run `align_labels` on list input and return lists, for comparing with the loop."""
+    if not word_ids_batch:
+        return []
+    aligned = align_labels(pad_word_ids(word_ids_batch), pad_labels(labels_batch))
+    return [row[:len(word_ids)].tolist() for row, word_ids in zip(aligned, word_ids_batch)]
+
+
+def generate_batch(num_examples, num_labels=5, max_words=40, max_pieces=4, max_length=None, seed=0):
+    """Word-ID sequences shaped like tokenizer output: [CLS] words... [SEP], words split into pieces."""
+    rng = random.Random(seed)
+    word_ids_batch = []
+    labels_batch = []
+    for _ in range(num_examples):
+        num_words = rng.randint(0, max_words)
+        word_ids = [None]
+        for word in range(num_words):
+            word_ids.extend([word] * rng.randint(1, max_pieces))
+        if max_length is not None:
+            # Mimic truncation: cut mid-word, keep the trailing [SEP]
+            word_ids = word_ids[:max_length - 1]
+        word_ids.append(None)
+        word_ids_batch.append(word_ids)
+        labels_batch.append([rng.randrange(num_labels) for _ in range(num_words)])
+    return word_ids_batch, labels_batch
+
+
+def throughput(align, batches, num_examples):
+    start = time.perf_counter()
+    for word_ids, labels in batches:
+        align(word_ids, labels)
+    return num_examples / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and benchmark vectorized label alignment.")
+    parser.add_argument("--examples", type=int, default=200000, help="Number of generated examples (default: 200000)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Examples per call, like datasets.map (default: 1000)")
+    parser.add_argument("--model", type=str, default=None, help="Also check parity on real tokenizer output from this model directory")
+    args = parser.parse_args()
+
+    print(f"Generating {args.examples} examples...")
+    word_ids_batch, labels_batch = generate_batch(args.examples)
+    for i in range(0, len(word_ids_batch), args.batch_size):
+        batch = (word_ids_batch[i:i + args.batch_size], labels_batch[i:i + args.batch_size])
+        if align_lists(*batch) != align_labels_loop(*batch):
+            print(f"❌ Mismatch in batch starting at example {i}.")
+            return
+    print("✅ Vectorized labels are identical to the loop.")
+
+    if args.model:
+        from transformers import AutoTokenizer
+        from bio_data import LABEL_LIST
+
+        tokenizer = AutoTokenizer.from_pretrained(args.model)
+        rng = random.Random(2)
+        vocabulary = list(tokenizer.get_vocab())
+        sentences = [[rng.choice(vocabulary).lstrip("#") or "x" for _ in range(rng.randint(1, 30))] for _ in range(5000)]
+        tags = [[rng.randrange(len(LABEL_LIST)) for _ in sentence] for sentence in sentences]
+        encoded = tokenizer(sentences, truncation=True, max_length=32, is_split_into_words=True)
+        word_ids = [encoded.word_ids(batch_index=i) for i in range(len(sentences))]
+        assert align_lists(word_ids, tags) == align_labels_loop(word_ids, tags)
+        print(f"✅ Identical on {len(sentences)} tokenized sentences from {args.model}.")
+
+    list_batches = [
+        (word_ids_batch[i:i + args.batch_size], labels_batch[i:i + args.batch_size])
+        for i in range(0, len(word_ids_batch), args.batch_size)
+    ]
+    start = time.perf_counter()
+    array_batches = [(pad_word_ids(word_ids), pad_labels(labels)) for word_ids, labels in list_batches]
+    conversion_rate = len(word_ids_batch) / (time.perf_counter() - start)
+
+    loop_rate = throughput(align_labels_loop, list_batches, len(word_ids_batch))
+    vector_rate = throughput(align_labels, array_batches, len(word_ids_batch))
+    print(f"\nLoop over lists:       {loop_rate:>12,.0f} examples/sec")
+    print(f"Vectorized on arrays:  {vector_rate:>12,.0f} examples/sec ({vector_rate / loop_rate:.1f}x)")
+    print(f"List -> array convert: {conversion_rate:>12,.0f} examples/sec")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+# Which NER runtime and model variant to ship: every variant runs in a fresh
+# process over the MusicRecoNER test sets and reports
+#
+#   load time and peak RSS
+#   p50/p95/p99 latency at batch size 1
+#   throughput at larger batches
+#   entity F1 on test, and recall on the seen and rare_unseen splits
+#     (those files keep only the selected entities, so only recall counts)
+#
+# into a JSON report. With --baseline, the run fails (exit 1) when a variant
+# regresses past the thresholds against a previous report.
+#
+#   python benchmark_ner.py configs/finetune.json --model ./model --output benchmark_report.json
+#   python benchmark_ner.py configs/finetune.json --baseline benchmark_report.json --output new_report.json
+
+VARIANTS = {
+    # name: (artifact file in --artifacts-dir or None for the model directory, loader)
+    "pytorch_eager": (None, "eager"),
+    "torchscript": ("model.pt", "torchscript"),
+    "onnxruntime": ("model.onnx", "onnx"),
+    "torchscript_int8_dynamic": ("model_int8_dynamic.pt", "torchscript"),
+    "onnxruntime_int8_dynamic": ("model_int8_dynamic.onnx", "onnx"),
+    "onnxruntime_int8_static": ("model_int8_static.onnx", "onnx"),
+}
+SPLITS = ("test", "seen", "rare_unseen")
+
+
+def load_test_splits(config_path, tokenizer):
+    """Tokenized test sets by split name; seen/rare_unseen come from those subfolders of each dataset."""
+    from datasets import concatenate_datasets
+    from bio_data import LABEL_LIST, find_split_file, list_dataset_dirs, load_bio_dataset
+    from tokenized_data import tokenize_dataset
+    from train import load_config
+
+    config = load_config(config_path, [])
+    dataset_dirs = list(config["dataset_dirs"]) + list_dataset_dirs(config["base_dataset_dirs"])
+    splits = {}
+    for split in SPLITS:
+        parts = []
+        for dataset_dir in dataset_dirs:
+            path = find_split_file(dataset_dir if split == "test" else os.path.join(dataset_dir, split), "test")
+            if path:
+                parts.append(load_bio_dataset(path, LABEL_LIST))
+        if parts:
+            splits[split] = tokenize_dataset(concatenate_datasets(parts), tokenizer)
+    return splits
+
+
+def prepare_artifacts(model_dir, artifacts_dir, variants, calibration_dataset):
+    """Export the TorchScript/ONNX/int8 files the variants need, unless newer copies exist."""
+    from transformers import AutoTokenizer
+    from onnx_export import export_onnx
+    from prune import load_model
+    from quantize import (BioCalibrationReader, quantize_dynamic_torch, quantize_onnx_dynamic,
+                          quantize_onnx_static, save_torchscript)
+
+    os.makedirs(artifacts_dir, exist_ok=True)
+    model_time = max(os.path.getmtime(os.path.join(model_dir, name)) for name in os.listdir(model_dir))
+    path = lambda name: os.path.join(artifacts_dir, name)
+    fresh = lambda name: os.path.exists(path(name)) and os.path.getmtime(path(name)) >= model_time
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    needed = {VARIANTS[v][0] for v in variants if VARIANTS[v][0]}
+    if {"model.onnx", "model_int8_dynamic.onnx", "model_int8_static.onnx"} & needed:
+        needed.add("model.onnx")
+
+    builders = [
+        ("model.pt", lambda: save_torchscript(load_model(model_dir, torchscript=True), tokenizer, path("model.pt"))),
+        ("model.onnx", lambda: export_onnx(load_model(model_dir, torchscript=True), tokenizer, path("model.onnx"))),
+        ("model_int8_dynamic.pt", lambda: save_torchscript(
+            quantize_dynamic_torch(load_model(model_dir, torchscript=True)), tokenizer, path("model_int8_dynamic.pt"))),
+        ("model_int8_dynamic.onnx", lambda: quantize_onnx_dynamic(path("model.onnx"), path("model_int8_dynamic.onnx"))),
+        ("model_int8_static.onnx", lambda: quantize_onnx_static(
+            path("model.onnx"), path("model_int8_static.onnx"), BioCalibrationReader(calibration_dataset))),
+    ]
+    for name, build in builders:
+        if name in needed and not fresh(name):
+            print(f"Building {name}...")
+            build()
+
+
+def current_rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def run_variant(args):
+    """Measure one variant in this (fresh) process; returns its report row."""
+    import torch
+    from transformers import AutoTokenizer
+    from bio_data import LABEL_LIST
+    from evaluation import cpu_latency, cpu_throughput, entity_f1, model_size_bytes
+
+    torch.set_num_threads(args.threads)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    splits = load_test_splits(args.config, tokenizer)
+    artifact, loader = VARIANTS[args.worker]
+    path = os.path.join(args.artifacts_dir, artifact) if artifact else args.model
+
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    if loader == "eager":
+        from prune import load_model
+        model = load_model(path).eval()
+    elif loader == "torchscript":
+        from quantize import TracedModel
+        model = TracedModel.load(path).eval()
+    else:
+        from onnx_export import OnnxRuntimeModel
+        model = OnnxRuntimeModel(path, args.threads)
+    load_seconds = time.perf_counter() - start
+    load_rss = current_rss_mb() - rss_before
+
+    latency = cpu_latency(model, tokenizer, runs=args.latency_runs, warmup=10)
+    row = {
+        "variant": args.worker,
+        "size_mb": round((model_size_bytes(path) if os.path.isdir(path) else os.path.getsize(path)) / 1e6, 2),
+        "load_seconds": round(load_seconds, 3),
+        "load_rss_mb": round(load_rss, 1),
+        "p50_ms": round(latency["p50_ms"], 3),
+        "p95_ms": round(latency["p95_ms"], 3),
+        "p99_ms": round(latency["p99_ms"], 3),
+        "throughput": {str(size): round(cpu_throughput(model, splits["test"], size), 1) for size in args.batch_sizes},
+    }
+    for split, dataset in splits.items():
+        scores = entity_f1(model, dataset, LABEL_LIST)
+        if split == "test":
+            row["entity_f1"] = round(scores["f1"], 4)
+            row["precision"] = round(scores["precision"], 4)
+            row["recall"] = round(scores["recall"], 4)
+        else:
+            row[f"{split}_recall"] = round(scores["recall"], 4)
+    # ru_maxrss is in KiB on Linux
+    row["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return row
+
+
+def regressions(rows, baseline_rows, max_slowdown, max_f1_drop, max_memory_growth):
+    """Human-readable failures of `rows` against the same variants in a previous report."""
+    previous = {row["variant"]: row for row in baseline_rows}
+    failures = []
+    for row in rows:
+        before = previous.get(row["variant"])
+        if not before:
+            continue
+        name = row["variant"]
+        if row["p50_ms"] > before["p50_ms"] * (1 + max_slowdown):
+            failures.append(f"{name}: p50 {before['p50_ms']:.2f} -> {row['p50_ms']:.2f} ms")
+        for size, value in row["throughput"].items():
+            if size in before["throughput"] and value < before["throughput"][size] * (1 - max_slowdown):
+                failures.append(f"{name}: batch {size} throughput {before['throughput'][size]:.0f} -> {value:.0f}/s")
+        for key in ("entity_f1", "seen_recall", "rare_unseen_recall"):
+            if key in row and key in before and before[key] - row[key] > max_f1_drop:
+                failures.append(f"{name}: {key} {before[key]:.4f} -> {row[key]:.4f}")
+        if row["peak_rss_mb"] > before["peak_rss_mb"] * (1 + max_memory_growth):
+            failures.append(f"{name}: peak RSS {before['peak_rss_mb']:.0f} -> {row['peak_rss_mb']:.0f} MB")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark NER runtimes and variants for speed, memory and accuracy.")
+    parser.add_argument("config", help="train.py JSON config naming the test datasets")
+    parser.add_argument("--model", type=str, default="./model", help="Fine-tuned model directory (default: ./model)")
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS),
+                        help="Variants to run (default: all)")
+    parser.add_argument("--artifacts-dir", type=str, default="./benchmark_artifacts",
+                        help="Where exported/quantized variants are kept between runs")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="Intra-op threads (default: all cores)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 32], help="Throughput batch sizes (default: 8 32)")
+    parser.add_argument("--latency-runs", type=int, default=200, help="Batch-size-1 queries timed (default: 200)")
+    parser.add_argument("--output", type=str, default="./benchmark_report.json", help="Where to write the report")
+    parser.add_argument("--baseline", type=str, default=None, help="Previous report to check for regressions")
+    parser.add_argument("--max-slowdown", type=float, default=0.10,
+                        help="Allowed latency increase / throughput decrease vs the baseline (default: 0.10)")
+    parser.add_argument("--max-f1-drop", type=float, default=0.01, help="Allowed F1/recall drop vs the baseline (default: 0.01)")
+    parser.add_argument("--max-memory-growth", type=float, default=0.10,
+                        help="Allowed peak RSS increase vs the baseline (default: 0.10)")
+    parser.add_argument("--worker", choices=list(VARIANTS), default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_variant(args)))
+        return
+
+    from transformers import AutoTokenizer
+
+    splits = load_test_splits(args.config, AutoTokenizer.from_pretrained(args.model))
+    if "test" not in splits:
+        print("❌ Error: No testing data was loaded. Please check the dataset paths. Exiting.")
+        sys.exit(1)
+    print("Test sets: " + ", ".join(f"{name} {len(dataset)}" for name, dataset in splits.items()))
+    prepare_artifacts(args.model, args.artifacts_dir, args.variants, splits["test"])
+
+    rows = []
+    here = os.path.dirname(os.path.abspath(__file__))
+    for variant in args.variants:
+        print(f"Benchmarking {variant}...")
+        command = [sys.executable, os.path.abspath(__file__), args.config, "--worker", variant, "--model", args.model,
+                   "--artifacts-dir", args.artifacts_dir, "--threads", str(args.threads),
+                   "--latency-runs", str(args.latency_runs), "--batch-sizes", *map(str, args.batch_sizes)]
+        result = subprocess.run(command, capture_output=True, text=True, env={**os.environ, "PYTHONPATH": here})
+        if result.returncode != 0:
+            print(f"❌ {variant} failed:\n{result.stderr[-2000:]}")
+            sys.exit(1)
+        rows.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    largest = str(max(args.batch_sizes))
+    print(f"\n{'variant':<26} {'load s':>7} {'peak MB':>8} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} "
+          f"{'qps@' + largest:>9} {'F1':>7} {'seen R':>7} {'rare R':>7}")
+    for row in rows:
+        print(f"{row['variant']:<26} {row['load_seconds']:>7.2f} {row['peak_rss_mb']:>8.0f} {row['p50_ms']:>7.2f} "
+              f"{row['p95_ms']:>7.2f} {row['p99_ms']:>7.2f} {row['throughput'][largest]:>9.0f} {row['entity_f1']:>7.4f} "
+              f"{row.get('seen_recall', float('nan')):>7.4f} {row.get('rare_unseen_recall', float('nan')):>7.4f}")
+
+    report = {
+        "model": args.model,
+        "threads": args.threads,
+        "test_examples": {name: len(dataset) for name, dataset in splits.items()},
+        "variants": rows,
+    }
+    failures = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            failures = regressions(rows, json.load(f)["variants"], args.max_slowdown, args.max_f1_drop,
+                                   args.max_memory_growth)
+        report["baseline"] = args.baseline
+        report["regressions"] = failures
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+    if failures:
+        print("❌ Regressions against the baseline:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    if args.baseline:
+        print("✅ No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import shutil
+
+# Shared BIO/IOB dataset loading for the fine-tuning scripts.
+# Run from the 'bert' directory, like the scripts that import it.
+
+LABEL_LIST = ["O", "B-Artist", "I-Artist", "B-WoA", "I-WoA"]
+DEFAULT_CACHE_DIR = "./cache/bio"
+
+# Bump when the parsed output format changes so stale caches are ignored.
+PARSER_VERSION = 1
+
+
+def load_bio_file(file_path):
+    """Load a BIO format file and return tokens and NER tags."""
+    tokens = []
+    ner_tags = []
+    current_tokens = []
+    current_tags = []
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:  # Empty line indicates end of sentence
+                if current_tokens:
+                    tokens.append(current_tokens)
+                    ner_tags.append(current_tags)
+                    current_tokens = []
+                    current_tags = []
+            else:
+                parts = line.split('\t')
+                if len(parts) == 2:
+                    token, tag = parts
+                    current_tokens.append(token)
+                    current_tags.append(tag)
+
+        # Add the last sentence if it exists
+        if current_tokens:
+            tokens.append(current_tokens)
+            ner_tags.append(current_tags)
+
+    return {"tokens": tokens, "ner_tags": ner_tags}
+
+
+def find_split_file(dataset_dir, split):
+    """Return the path of `split` in `dataset_dir`, preferring .IOB over .bio, or None."""
+    for extension in ("IOB", "bio"):
+        path = os.path.join(dataset_dir, f"{split}.{extension}")
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def list_dataset_dirs(base_dirs):
+    """Expand each base directory into its sorted subdirectories."""
+    dataset_dirs = []
+    for base in base_dirs:
+        if os.path.exists(base):
+            for d in sorted(os.listdir(base)):
+                full_path = os.path.join(base, d)
+                if os.path.isdir(full_path):
+                    dataset_dirs.append(full_path)
+    return dataset_dirs
+
+
+def file_fingerprint(file_path, label_list=LABEL_LIST):
+    """Hash of the file content, the label set and the parser version."""
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    h.update(json.dumps([PARSER_VERSION, list(label_list)]).encode('utf-8'))
+    return h.hexdigest()[:32]
+
+
+def encode_tags(data, label_list, file_path=""):
+    """Convert string tags to label IDs, failing on tags not in `label_list`."""
+    label2id = {label: i for i, label in enumerate(label_list)}
+    encoded = []
+    for sentence_index, tags in enumerate(data["ner_tags"]):
+        try:
+            encoded.append([label2id[tag] for tag in tags])
+        except KeyError as e:
+            raise ValueError(
+                f"Unknown tag {e.args[0]!r} in sentence {sentence_index} of {file_path or 'dataset'}; "
+                f"expected one of {label_list}"
+            ) from None
+    return {"tokens": data["tokens"], "ner_tags": encoded}
+
+
+def save_dataset_atomically(dataset, path):
+    """Save `dataset` to `path` so concurrent runs never see a partial copy."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    dataset.save_to_disk(tmp_path)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # Another run finished the same entry first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def load_bio_dataset(file_path, label_list=LABEL_LIST, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Load one BIO/IOB file as a `datasets.Dataset` with integer `ner_tags`.
+
+    The parsed file is saved as Arrow under `cache_dir`, keyed by its content
+    fingerprint, so later runs memory-map it instead of re-parsing. Editing the
+    file (or the label list) changes the fingerprint and triggers a re-parse.
+    """
+    from datasets import Dataset, load_from_disk
+
+    fingerprint = file_fingerprint(file_path, label_list)
+    cache_path = os.path.join(cache_dir, fingerprint)
+    if os.path.exists(os.path.join(cache_path, "dataset_info.json")):
+        return load_from_disk(cache_path)
+
+    data = encode_tags(load_bio_file(file_path), label_list, file_path)
+    save_dataset_atomically(Dataset.from_dict(data), cache_path)
+    return load_from_disk(cache_path)
+
+
+def load_bio_splits(dataset_dirs, label_list=LABEL_LIST, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Load and concatenate the train and test splits of every dataset directory.
+
+    Directories missing either split are skipped with a warning. Returns
+    `(train_dataset, test_dataset)`, either of which is None if nothing loaded.
+    """
+    from datasets import concatenate_datasets
+
+    train_parts = []
+    test_parts = []
+    for dataset_dir in dataset_dirs:
+        train_path = find_split_file(dataset_dir, "train")
+        test_path = find_split_file(dataset_dir, "test")
+        if train_path is None:
+            print(f"⚠️  Warning: Could not find train.IOB or train.bio in {dataset_dir}. Skipping.")
+            continue
+        if test_path is None:
+            print(f"⚠️  Warning: Could not find test file corresponding to {train_path}. Skipping.")
+            continue
+
+        train_part = load_bio_dataset(train_path, label_list, cache_dir)
+        test_part = load_bio_dataset(test_path, label_list, cache_dir)
+        train_parts.append(train_part)
+        test_parts.append(test_part)
+        print(f"Successfully loaded {dataset_dir}: {len(train_part)} train, {len(test_part)} test examples.")
+
+    train_dataset = concatenate_datasets(train_parts) if train_parts else None
+    test_dataset = concatenate_datasets(test_parts) if test_parts else None
+    return train_dataset, test_dataset
@@ -0,0 +1,270 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+# Builds several Core ML variants of the model (precisions/compressions from
+# compression_check.py × sequence-length sets from coreml_shapes.py) in
+# parallel processes, skipping any whose inputs have not changed.
+#
+# Each artifact is keyed by a fingerprint of the model weights, config and
+# tokenizer files, the merged delta (if any), the conversion options, the
+# torch/coremltools versions and the source of the modules doing the export.
+# Built packages live under --cache-dir/<key> and are linked into
+# --output-dir, with a manifest.json describing every one.
+#
+#   python build_coreml.py --variants fp16 palettize6 int8 --shape-sets range auto --config configs/finetune.json
+
+DEFAULT_CACHE_DIR = "./cache/coreml"
+PACKAGE_NAME = "MusicNER.mlpackage"
+# Written last into a cache entry; an entry without it is incomplete
+BUILD_INFO = "build.json"
+# Modules whose code decides what a conversion produces: loading and merging
+# the model, tracing, shapes and compression
+EXPORT_SOURCES = ("export_coreml.py", "compression_check.py", "coreml_shapes.py", "prune.py", "adapters.py")
+
+
+def directory_fingerprint(path):
+    """Hash of every file under `path`: relative names and contents."""
+    h = hashlib.sha256()
+    for root, dirs, names in os.walk(path):
+        dirs.sort()
+        for name in sorted(names):
+            file_path = os.path.join(root, name)
+            h.update(os.path.relpath(file_path, path).encode('utf-8'))
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+    return h.hexdigest()[:32]
+
+
+def source_fingerprint():
+    """Hash of the EXPORT_SOURCES files, so editing any of them invalidates cached packages."""
+    h = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in EXPORT_SOURCES:
+        h.update(name.encode('utf-8'))
+        with open(os.path.join(here, name), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()[:32]
+
+
+def tool_versions():
+    import coremltools
+    import torch
+    import transformers
+
+    return {
+        "coremltools": coremltools.__version__,
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "export_sources": source_fingerprint(),
+    }
+
+
+def parse_shape_set(value):
+    """"range", "auto" or comma-separated lengths such as "16,32,64"."""
+    if value in ("range", "auto"):
+        return value
+    try:
+        lengths = sorted({int(length) for length in value.split(",")})
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Shape set must be 'range', 'auto' or lengths like 16,32,64, not '{value}'")
+    if not lengths or lengths[0] < 1:
+        raise argparse.ArgumentTypeError(f"Invalid sequence lengths '{value}'")
+    return lengths
+
+
+def shape_label(lengths):
+    return "-".join(str(length) for length in lengths) if lengths else "range"
+
+
+def artifact_key(inputs, variant, lengths, versions):
+    options = {"variant": variant, "lengths": lengths, "deployment_target": "iOS18", **versions}
+    h = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8'))
+    h.update(json.dumps(options, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()[:32]
+
+
+def build_artifact(job):
+    """Convert one variant into its cache entry. Runs in a worker process."""
+    import torch
+    from export_coreml import build_variant, load_for_export, set_metadata, trace
+
+    torch.set_num_threads(job["threads"])
+    start = time.perf_counter()
+    tokenizer, model = load_for_export(job["model"], job["delta"])
+    mlmodel = build_variant(trace(model, tokenizer), tokenizer.model_max_length, job["lengths"], job["variant"])
+    set_metadata(mlmodel, job["lengths"])
+
+    cache_path = job["cache_path"]
+    tmp_path = f"{cache_path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    mlmodel.save(os.path.join(tmp_path, PACKAGE_NAME))
+    info = {key: job[key] for key in ("key", "variant", "lengths", "inputs", "versions")}
+    info["build_seconds"] = round(time.perf_counter() - start, 2)
+    with open(os.path.join(tmp_path, BUILD_INFO), 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=2)
+    try:
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # Another build finished the same entry first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return job["key"]
+
+
+def link_package(source, destination):
+    """Hard-link `source` into `destination` (copying across file systems), replacing what was there."""
+    shutil.rmtree(destination, ignore_errors=True)
+
+    def link(src, dst):
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    shutil.copytree(source, destination, copy_function=link)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build Core ML variants in parallel with a fingerprinted cache.")
+    parser.add_argument("--model", type=str, default="./model", help="Path to the model directory (default: ./model)")
+    parser.add_argument("--delta", type=str, default=None, help="Delta fine-tune (from train.py) to merge before export")
+    parser.add_argument("--variants", nargs="+", default=["fp16"],
+                        help="fp32, fp16, palettize<bits> and/or int8 (default: fp16)")
+    parser.add_argument("--shape-sets", nargs="+", type=parse_shape_set, default=["range"],
+                        help="'range' (flexible length), 'auto' (from --config training queries) or lengths like 16,32,64")
+    parser.add_argument("--config", type=str, default=None, help="train.py config used by the 'auto' shape set")
+    parser.add_argument("--max-shapes", type=int, default=4, help="Most enumerated lengths for 'auto' (default: 4)")
+    parser.add_argument("--output-dir", type=str, default="./coreml", help="Where packages and manifest.json go")
+    parser.add_argument("--cache-dir", type=str, default=DEFAULT_CACHE_DIR, help=f"Build cache (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--jobs", type=int, default=None, help="Parallel conversions (default: one per variant, up to the cores)")
+    parser.add_argument("--force", action="store_true", help="Rebuild even when a cached artifact matches")
+    args = parser.parse_args()
+
+    from compression_check import parse_variant
+
+    if not os.path.isdir(args.model):
+        print(f"❌ Error: Model directory not found at '{args.model}'.")
+        sys.exit(1)
+    for variant in args.variants:
+        try:
+            parse_variant(variant)
+        except ValueError as e:
+            parser.error(str(e))
+
+    shape_sets = []
+    for shape_set in args.shape_sets:
+        if shape_set == "auto":
+            if not args.config:
+                parser.error("The 'auto' shape set needs --config")
+            from transformers import AutoTokenizer
+            from export_coreml import enumerated_lengths
+
+            shape_set = enumerated_lengths(args.config, AutoTokenizer.from_pretrained(args.model), args.max_shapes)
+        shape_sets.append(None if shape_set == "range" else shape_set)
+
+    inputs = {"model": directory_fingerprint(args.model)}
+    if args.delta:
+        inputs["delta"] = directory_fingerprint(args.delta)
+    versions = tool_versions()
+
+    jobs, seen = [], set()
+    for variant in args.variants:
+        for lengths in shape_sets:
+            key = artifact_key(inputs, variant, lengths, versions)
+            if key in seen:
+                continue
+            seen.add(key)
+            jobs.append({
+                "key": key,
+                "name": f"MusicNER-{variant}-{shape_label(lengths)}.mlpackage",
+                "variant": variant,
+                "lengths": lengths,
+                "model": os.path.abspath(args.model),
+                "delta": os.path.abspath(args.delta) if args.delta else None,
+                "inputs": inputs,
+                "versions": versions,
+                "cache_path": os.path.abspath(os.path.join(args.cache_dir, key)),
+            })
+
+    os.makedirs(args.cache_dir, exist_ok=True)
+    if args.force:
+        for job in jobs:
+            shutil.rmtree(job["cache_path"], ignore_errors=True)
+    pending = [job for job in jobs if not os.path.exists(os.path.join(job["cache_path"], BUILD_INFO))]
+    print(f"{len(jobs)} artifact(s): {len(jobs) - len(pending)} cached, {len(pending)} to build.")
+
+    failed = {}
+    if pending:
+        cpus = os.cpu_count() or 1
+        workers = max(1, min(args.jobs or cpus, len(pending), cpus))
+        for job in pending:
+            # Split the cores between concurrent conversions
+            job["threads"] = max(1, cpus // workers)
+        # spawn: forked workers would inherit torch's thread pools
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+            futures = {pool.submit(build_artifact, job): job for job in pending}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    future.result()
+                    print(f"✅ Built {job['name']}")
+                except Exception as e:
+                    failed[job["key"]] = str(e)
+                    print(f"❌ Failed to build {job['name']}: {e}")
+
+    from export_coreml import package_size
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    artifacts = []
+    built = {job["key"] for job in pending}
+    for job in jobs:
+        if job["key"] in failed:
+            artifacts.append({"name": job["name"], "variant": job["variant"], "lengths": job["lengths"],
+                              "key": job["key"], "error": failed[job["key"]]})
+            continue
+        with open(os.path.join(job["cache_path"], BUILD_INFO), encoding='utf-8') as f:
+            info = json.load(f)
+        destination = os.path.join(args.output_dir, job["name"])
+        link_package(os.path.join(job["cache_path"], PACKAGE_NAME), destination)
+        artifacts.append({
+            "name": job["name"],
+            "variant": job["variant"],
+            "lengths": job["lengths"],
+            "key": job["key"],
+            "cache": "miss" if job["key"] in built else "hit",
+            "size_bytes": package_size(destination),
+            "build_seconds": info["build_seconds"],
+        })
+
+    print(f"\n{'artifact':<40} {'cache':>6} {'size MB':>9} {'build s':>8}")
+    for artifact in artifacts:
+        if "error" in artifact:
+            print(f"{artifact['name']:<40} {'failed':>6}")
+            continue
+        print(f"{artifact['name']:<40} {artifact['cache']:>6} {artifact['size_bytes'] / 1e6:>9.2f} "
+              f"{artifact['build_seconds']:>8.1f}")
+
+    manifest_path = os.path.join(args.output_dir, "manifest.json")
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "model": args.model,
+            "delta": args.delta,
+            "inputs": inputs,
+            "versions": versions,
+            "artifacts": artifacts,
+        }, f, indent=2)
+    print(f"\nManifest written to {manifest_path}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import sys
+
+import torch
+
+from evaluation import entity_f1
+
+# Weight compression variants of the Core ML export, and a Linux-runnable
+# accuracy check for the packages that are actually shipped. Core ML
+# predictions need macOS, so the check reads each built .mlpackage's weights
+# with coremltools, expands palettized and quantized constants back to float
+# exactly as the device does, loads them into the PyTorch model and compares
+# its outputs with the fp32 baseline on the BIO test sets. Activations still
+# run in fp32 here; only the weights come from the package.
+#
+#   python export_coreml.py --variants fp32 fp16 palettize6 palettize4 int8
+#   python compression_check.py configs/finetune.json MusicNER-fp16.mlpackage MusicNER-palettize4.mlpackage
+#   python compression_check.py configs/finetune.json ./build/coreml    # every .mlpackage in a directory
+#
+# Variant names: "fp32", "fp16", "palettize<bits>" (k-means LUT, per tensor)
+# and "int8" (linear symmetric, per output channel).
+
+# Suffixes coremltools appends to a weight's name as it casts and compresses it
+WEIGHT_SUFFIXES = ("_palettized", "_quantized", "_to_fp16")
+
+
+def parse_variant(name):
+    """(kind, bits) for a variant name: ("float", 32|16), ("palettize", n) or ("linear", 8)."""
+    if name in ("fp32", "fp16"):
+        return "float", int(name[2:])
+    if name.startswith("palettize") and name[len("palettize"):].isdigit():
+        bits = int(name[len("palettize"):])
+        if 1 <= bits <= 8:
+            return "palettize", bits
+    if name == "int8":
+        return "linear", 8
+    raise ValueError(f"Unknown compression variant '{name}'; expected fp32, fp16, palettize<1-8> or int8")
+
+
+def package_weights(path):
+    """
+    {op name: float32 array} of the weights an ML program package computes
+    with: plain constants as stored, and constexpr (palettized, quantized)
+    weights materialized to dense values.
+    """
+    import numpy as np
+    import coremltools as ct
+    from coremltools.converters.mil.frontend.milproto.load import load as milproto_to_pymil
+
+    mlmodel = ct.models.MLModel(str(path), skip_model_load=True)
+    spec = mlmodel.get_spec()
+    program = milproto_to_pymil(model_spec=spec, specification_version=spec.specificationVersion,
+                                file_weights_dir=mlmodel.weights_dir)
+    weights = {}
+    for function in program.functions.values():
+        for op in function.operations:
+            if op.op_type != "const" and not op.op_type.startswith("constexpr_"):
+                continue
+            output = op.outputs[0]
+            # Indices, LUTs and scales only feed constexpr ops; keep the weights the network reads
+            if all(child.op_type.startswith("constexpr_") for child in output.child_ops):
+                continue
+            value = op.materialized_val_inference() if op.op_type != "const" else output.val
+            if isinstance(value, np.ndarray) and value.dtype.kind == "f":
+                weights.setdefault(op.name, value.astype(np.float32))
+    return weights
+
+
+@torch.no_grad()
+def load_package_weights(model, path):
+    """Overwrite `model`'s parameters with the (decompressed) weights of the Core ML package at `path`."""
+    weights = {}
+    for name, value in package_weights(path).items():
+        while name.endswith(WEIGHT_SUFFIXES):
+            name = name[:-len(next(suffix for suffix in WEIGHT_SUFFIXES if name.endswith(suffix)))]
+        weights[name] = value
+    # export_coreml.TraceableTokenClassifier holds the model as `.model`
+    missing = []
+    for name, parameter in model.named_parameters():
+        value = weights.get("model_" + name.replace(".", "_"))
+        if value is None or tuple(value.shape) != tuple(parameter.shape):
+            missing.append(name)
+            continue
+        parameter.copy_(torch.from_numpy(value))
+    if missing:
+        raise ValueError(f"{path} has no weights matching {len(missing)} parameter(s), e.g. {missing[0]}")
+    return model
+
+
+def package_paths(paths):
+    """The .mlpackage files named in `paths`, expanding directories to the packages they contain."""
+    found = []
+    for path in paths:
+        if path.rstrip("/").endswith(".mlpackage") or not os.path.isdir(path):
+            found.append(path.rstrip("/"))
+        else:
+            found.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".mlpackage"))
+    return found
+
+
+def compare_logits(baseline, model, tokenized_dataset, batch_size=32):
+    """Largest logit difference and token-level argmax agreement over a tokenized dataset."""
+    worst, agree, total = 0.0, 0, 0
+    for start in range(0, len(tokenized_dataset), batch_size):
+        rows = tokenized_dataset[start:start + batch_size]["input_ids"]
+        length = max(len(ids) for ids in rows)
+        input_ids = torch.zeros(len(rows), length, dtype=torch.long)
+        mask = torch.zeros_like(input_ids)
+        for i, ids in enumerate(rows):
+            input_ids[i, :len(ids)] = torch.tensor(ids)
+            mask[i, :len(ids)] = 1
+        with torch.inference_mode():
+            expected = baseline(input_ids=input_ids, attention_mask=mask).logits
+            actual = model(input_ids=input_ids, attention_mask=mask).logits
+        real = mask.bool()
+        worst = max(worst, (expected - actual)[real].abs().max().item())
+        agree += int((expected.argmax(-1) == actual.argmax(-1))[real].sum())
+        total += int(real.sum())
+    return worst, agree / total if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check built Core ML packages' weights against fp32 in PyTorch.")
+    parser.add_argument("config", help="train.py JSON config whose test splits are scored")
+    parser.add_argument("packages", nargs="+",
+                        help=".mlpackage files from export_coreml.py/build_coreml.py, or directories holding them")
+    parser.add_argument("--model", type=str, default="./model",
+                        help="Fine-tuned model directory the packages were exported from (default: ./model)")
+    parser.add_argument("--max-f1-drop", type=float, default=0.01,
+                        help="Largest allowed entity-F1 drop below fp32 (default: 0.01)")
+    parser.add_argument("--report", type=str, default="./compression_report.json", help="Where to write the report")
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+    from bio_data import LABEL_LIST, list_dataset_dirs, load_bio_splits
+    from prune import load_model
+    from tokenized_data import tokenize_dataset
+    from train import load_config
+
+    packages = package_paths(args.packages)
+    if not packages:
+        print("❌ Error: No .mlpackage found. Build them with export_coreml.py --variants or build_coreml.py.")
+        sys.exit(1)
+    config = load_config(args.config, [])
+    dataset_dirs = list(config["dataset_dirs"]) + list_dataset_dirs(config["base_dataset_dirs"])
+    _, test_dataset = load_bio_splits(dataset_dirs, LABEL_LIST)
+    if test_dataset is None:
+        print("❌ Error: No testing data was loaded. Please check the dataset paths. Exiting.")
+        sys.exit(1)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    tokenized_test = tokenize_dataset(test_dataset, tokenizer)
+
+    baseline = load_model(args.model).eval()
+    baseline_f1 = entity_f1(baseline, tokenized_test, LABEL_LIST)["f1"]
+    rows = []
+    print(f"\n{'package':<36} {'max |Δlogit|':>13} {'argmax agree':>13} {'entity F1':>10} {'F1 drop':>8}")
+    print(f"{'fp32 (PyTorch)':<36} {0.0:>13.2e} {1.0:>13.2%} {baseline_f1:>10.4f} {0.0:>8.4f}")
+    for path in packages:
+        name = os.path.basename(path)
+        try:
+            model = load_package_weights(load_model(args.model).eval(), path)
+        except Exception as e:
+            print(f"{name:<36} ❌ could not read its weights: {e}")
+            rows.append({"package": path, "error": str(e), "passed": False})
+            continue
+        worst, agreement = compare_logits(baseline, model, tokenized_test)
+        f1 = entity_f1(model, tokenized_test, LABEL_LIST)["f1"]
+        row = {
+            "package": path,
+            "max_logit_difference": worst,
+            "argmax_agreement": round(agreement, 5),
+            "entity_f1": round(f1, 4),
+            "f1_drop": round(baseline_f1 - f1, 4),
+        }
+        row["passed"] = row["f1_drop"] <= args.max_f1_drop
+        rows.append(row)
+        print(f"{name:<36} {worst:>13.2e} {agreement:>13.2%} {f1:>10.4f} {row['f1_drop']:>8.4f}"
+              f"{'' if row['passed'] else '  ❌'}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.report)), exist_ok=True)
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump({"model": args.model, "baseline_f1": round(baseline_f1, 4), "max_f1_drop": args.max_f1_drop,
+                   "packages": rows}, f, indent=2)
+    print(f"\nReport written to {args.report}")
+    failed = [os.path.basename(row["package"]) for row in rows if not row["passed"]]
+    if failed:
+        print(f"❌ Entity F1 dropped more than {args.max_f1_drop} (or weights were unreadable) for {', '.join(failed)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
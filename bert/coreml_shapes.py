@@ -0,0 +1,108 @@
+from collections import Counter
+from itertools import combinations
+
+import numpy as np
+
+# Enumerated sequence lengths for the Core ML export, chosen from the token
+# lengths of real training queries, and the padding/bucketing helpers callers
+# use to feed a model exported with them. No coremltools import, so apps and
+# tests can use these anywhere.
+
+CANDIDATE_LENGTHS = (8, 16, 32, 64, 128, 256, 512)
+# Key in the .mlpackage user-defined metadata listing the enumerated lengths
+METADATA_KEY = "sequence_lengths"
+
+
+def token_length_histogram(lengths):
+    """Counter of token lengths (including [CLS]/[SEP]), sorted by length."""
+    return Counter(sorted(lengths))
+
+
+def padding_cost(histogram, buckets):
+    """Padded positions added when every length is padded to its bucket (longer ones are truncated)."""
+    return sum(count * (bucket_length(length, buckets) - min(length, buckets[-1]))
+               for length, count in histogram.items())
+
+
+def choose_lengths(histogram, candidates=CANDIDATE_LENGTHS, max_shapes=4, coverage=0.999, max_length=512):
+    """
+    Pick up to `max_shapes` enumerated lengths from `candidates`.
+
+    The largest is the smallest candidate that holds `coverage` of the
+    queries without truncation; the rest are the subset of smaller
+    candidates that adds the least padding over the histogram.
+    """
+    total = sum(histogram.values())
+    if not total:
+        raise ValueError("Cannot choose sequence lengths from an empty histogram")
+    candidates = sorted(c for c in candidates if c <= max_length)
+    covered, target = 0, None
+    for length, count in sorted(histogram.items()):
+        covered += count
+        if covered / total >= coverage:
+            target = length
+            break
+    top = next((c for c in candidates if c >= target), candidates[-1])
+    smaller = [c for c in candidates if c < top]
+    best = [top]
+    best_cost = padding_cost(histogram, best)
+    for size in range(1, min(max_shapes - 1, len(smaller)) + 1):
+        for subset in combinations(smaller, size):
+            buckets = list(subset) + [top]
+            cost = padding_cost(histogram, buckets)
+            if cost < best_cost:
+                best, best_cost = buckets, cost
+    return best
+
+
+def bucket_length(length, buckets):
+    """Smallest enumerated length that holds `length` tokens, or the largest one (truncating)."""
+    return next((b for b in sorted(buckets) if b >= length), max(buckets))
+
+
+def pad_to_bucket(input_ids, buckets, pad_token_id=0):
+    """
+    int32 `input_ids` and `attention_mask` of shape (1, bucket) for one tokenized query.
+
+    Queries longer than the largest bucket are truncated, keeping the final
+    [SEP] token.
+    """
+    input_ids = list(input_ids)
+    length = bucket_length(len(input_ids), buckets)
+    if len(input_ids) > length:
+        input_ids = input_ids[:length - 1] + input_ids[-1:]
+    ids = np.full((1, length), pad_token_id, dtype=np.int32)
+    mask = np.zeros((1, length), dtype=np.int32)
+    ids[0, :len(input_ids)] = input_ids
+    mask[0, :len(input_ids)] = 1
+    return {"input_ids": ids, "attention_mask": mask}
+
+
+def group_by_bucket(lengths, buckets):
+    """Map each enumerated length to the indices of the queries that pad to it."""
+    groups = {}
+    for index, length in enumerate(lengths):
+        groups.setdefault(bucket_length(length, buckets), []).append(index)
+    return groups
+
+
+def model_lengths(mlmodel):
+    """Enumerated lengths recorded by export_coreml.py, or None for a flexible-shape model."""
+    value = mlmodel.user_defined_metadata.get(METADATA_KEY)
+    return [int(length) for length in value.split(",")] if value else None
+
+
+def describe(histogram, buckets):
+    total = sum(histogram.values())
+    lengths = sorted(histogram.elements())
+    real = sum(min(length, buckets[-1]) * count for length, count in histogram.items())
+    return {
+        "queries": total,
+        "p50_length": lengths[len(lengths) // 2],
+        "p99_length": lengths[min(len(lengths) - 1, int(len(lengths) * 0.99))],
+        "max_length": lengths[-1],
+        "lengths": buckets,
+        "truncated": sum(count for length, count in histogram.items() if length > buckets[-1]) / total,
+        "padding_ratio": padding_cost(histogram, buckets) / (padding_cost(histogram, buckets) + real),
+        "queries_per_length": {b: len(g) for b, g in sorted(group_by_bucket(lengths, buckets).items())},
+    }
@@ -0,0 +1,109 @@
+import numpy as np
+
+# BIO decoding of token-classifier logits into entities for a whole batch at
+# once, with NumPy. Entity text is sliced out of the original query using the
+# fast tokenizer's offset mapping, so it always matches what the user said.
+#
+#   encoding = tokenizer(texts, padding=True, return_offsets_mapping=True, return_tensors="np")
+#   logits = model(input_ids=..., attention_mask=...).logits
+#   entities = decode_batch(texts, logits, word_id_matrix(encoding), encoding["offset_mapping"], id2label)
+#
+# Each word takes the label and confidence of its first sub-token (the one
+# trained on) and spans to the end of its last sub-token. An I- tag that does
+# not continue an entity of the same type starts a new one, as in
+# evaluation.bio_entities.
+
+
+def word_id_matrix(encoding, rows=None):
+    """(batch, tokens) word indices of a fast-tokenizer batch encoding, -1 for special and padding tokens."""
+    rows = range(len(encoding["input_ids"])) if rows is None else rows
+    length = max((len(encoding["input_ids"][i]) for i in rows), default=0)
+    word_ids = np.full((len(rows), length), -1, dtype=np.int64)
+    for row, i in enumerate(rows):
+        ids = encoding.word_ids(i)
+        word_ids[row, :len(ids)] = [-1 if w is None else w for w in ids]
+    return word_ids
+
+
+def label_codes(id2label):
+    """Per label id: 0 for O, 1 for B-, 2 for I-, and an entity type index; plus the type names."""
+    types = sorted({label.partition("-")[2] for label in id2label.values() if label[:2] in ("B-", "I-")})
+    size = max(int(i) for i in id2label) + 1
+    prefixes = np.zeros(size, dtype=np.int8)
+    type_ids = np.full(size, -1, dtype=np.int64)
+    for i, label in id2label.items():
+        prefix, _, entity_type = label.partition("-")
+        if prefix in ("B", "I") and entity_type:
+            prefixes[int(i)] = 1 if prefix == "B" else 2
+            type_ids[int(i)] = types.index(entity_type)
+    return prefixes, type_ids, types
+
+
+def softmax_confidence(logits):
+    """(argmax label ids, their softmax probabilities) over the last axis."""
+    logits = np.asarray(logits, dtype=np.float32)
+    shifted = logits - logits.max(-1, keepdims=True)
+    probabilities = np.exp(shifted)
+    probabilities /= probabilities.sum(-1, keepdims=True)
+    label_ids = probabilities.argmax(-1)
+    return label_ids, np.take_along_axis(probabilities, label_ids[..., None], -1)[..., 0]
+
+
+def decode_batch(texts, logits, word_ids, offsets, id2label, codes=None):
+    """
+    Entities for every text of a batch: [[{"entity", "label", "start", "end", "score"}]].
+
+    `logits` is (batch, tokens, labels), `word_ids` (batch, tokens) with -1
+    for tokens outside any word and `offsets` (batch, tokens, 2) character
+    offsets. `score` is the mean confidence of the entity's words. Pass
+    `codes=label_codes(id2label)` to skip rebuilding the label tables.
+    """
+    prefixes, type_ids, types = codes or label_codes({int(k): v for k, v in id2label.items()})
+    logits = np.asarray(logits)
+    # Logits may be padded further, or (from a truncating runtime) be shorter
+    length = min(np.shape(word_ids)[1], logits.shape[1])
+    word_ids = np.asarray(word_ids)[:, :length]
+    offsets = np.asarray(offsets)[:, :length]
+    label_ids, confidence = softmax_confidence(logits[:, :length])
+
+    # First and last sub-token of every word, in reading order
+    in_word = word_ids >= 0
+    previous = np.pad(word_ids[:, :-1], ((0, 0), (1, 0)), constant_values=-1)
+    following = np.pad(word_ids[:, 1:], ((0, 0), (0, 1)), constant_values=-1)
+    rows, first = np.nonzero(in_word & (word_ids != previous))
+    last = np.nonzero(in_word & (word_ids != following))[1]
+    word_labels = label_ids[rows, first]
+    word_prefix = prefixes[word_labels]
+    word_type = type_ids[word_labels]
+
+    # An entity word continues the previous word's entity when it is I- of
+    # the same type and the previous word (in the same text) is in an entity
+    is_entity = word_prefix > 0
+    continues = np.zeros_like(is_entity)
+    continues[1:] = ((word_prefix[1:] == 2) & is_entity[:-1] & (word_type[1:] == word_type[:-1])
+                     & (rows[1:] == rows[:-1]))
+    starts = is_entity & ~continues
+    entity_of_word = np.cumsum(starts) - 1
+
+    entity_words = np.nonzero(is_entity)[0]
+    members = entity_of_word[entity_words]
+    count = int(starts.sum())
+    first_words = np.nonzero(starts)[0]
+    word_scores = confidence[rows, first][entity_words]
+    scores = np.bincount(members, weights=word_scores, minlength=count) / np.bincount(members, minlength=count)
+    char_starts = offsets[rows[first_words], first[first_words], 0]
+    char_ends = np.zeros(count, dtype=np.int64)
+    np.maximum.at(char_ends, members, offsets[rows[entity_words], last[entity_words], 1])
+
+    entities = [[] for _ in texts]
+    # Plain Python values from here: NumPy scalars are slow to handle one by one
+    for row, entity_type, start, end, score in zip(rows[first_words].tolist(), word_type[first_words].tolist(),
+                                                   char_starts.tolist(), char_ends.tolist(), scores.round(4).tolist()):
+        entities[row].append({
+            "entity": texts[row][start:end],
+            "label": types[entity_type],
+            "start": start,
+            "end": end,
+            "score": score,
+        })
+    return entities
@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import time
+
+import torch
+import torch.nn.functional as F
+
+from batching import TokenBudgetTrainer
+from evaluation import cpu_latency, entity_f1, model_size_bytes
+
+# Knowledge distillation of the fine-tuned ./model into shallower or narrower
+# DistilBERT students for on-device use. Students learn from the teacher's
+# temperature-softened token distributions plus the gold BIO labels, and the
+# report compares CPU latency, size and entity F1 of each student with the
+# teacher. Data, epochs and the token budget come from a train.py config.
+#
+#   python distill.py configs/finetune.json --teacher ./model --students 2 3 4 2x384
+#
+# A student spec is "<layers>" (teacher width, initialised from evenly spaced
+# teacher layers) or "<layers>x<dim>" (narrower, randomly initialised).
+
+
+class DistillationTrainer(TokenBudgetTrainer):
+    """
+    TokenBudgetTrainer whose loss mixes the hard-label loss with a KL term
+    towards the teacher's softened logits on every non-padding token:
+
+        alpha * CE(student, labels) + (1 - alpha) * T^2 * KL(teacher_T || student_T)
+    """
+
+    def __init__(self, *args, teacher, temperature=2.0, alpha=0.5, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.teacher = teacher.eval()
+        for parameter in self.teacher.parameters():
+            parameter.requires_grad_(False)
+        self.temperature = temperature
+        self.alpha = alpha
+        # The loss is a per-batch mean; let Trainer scale it for gradient accumulation
+        self.model_accepts_loss_kwargs = False
+
+    def compute_loss(self, model, inputs, return_outputs=False, num_items_in_batch=None):
+        outputs = model(**inputs)
+        with torch.no_grad():
+            teacher_logits = self.teacher(
+                input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"]
+            ).logits
+        real = inputs["attention_mask"].bool()
+        student_log_probs = F.log_softmax(outputs.logits[real].float() / self.temperature, dim=-1)
+        teacher_log_probs = F.log_softmax(teacher_logits[real].float() / self.temperature, dim=-1)
+        soft_loss = F.kl_div(student_log_probs, teacher_log_probs, log_target=True, reduction="batchmean")
+        loss = self.alpha * outputs.loss + (1 - self.alpha) * self.temperature ** 2 * soft_loss
+        return (loss, outputs) if return_outputs else loss
+
+
+def parse_student_spec(spec):
+    layers, _, dim = spec.partition("x")
+    return int(layers), int(dim) if dim else None
+
+
+def teacher_layer_map(teacher_layers, student_layers):
+    """Evenly spaced teacher layers to initialise a student from, always ending with the last one."""
+    if student_layers == 1:
+        return [teacher_layers - 1]
+    return [round(i * (teacher_layers - 1) / (student_layers - 1)) for i in range(student_layers)]
+
+
+def make_student(teacher, layers, dim=None):
+    """
+    A DistilBERT token classifier with `layers` blocks.
+
+    At the teacher's width it starts from the teacher's embeddings, an evenly
+    spaced subset of its blocks and its classifier; a narrower `dim` (with a
+    4x feed-forward and 64-dimensional heads) starts from scratch.
+    """
+    from transformers import AutoModelForTokenClassification
+
+    config = teacher.config.to_dict()
+    config["n_layers"] = layers
+    if dim and dim != teacher.config.dim:
+        config.update(dim=dim, hidden_dim=4 * dim, n_heads=max(1, dim // 64))
+    student_config = type(teacher.config).from_dict(config)
+    student = AutoModelForTokenClassification.from_config(student_config)
+    if student_config.dim != teacher.config.dim:
+        return student
+
+    teacher_state = teacher.state_dict()
+    layer_map = teacher_layer_map(teacher.config.n_layers, layers)
+    state = {}
+    for name in student.state_dict():
+        source = name
+        if ".transformer.layer." in name:
+            prefix, rest = name.split(".transformer.layer.", 1)
+            index, suffix = rest.split(".", 1)
+            source = f"{prefix}.transformer.layer.{layer_map[int(index)]}.{suffix}"
+        state[name] = teacher_state[source]
+    student.load_state_dict(state)
+    return student
+
+
+def evaluate_model(name, model, model_dir, tokenizer, tokenized_test, label_list):
+    model.eval()
+    scores = entity_f1(model, tokenized_test, label_list)
+    latency = cpu_latency(model, tokenizer)
+    return {
+        "model": name,
+        "layers": model.config.n_layers,
+        "dim": model.config.dim,
+        "parameters": sum(p.numel() for p in model.parameters()),
+        "size_mb": round(model_size_bytes(model_dir) / 1e6, 2),
+        "p50_ms": round(latency["p50_ms"], 2),
+        "p95_ms": round(latency["p95_ms"], 2),
+        "entity_f1": round(scores["f1"], 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distil the fine-tuned MusicNER model into smaller students.")
+    parser.add_argument("config", help="train.py JSON config supplying data, epochs and the token budget")
+    parser.add_argument("--teacher", type=str, default="./model", help="Fine-tuned teacher directory (default: ./model)")
+    parser.add_argument("--students", nargs="+", default=["2", "3", "4"],
+                        help="Student specs: <layers> or <layers>x<dim> (default: 2 3 4)")
+    parser.add_argument("--output-dir", type=str, default="./students", help="Where students and the report go")
+    parser.add_argument("--temperature", type=float, default=2.0, help="Softmax temperature (default: 2.0)")
+    parser.add_argument("--alpha", type=float, default=0.5, help="Weight of the hard-label loss (default: 0.5)")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE",
+                        help="Override a config value, as in train.py")
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer, AutoModelForTokenClassification, TrainingArguments, \
+        DataCollatorForTokenClassification
+    from bio_data import LABEL_LIST, list_dataset_dirs, load_bio_splits
+    from tokenized_data import tokenize_dataset
+    from train import configure_threads, load_config
+
+    config = load_config(args.config, args.overrides)
+    configure_threads(config)
+
+    tokenizer = AutoTokenizer.from_pretrained(args.teacher)
+    teacher = AutoModelForTokenClassification.from_pretrained(args.teacher)
+    dataset_dirs = list(config["dataset_dirs"]) + list_dataset_dirs(config["base_dataset_dirs"])
+    train_dataset, test_dataset = load_bio_splits(dataset_dirs, LABEL_LIST)
+    if not train_dataset or not test_dataset:
+        print("❌ Error: No training or testing data was loaded. Please check the dataset paths. Exiting.")
+        return
+    tokenized_train = tokenize_dataset(train_dataset, tokenizer)
+    tokenized_test = tokenize_dataset(test_dataset, tokenizer)
+
+    rows = [evaluate_model("teacher", teacher, args.teacher, tokenizer, tokenized_test, LABEL_LIST)]
+    for spec in args.students:
+        layers, dim = parse_student_spec(spec)
+        student_dir = os.path.join(args.output_dir, f"student-{spec}")
+        print(f"\n=== Distilling student {spec} into {student_dir}")
+        student = make_student(teacher, layers, dim)
+        training_args = TrainingArguments(
+            output_dir=os.path.join(student_dir, "checkpoints"),
+            eval_strategy="epoch",
+            save_strategy="no",
+            learning_rate=config["learning_rate"],
+            per_device_eval_batch_size=config["eval_batch_size"],
+            gradient_accumulation_steps=config["gradient_accumulation_steps"],
+            num_train_epochs=config["epochs"],
+            weight_decay=config["weight_decay"],
+            logging_steps=config["logging_steps"],
+            seed=config["seed"],
+            use_cpu=True,
+            bf16=config["bf16"],
+            dataloader_num_workers=config["dataloader_num_workers"],
+            report_to=[],
+        )
+        trainer = DistillationTrainer(
+            model=student,
+            args=training_args,
+            train_dataset=tokenized_train,
+            eval_dataset=tokenized_test,
+            data_collator=DataCollatorForTokenClassification(tokenizer),
+            max_tokens=config["max_tokens"],
+            teacher=teacher,
+            temperature=args.temperature,
+            alpha=args.alpha,
+        )
+        train_start = time.perf_counter()
+        trainer.train()
+        train_seconds = time.perf_counter() - train_start
+        trainer.save_model(student_dir)
+        tokenizer.save_pretrained(student_dir)
+        row = evaluate_model(f"student-{spec}", student, student_dir, tokenizer, tokenized_test, LABEL_LIST)
+        row["train_seconds"] = round(train_seconds, 1)
+        rows.append(row)
+
+    teacher_row = rows[0]
+    print(f"\n{'model':<18} {'layers':>6} {'dim':>5} {'params':>12} {'size MB':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'speedup':>8} {'entity F1':>10}")
+    for row in rows:
+        row["speedup"] = round(teacher_row["p50_ms"] / row["p50_ms"], 2)
+        print(f"{row['model']:<18} {row['layers']:>6} {row['dim']:>5} {row['parameters']:>12,} {row['size_mb']:>9.2f} "
+              f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['speedup']:>7.2f}x {row['entity_f1']:>10.4f}")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    report_path = os.path.join(args.output_dir, "distill_report.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "config": config,
+            "teacher": args.teacher,
+            "temperature": args.temperature,
+            "alpha": args.alpha,
+            "threads": torch.get_num_threads(),
+            "models": rows,
+        }, f, indent=2)
+    print(f"\nReport written to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Measures data-parallel scaling of train.py on one host: trains the same
+# config with 1, 2, ... N local gloo ranks under torchrun and reports
+# throughput and scaling efficiency (throughput_N / (N * throughput_1)).
+#
+#   python distributed.py configs/finetune.json --ranks 1 2 4 8 --epochs 1
+
+
+def run_ranks(config_path, ranks, epochs, output_dir, extra_sets):
+    run_dir = os.path.join(output_dir, f"ranks-{ranks}")
+    command = [
+        sys.executable, "-m", "torch.distributed.run",
+        "--standalone", "--nproc_per_node", str(ranks),
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "train.py"), config_path, "--no-resume",
+        "--set", f"results_dir={run_dir}",
+        "--set", f"output_model_dir={os.path.join(run_dir, 'model')}",
+        "--set", f"epochs={epochs}",
+        "--set", "save_total_limit=1",
+    ]
+    for extra in extra_sets:
+        command += ["--set", extra]
+    print(f"\n=== {ranks} rank(s): {' '.join(command)}")
+    subprocess.run(command, check=True)
+    with open(os.path.join(run_dir, "run_report.json"), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report train.py scaling efficiency from 1 to N local ranks.")
+    parser.add_argument("config", help="Path to a JSON training config")
+    parser.add_argument("--ranks", type=int, nargs="+", default=[1, 2, 4], help="Rank counts to run (default: 1 2 4)")
+    parser.add_argument("--epochs", type=float, default=1, help="Epochs per run (default: 1)")
+    parser.add_argument("--output-dir", type=str, default="./results_scaling", help="Where runs and the report go")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra config override passed to every run")
+    args = parser.parse_args()
+
+    ranks = sorted(set(args.ranks))
+    if ranks[0] != 1:
+        ranks.insert(0, 1)
+    reports = {n: run_ranks(args.config, n, args.epochs, args.output_dir, args.overrides) for n in ranks}
+
+    base = reports[1]["train_samples_per_second"]
+    rows = []
+    print(f"\n{'ranks':>6} {'train s':>10} {'samples/s':>12} {'speedup':>9} {'efficiency':>11}")
+    for n in ranks:
+        report = reports[n]
+        throughput = report["train_samples_per_second"]
+        row = {
+            "ranks": n,
+            "train_seconds": report["train_seconds"],
+            "train_samples_per_second": throughput,
+            "speedup": round(throughput / base, 3),
+            "efficiency": round(throughput / (n * base), 3),
+        }
+        rows.append(row)
+        print(f"{n:>6} {row['train_seconds']:>10.1f} {throughput:>12.1f} {row['speedup']:>8.2f}x "
+              f"{row['efficiency']:>10.0%}")
+
+    report_path = os.path.join(args.output_dir, "scaling_report.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({"config": args.config, "epochs": args.epochs, "runs": rows}, f, indent=2)
+    print(f"\nReport written to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+import argparse
+import json
+import os
+import statistics
+import time
+from dataclasses import dataclass
+
+import torch
+import torch.nn.functional as F
+from torch import nn
+
+from batching import TokenBudgetTrainer
+
+# Early-exit (layer-adaptive) inference for the fine-tuned DistilBERT token
+# classifier. A small classifier head sits after each intermediate layer; at
+# inference a query leaves the network at the first head whose least
+# confident token passes the threshold, so easy queries ("play adele") skip
+# the upper layers. In a batch, finished queries are dropped and the rest go on.
+#
+# The heads are trained by self-distillation from the final head with the
+# backbone frozen (the full-depth model is unchanged), or with --joint,
+# together with the backbone on the gold labels at every depth.
+#
+#   python early_exit.py configs/finetune.json --model ./model --output-dir ./model_early_exit
+#   python early_exit.py configs/finetune.json --model ./model_early_exit --evaluate-only --thresholds 0.9 0.99
+#
+# The report gives, per threshold and test set, the average layers executed,
+# the batch-size-1 speedup over the plain model and entity F1 (recall for the
+# seen/rare_unseen splits). With --joint, F1 changes are also reported against
+# the original model, and the saved threshold is picked against it.
+
+EXIT_WEIGHTS = "early_exit.safetensors"
+EXIT_CONFIG = "early_exit.json"
+
+
+@dataclass
+class EarlyExitOutput:
+    logits: torch.Tensor
+    layers: torch.Tensor  # (batch,) transformer layers each query ran through
+    loss: torch.Tensor = None
+
+
+class EarlyExitTokenClassifier(nn.Module):
+    """
+    DistilBertForTokenClassification with exit heads after the layers in
+    `exit_layers` (1-based; the model's own classifier is the exit after the
+    last layer). With `threshold` set, forward() stops each query at the first
+    head where every real token's softmax confidence is at least `threshold`.
+    """
+
+    def __init__(self, model, exit_layers=None, threshold=None):
+        super().__init__()
+        self.model = model
+        self.config = model.config
+        layers = model.config.n_layers
+        self.exit_layers = sorted(set(exit_layers or range(1, layers)) - {layers})
+        self.threshold = threshold
+        # Start every head from the final classifier; the hidden size is the same at every depth
+        self.exits = nn.ModuleDict()
+        for layer in self.exit_layers:
+            head = nn.Linear(model.config.dim, model.config.num_labels)
+            head.load_state_dict(model.classifier.state_dict())
+            self.exits[str(layer)] = head
+
+    def _embed(self, input_ids, attention_mask):
+        from transformers.masking_utils import create_bidirectional_mask
+
+        hidden = self.model.distilbert.embeddings(input_ids)
+        mask = create_bidirectional_mask(config=self.config, inputs_embeds=hidden, attention_mask=attention_mask)
+        return hidden, mask
+
+    def all_exit_logits(self, input_ids, attention_mask=None):
+        """[(layers, logits)] for every exit head and the final classifier, running the full depth."""
+        hidden, mask = self._embed(input_ids, attention_mask)
+        outputs = []
+        for layer, block in enumerate(self.model.distilbert.transformer.layer, 1):
+            hidden = block(hidden, mask)
+            if str(layer) in self.exits:
+                outputs.append((layer, self.exits[str(layer)](self.model.dropout(hidden))))
+        outputs.append((self.config.n_layers, self.model.classifier(self.model.dropout(hidden))))
+        return outputs
+
+    def forward(self, input_ids, attention_mask=None, threshold=None, **kwargs):
+        threshold = self.threshold if threshold is None else threshold
+        batch_size, length = input_ids.shape
+        depth = self.config.n_layers
+        if threshold is None:
+            logits = self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+            return EarlyExitOutput(logits, torch.full((batch_size,), depth))
+
+        real = (attention_mask if attention_mask is not None else torch.ones_like(input_ids)).bool()
+        hidden, mask = self._embed(input_ids, attention_mask)
+        logits = hidden.new_zeros(batch_size, length, self.config.num_labels)
+        layers = torch.full((batch_size,), depth)
+        active = torch.arange(batch_size)
+        for layer, block in enumerate(self.model.distilbert.transformer.layer, 1):
+            hidden = block(hidden, mask)
+            if layer == depth or str(layer) not in self.exits:
+                continue
+            step = self.exits[str(layer)](hidden)
+            confidence = step.softmax(-1).amax(-1).masked_fill(~real, 1.0).amin(-1)
+            done = confidence >= threshold
+            if not done.any():
+                continue
+            logits[active[done]] = step[done]
+            layers[active[done]] = layer
+            keep = ~done
+            if not keep.any():
+                return EarlyExitOutput(logits, layers)
+            active, hidden, real = active[keep], hidden[keep], real[keep]
+            mask = mask[keep] if mask is not None else None
+        logits[active] = self.model.classifier(hidden)
+        return EarlyExitOutput(logits, layers)
+
+
+class EarlyExitTrainer(TokenBudgetTrainer):
+    """
+    Trains the exit heads on every non-padding token.
+
+    Self-distillation (default): each head learns
+        alpha * CE(head, labels) + (1 - alpha) * T^2 * KL(final_T || head_T)
+    from the frozen final head. Joint: the backbone trains too, on the
+    depth-weighted mean of every head's cross-entropy (the final head included).
+    """
+
+    def __init__(self, *args, joint=False, temperature=2.0, alpha=0.5, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.joint = joint
+        self.temperature = temperature
+        self.alpha = alpha
+        self.model_accepts_loss_kwargs = False
+
+    def compute_loss(self, model, inputs, return_outputs=False, num_items_in_batch=None):
+        outputs = model.all_exit_logits(inputs["input_ids"], inputs["attention_mask"])
+        labels = inputs["labels"]
+        if self.joint:
+            weights = torch.tensor([layer for layer, _ in outputs], dtype=torch.float)
+            losses = torch.stack([F.cross_entropy(logits.flatten(0, 1).float(), labels.flatten(), ignore_index=-100)
+                                  for _, logits in outputs])
+            loss = (weights * losses).sum() / weights.sum()
+        else:
+            real = inputs["attention_mask"].bool()
+            final_log_probs = F.log_softmax(outputs[-1][1][real].detach().float() / self.temperature, dim=-1)
+            losses = []
+            for _, logits in outputs[:-1]:
+                hard_loss = F.cross_entropy(logits.flatten(0, 1).float(), labels.flatten(), ignore_index=-100)
+                log_probs = F.log_softmax(logits[real].float() / self.temperature, dim=-1)
+                soft_loss = F.kl_div(log_probs, final_log_probs, log_target=True, reduction="batchmean")
+                losses.append(self.alpha * hard_loss + (1 - self.alpha) * self.temperature ** 2 * soft_loss)
+            loss = torch.stack(losses).mean()
+        if return_outputs:
+            return loss, EarlyExitOutput(outputs[-1][1], torch.full((labels.shape[0],), outputs[-1][0]), loss)
+        return loss
+
+
+def save_early_exit(model, tokenizer, output_dir):
+    """The (possibly retrained) base model plus the exit heads and their config."""
+    from safetensors.torch import save_file
+
+    model.model.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    save_file({name: tensor.contiguous() for name, tensor in model.exits.state_dict().items()},
+              os.path.join(output_dir, EXIT_WEIGHTS))
+    with open(os.path.join(output_dir, EXIT_CONFIG), 'w', encoding='utf-8') as f:
+        json.dump({"exit_layers": model.exit_layers, "threshold": model.threshold}, f, indent=2)
+
+
+def load_early_exit(model_dir, threshold=None):
+    """An EarlyExitTokenClassifier saved by save_early_exit; `threshold` overrides the saved one."""
+    from safetensors.torch import load_file
+    from prune import load_model
+
+    with open(os.path.join(model_dir, EXIT_CONFIG), encoding='utf-8') as f:
+        exit_config = json.load(f)
+    model = EarlyExitTokenClassifier(load_model(model_dir), exit_config["exit_layers"],
+                                     exit_config["threshold"] if threshold is None else threshold)
+    model.exits.load_state_dict(load_file(os.path.join(model_dir, EXIT_WEIGHTS)))
+    return model.eval()
+
+
+def query_timings(model, tokenized_dataset, threshold, limit):
+    """Batch-size-1 milliseconds per query over the first `limit` test examples (after a short warm-up)."""
+    rows = tokenized_dataset["input_ids"][:limit]
+    encoded = [torch.tensor([ids]) for ids in rows]
+    timings = []
+    with torch.inference_mode():
+        for i, input_ids in enumerate(encoded[:5] + encoded):
+            attention_mask = torch.ones_like(input_ids)
+            start = time.perf_counter()
+            model(input_ids=input_ids, attention_mask=attention_mask, threshold=threshold)
+            if i >= 5:
+                timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def evaluate_threshold(model, splits, label_list, threshold, timing_queries, batch_size=32):
+    """Average layers, entity scores per test set and batch-size-1 latency at one threshold (None = full depth)."""
+    from evaluation import entity_f1
+
+    row = {"threshold": threshold}
+    for split, dataset in splits.items():
+        layers = []
+
+        def predict(model, batch):
+            with torch.inference_mode():
+                outputs = model(input_ids=batch["input_ids"], attention_mask=batch["attention_mask"],
+                                threshold=threshold)
+            layers.extend(outputs.layers.tolist())
+            return outputs.logits
+
+        scores = entity_f1(model, dataset, label_list, batch_size, predict)
+        prefix = "" if split == "test" else f"{split}_"
+        row[f"{prefix}average_layers"] = round(statistics.fmean(layers), 3)
+        if split == "test":
+            row["entity_f1"] = round(scores["f1"], 4)
+        row[f"{prefix}recall"] = round(scores["recall"], 4)
+    timings = query_timings(model, splits["test"], threshold, timing_queries)
+    row["mean_ms"] = round(statistics.fmean(timings), 3)
+    row["p50_ms"] = round(statistics.median(timings), 3)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and evaluate early-exit heads for the MusicNER model.")
+    parser.add_argument("config", help="train.py JSON config supplying data, epochs and the token budget")
+    parser.add_argument("--model", type=str, default="./model", help="Fine-tuned model, or a saved early-exit model")
+    parser.add_argument("--output-dir", type=str, default="./model_early_exit", help="Where the model and report go")
+    parser.add_argument("--exit-layers", type=int, nargs="+", default=None,
+                        help="Layers (1-based) to put exit heads after (default: all but the last)")
+    parser.add_argument("--joint", action="store_true",
+                        help="Train the backbone with the heads instead of self-distilling into frozen layers")
+    parser.add_argument("--temperature", type=float, default=2.0, help="Self-distillation temperature (default: 2.0)")
+    parser.add_argument("--alpha", type=float, default=0.5, help="Weight of the hard-label loss (default: 0.5)")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.8, 0.9, 0.95, 0.99],
+                        help="Exit confidence thresholds to evaluate (default: 0.8 0.9 0.95 0.99)")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="Threshold saved with the model (default: the lowest evaluated one within --max-f1-drop)")
+    parser.add_argument("--max-f1-drop", type=float, default=0.005,
+                        help="F1 loss tolerated when picking the saved threshold (default: 0.005)")
+    parser.add_argument("--timing-queries", type=int, default=500, help="Test queries timed at batch size 1 (default: 500)")
+    parser.add_argument("--evaluate-only", action="store_true", help="Evaluate a saved early-exit --model without training")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE",
+                        help="Override a config value, as in train.py")
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer, TrainingArguments, DataCollatorForTokenClassification
+    from benchmark_ner import load_test_splits
+    from bio_data import LABEL_LIST, list_dataset_dirs, load_bio_splits
+    from prune import load_model
+    from tokenized_data import tokenize_dataset
+    from train import configure_threads, load_config
+
+    config = load_config(args.config, args.overrides)
+    configure_threads(config)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    splits = load_test_splits(args.config, tokenizer)
+    if "test" not in splits:
+        print("❌ Error: No testing data was loaded. Please check the dataset paths. Exiting.")
+        return
+
+    original = None
+    if args.evaluate_only:
+        model = load_early_exit(args.model)
+    else:
+        dataset_dirs = list(config["dataset_dirs"]) + list_dataset_dirs(config["base_dataset_dirs"])
+        train_dataset, _ = load_bio_splits(dataset_dirs, LABEL_LIST)
+        if not train_dataset:
+            print("❌ Error: No training data was loaded. Please check the dataset paths. Exiting.")
+            return
+        model = EarlyExitTokenClassifier(load_model(args.model), args.exit_layers)
+        if args.joint:
+            # Joint training changes the backbone, so score the original model (full depth, before training) first
+            model.eval()
+            original = evaluate_threshold(model, splits, LABEL_LIST, None, args.timing_queries)
+            print(f"Original model: entity F1 {original['entity_f1']:.4f}, {original['mean_ms']:.2f} ms")
+        else:
+            for parameter in model.model.parameters():
+                parameter.requires_grad_(False)
+        training_args = TrainingArguments(
+            output_dir=os.path.join(args.output_dir, "checkpoints"),
+            eval_strategy="no",
+            save_strategy="no",
+            learning_rate=config["learning_rate"],
+            gradient_accumulation_steps=config["gradient_accumulation_steps"],
+            num_train_epochs=config["epochs"],
+            weight_decay=config["weight_decay"],
+            logging_steps=config["logging_steps"],
+            seed=config["seed"],
+            use_cpu=True,
+            bf16=config["bf16"],
+            dataloader_num_workers=config["dataloader_num_workers"],
+            remove_unused_columns=False,
+            report_to=[],
+        )
+        trainer = EarlyExitTrainer(
+            model=model,
+            args=training_args,
+            train_dataset=tokenize_dataset(train_dataset, tokenizer),
+            data_collator=DataCollatorForTokenClassification(tokenizer),
+            max_tokens=config["max_tokens"],
+            joint=args.joint,
+            temperature=args.temperature,
+            alpha=args.alpha,
+        )
+        print(f"Training exit heads after layers {model.exit_layers} ({'joint' if args.joint else 'self-distillation'})")
+        trainer.train()
+        # Drop the mixed-precision forward wrapper Trainer installed, so timings are of the plain model
+        model = trainer.accelerator.unwrap_model(model, keep_fp32_wrapper=False)
+    model.eval()
+    # Evaluate every threshold explicitly, not one saved with the model
+    model.threshold = None
+
+    # The plain model (full depth, no exit checks) is the speed baseline; with
+    # --joint its F1 is the retrained backbone's, so ΔF1 is also given against the original model
+    rows = [evaluate_threshold(model, splits, LABEL_LIST, None, args.timing_queries)]
+    rows += [evaluate_threshold(model, splits, LABEL_LIST, t, args.timing_queries) for t in sorted(args.thresholds)]
+    full = rows[0]
+    print(f"\n{'threshold':>9} {'layers':>7} {'mean ms':>8} {'speedup':>8} {'entity F1':>10} {'ΔF1':>8} "
+          + (f"{'ΔF1 orig':>9} " if original else "") + f"{'seen R':>7} {'rare R':>7}")
+    for row in rows:
+        row["speedup"] = round(full["mean_ms"] / row["mean_ms"], 2)
+        row["f1_change"] = round(row["entity_f1"] - full["entity_f1"], 4)
+        if original:
+            row["f1_change_vs_original"] = round(row["entity_f1"] - original["entity_f1"], 4)
+        label = "full" if row["threshold"] is None else f"{row['threshold']:.3f}"
+        print(f"{label:>9} {row['average_layers']:>7.2f} {row['mean_ms']:>8.2f} {row['speedup']:>7.2f}x "
+              f"{row['entity_f1']:>10.4f} {row['f1_change']:>+8.4f} "
+              + (f"{row['f1_change_vs_original']:>+9.4f} " if original else "")
+              + f"{row.get('seen_recall', float('nan')):>7.4f} {row.get('rare_unseen_recall', float('nan')):>7.4f}")
+
+    if args.threshold is None:
+        # The F1 budget is spent against the original model when the backbone was retrained
+        change = "f1_change_vs_original" if original else "f1_change"
+        eligible = [row["threshold"] for row in rows[1:] if -row[change] <= args.max_f1_drop]
+        args.threshold = min(eligible) if eligible else None
+    model.threshold = args.threshold
+    os.makedirs(args.output_dir, exist_ok=True)
+    if not args.evaluate_only:
+        save_early_exit(model, tokenizer, args.output_dir)
+        print(f"\n✅ Early-exit model saved to {args.output_dir} (threshold {args.threshold})")
+    report_path = os.path.join(args.output_dir, "early_exit_report.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "config": config,
+            "model": args.model,
+            "exit_layers": model.exit_layers,
+            "training": None if args.evaluate_only else ("joint" if args.joint else "self-distillation"),
+            "threshold": args.threshold,
+            "threads": torch.get_num_threads(),
+            "test_examples": {name: len(dataset) for name, dataset in splits.items()},
+            "original": original,
+            "thresholds": rows,
+        }, f, indent=2)
+    print(f"Report written to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
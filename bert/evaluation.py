@@ -0,0 +1,142 @@
+import os
+import statistics
+import time
+
+import torch
+
+# Shared model evaluation for the compression and benchmarking scripts:
+# entity-level F1 over tokenized BIO datasets, CPU latency and throughput,
+# and model size.
+
+LATENCY_QUERIES = [
+    "play music by a new artist",
+    "play Bohemian Rhapsody by Queen",
+    "put on something from Taylor Swift's Midnights",
+    "shuffle the latest album by Kendrick Lamar",
+    "I want to hear Clair de Lune",
+    "play Hey Jude",
+]
+
+
+def bio_entities(tags):
+    """
+    Set of (type, start, end) entity spans in a sequence of BIO tag strings.
+
+    An I- tag that does not continue an entity of the same type starts a new
+    one, as conlleval does.
+    """
+    entities = set()
+    entity_type, start = None, None
+    for i, tag in enumerate(list(tags) + ["O"]):
+        prefix, _, label = tag.partition("-")
+        if entity_type is not None and (prefix != "I" or label != entity_type):
+            entities.add((entity_type, start, i))
+            entity_type = None
+        if prefix == "B" or (prefix == "I" and entity_type is None):
+            entity_type, start = label, i
+    return entities
+
+
+def entity_scores(true_sequences, predicted_sequences):
+    """Micro-averaged entity precision, recall and F1 over paired BIO tag sequences."""
+    true_count = predicted_count = correct = 0
+    for true_tags, predicted_tags in zip(true_sequences, predicted_sequences):
+        true_entities = bio_entities(true_tags)
+        predicted_entities = bio_entities(predicted_tags)
+        true_count += len(true_entities)
+        predicted_count += len(predicted_entities)
+        correct += len(true_entities & predicted_entities)
+    precision = correct / predicted_count if predicted_count else 0.0
+    recall = correct / true_count if true_count else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": precision, "recall": recall, "f1": f1}
+
+
+def predict_logits(model, batch):
+    with torch.inference_mode():
+        return model(input_ids=batch["input_ids"], attention_mask=batch["attention_mask"]).logits
+
+
+def word_tag_sequences(model, tokenized_dataset, label_list, batch_size=32, predict=predict_logits):
+    """
+    Gold and predicted word-level tags for a tokenized dataset.
+
+    Words are read at their first sub-token, i.e. where `labels` is not -100.
+    `predict(model, batch)` returns logits and lets other backends (ONNX,
+    TorchScript) be scored the same way.
+    """
+    true_sequences, predicted_sequences = [], []
+    for start in range(0, len(tokenized_dataset), batch_size):
+        rows = tokenized_dataset[start:start + batch_size]
+        length = max(len(ids) for ids in rows["input_ids"])
+        input_ids = torch.zeros(len(rows["input_ids"]), length, dtype=torch.long)
+        attention_mask = torch.zeros_like(input_ids)
+        for i, ids in enumerate(rows["input_ids"]):
+            input_ids[i, :len(ids)] = torch.tensor(ids)
+            attention_mask[i, :len(ids)] = 1
+        predictions = predict(model, {"input_ids": input_ids, "attention_mask": attention_mask}).argmax(-1)
+        for i, labels in enumerate(rows["labels"]):
+            positions = [j for j, label in enumerate(labels) if label != -100]
+            true_sequences.append([label_list[labels[j]] for j in positions])
+            predicted_sequences.append([label_list[int(predictions[i, j])] for j in positions])
+    return true_sequences, predicted_sequences
+
+
+def entity_f1(model, tokenized_dataset, label_list, batch_size=32, predict=predict_logits):
+    """Entity-level precision, recall and F1 of `model` on a tokenized BIO dataset."""
+    return entity_scores(*word_tag_sequences(model, tokenized_dataset, label_list, batch_size, predict))
+
+
+def cpu_latency(model, tokenizer, queries=LATENCY_QUERIES, runs=50, warmup=5):
+    """Single-query latency in milliseconds (p50, p95, p99, mean), as an on-device assistant sees it."""
+    encoded = [tokenizer(query, return_tensors="pt") for query in queries]
+    timings = []
+    with torch.inference_mode():
+        for i in range(warmup + runs):
+            inputs = encoded[i % len(encoded)]
+            start = time.perf_counter()
+            model(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"])
+            if i >= warmup:
+                timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "p99_ms": timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+        "mean_ms": statistics.fmean(timings),
+    }
+
+
+def cpu_throughput(model, tokenized_dataset, batch_size=32, repeats=3):
+    """Queries per second over length-sorted, padded batches of a tokenized dataset (best of `repeats`)."""
+    rows = sorted(tokenized_dataset["input_ids"], key=len)
+    batches = []
+    for start in range(0, len(rows), batch_size):
+        chunk = rows[start:start + batch_size]
+        input_ids = torch.zeros(len(chunk), len(chunk[-1]), dtype=torch.long)
+        attention_mask = torch.zeros_like(input_ids)
+        for i, ids in enumerate(chunk):
+            input_ids[i, :len(ids)] = torch.tensor(ids)
+            attention_mask[i, :len(ids)] = 1
+        batches.append((input_ids, attention_mask))
+    best = float("inf")
+    with torch.inference_mode():
+        model(input_ids=batches[0][0], attention_mask=batches[0][1])
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for input_ids, attention_mask in batches:
+                model(input_ids=input_ids, attention_mask=attention_mask)
+            best = min(best, time.perf_counter() - start)
+    return len(rows) / best
+
+
+def model_size_bytes(model_or_dir):
+    """Bytes of weights: files in a saved model directory, or tensors of an in-memory model."""
+    if isinstance(model_or_dir, (str, os.PathLike)):
+        return sum(
+            os.path.getsize(os.path.join(model_or_dir, name))
+            for name in os.listdir(model_or_dir)
+            if name.endswith((".safetensors", ".bin", ".pt", ".onnx"))
+        )
+    tensors = list(model_or_dir.parameters()) + list(model_or_dir.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
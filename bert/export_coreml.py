@@ -1,21 +1,176 @@
 import torch
 import numpy
-from transformers import AutoTokenizer, AutoModelForTokenClassification
+from transformers import AutoTokenizer
 import coremltools as ct
 from pathlib import Path
 import argparse
+import json
+import os
+
+from compression_check import parse_variant
+from coreml_shapes import CANDIDATE_LENGTHS, METADATA_KEY, choose_lengths, describe, token_length_histogram
+
+
+class TraceableTokenClassifier(torch.nn.Module):
+    """
+    Returns logits only and builds the additive attention mask itself.
+
+    transformers 5 creates masks with ops coremltools cannot convert
+    (e.g. new_ones); a ready 4D mask with eager attention skips them.
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        mask = attention_mask[:, None, None, :].to(torch.float32)
+        mask = (1.0 - mask) * torch.finfo(torch.float32).min
+        return self.model(input_ids=input_ids, attention_mask=mask)[0]
+
+
+def training_query_lengths(config_path, tokenizer):
+    """Token lengths of the training queries of a train.py config."""
+    from bio_data import LABEL_LIST, list_dataset_dirs, load_bio_splits
+    from tokenized_data import tokenize_dataset
+    from train import load_config
+
+    config = load_config(config_path, [])
+    dataset_dirs = list(config["dataset_dirs"]) + list_dataset_dirs(config["base_dataset_dirs"])
+    train_dataset, _ = load_bio_splits(dataset_dirs, LABEL_LIST)
+    if train_dataset is None:
+        raise ValueError(f"No training data found for {config_path}")
+    tokenized = tokenize_dataset(train_dataset, tokenizer, truncation=False)
+    return [len(ids) for ids in tokenized["input_ids"]]
+
+
+def enumerated_lengths(config_path, tokenizer, max_shapes=4):
+    """Pick enumerated lengths from the training-query histogram and print how they fit."""
+    histogram = token_length_histogram(training_query_lengths(config_path, tokenizer))
+    lengths = choose_lengths(histogram, CANDIDATE_LENGTHS, max_shapes, max_length=tokenizer.model_max_length)
+    summary = describe(histogram, lengths)
+    print(f"Training queries: {summary['queries']}, token length p50 {summary['p50_length']}, "
+          f"p99 {summary['p99_length']}, max {summary['max_length']}")
+    print(f"Enumerated lengths {lengths}: {summary['padding_ratio']:.1%} padding, "
+          f"{summary['truncated']:.2%} truncated, queries per length {summary['queries_per_length']}")
+    return lengths
+
+
+def load_for_export(model_path, delta=None):
+    """Tokenizer and eval-mode model ready for tracing, with an optional delta fine-tune merged in."""
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    # load_model also restores the layer sizes of models written by prune.py
+    from prune import load_model
+    model = load_model(model_path, torchscript=True, attn_implementation="eager")
+    if delta:
+        from adapters import load_delta, merge_lora
+        merge_lora(load_delta(model, delta))
+    model.eval() # Set model to evaluation mode
+    return tokenizer, model
+
+
+def trace(model, tokenizer):
+    # We trace with a sample sentence; the traced_model will be a ScriptModule that we can convert.
+    sample_text = "play music by a new artist"
+    inputs = tokenizer(sample_text, return_tensors="pt")
+    return torch.jit.trace(TraceableTokenClassifier(model).eval(), (inputs['input_ids'], inputs['attention_mask']))
+
+
+def convert(traced_model, max_length, lengths=None, compute_precision=None):
+    # Define the input features for the Core ML model.
+    # The input name 'input_ids' should match the name used during tracing.
+    # Shape is (1, sequence_length). By default a RangeDim allows any length;
+    # with enumerated lengths the model only accepts those, which allows the
+    # fixed-shape optimizations on device, and callers pad with
+    # coreml_shapes.pad_to_bucket().
+    if lengths:
+        shape = ct.EnumeratedShapes(shapes=[(1, length) for length in lengths], default=(1, lengths[0]))
+    else:
+        shape = ct.Shape(shape=(1, ct.RangeDim(lower_bound=1, upper_bound=max_length, default=128)))
+    input_ids = ct.TensorType(name="input_ids", shape=shape, dtype=numpy.int32)
+    attention_mask = ct.TensorType(name="attention_mask", shape=shape, dtype=numpy.int32)
+
+    kwargs = {"compute_precision": compute_precision} if compute_precision else {}
+    # The output of a token classification model is typically 'logits'
+    return ct.convert(
+        traced_model,
+        inputs=[input_ids, attention_mask],
+        # If your model has a different output name, change 'logits' here.
+        # You can inspect the model output to find the correct name.
+        outputs=[ct.TensorType(name="logits")],
+        minimum_deployment_target=ct.target.iOS18, # Use a recent deployment target
+        compute_units=ct.ComputeUnit.ALL,
+        **kwargs,
+    )
+
+
+def compress(mlmodel, variant):
+    """Apply a compression variant (see compression_check.py) to an fp16 ML program."""
+    import coremltools.optimize.coreml as cto
+
+    kind, bits = parse_variant(variant)
+    if kind == "palettize":
+        config = cto.OptimizationConfig(global_config=cto.OpPalettizerConfig(mode="kmeans", nbits=bits))
+        return cto.palettize_weights(mlmodel, config)
+    if kind == "linear":
+        config = cto.OptimizationConfig(global_config=cto.OpLinearQuantizerConfig(mode="linear_symmetric", dtype="int8"))
+        return cto.linear_quantize_weights(mlmodel, config)
+    return mlmodel
+
+
+def build_variant(traced_model, max_length, lengths, variant=None):
+    """
+    Convert to one variant: None for the ML program default (fp16), fp32, fp16,
+    or a compression applied to the fp16 program.
+    """
+    if variant is None:
+        return convert(traced_model, max_length, lengths)
+    kind, bits = parse_variant(variant)
+    if kind == "float":
+        return convert(traced_model, max_length, lengths, ct.precision.FLOAT32 if bits == 32 else ct.precision.FLOAT16)
+    return compress(convert(traced_model, max_length, lengths, ct.precision.FLOAT16), variant)
+
+
+def set_metadata(mlmodel, lengths=None):
+    mlmodel.short_description = "MusicNER: Recognizes artists and works of art in text."
+    mlmodel.author = "Sunny"
+    mlmodel.license = "MIT"
+    if lengths:
+        mlmodel.user_defined_metadata[METADATA_KEY] = ",".join(str(length) for length in lengths)
+
+    # You can also add detailed input/output descriptions
+    mlmodel.input_description["input_ids"] = "Tokenized input text (indices of tokens in the vocabulary)."
+    mlmodel.input_description["attention_mask"] = "Mask to avoid performing attention on padding token indices."
+    mlmodel.output_description["logits"] = "The raw, unnormalized output for each token in the sequence."
+    return mlmodel
+
+
+def package_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
 
 def main():
     """
     Converts a fine-tuned Hugging Face token classification model to a Core ML package.
+
+    build_coreml.py builds several variants in parallel and caches them.
     """
     parser = argparse.ArgumentParser(description="Convert a Hugging Face model to Core ML.")
     parser.add_argument("--model", type=str, default="./model", help="Path to the model directory (default: ./model)")
+    parser.add_argument("--output", type=str, default="./MusicNER.mlpackage", help="Output path (default: ./MusicNER.mlpackage)")
+    parser.add_argument("--config", type=str, default=None,
+                        help="train.py config whose training queries set enumerated sequence lengths")
+    parser.add_argument("--lengths", type=int, nargs="+", default=None,
+                        help="Explicit enumerated sequence lengths, e.g. 16 32 64 128")
+    parser.add_argument("--max-shapes", type=int, default=4, help="Most enumerated lengths to choose (default: 4)")
+    parser.add_argument("--variants", nargs="+", default=None,
+                        help="Also write compressed variants <output>-<variant>.mlpackage: fp32, fp16, palettize<bits>, int8")
+    parser.add_argument("--delta", type=str, default=None, help="Delta fine-tune (from train.py) to merge into the model before export")
     args = parser.parse_args()
 
     model_path = Path(args.model)
-    output_path = Path("./MusicNER.mlpackage")
-    
+    output_path = Path(args.output)
+
     if not model_path.exists():
         print(f"❌ Error: Model directory not found at '{model_path}'.")
         print(f"Please make sure you have a fine-tuned model saved in the '{model_path}' directory.")
@@ -23,9 +178,9 @@ def main():
 
     print(f"Loading tokenizer and model from '{model_path}'...")
     try:
-        tokenizer = AutoTokenizer.from_pretrained(model_path)
-        model = AutoModelForTokenClassification.from_pretrained(model_path, torchscript=True)
-        model.eval() # Set model to evaluation mode
+        tokenizer, model = load_for_export(model_path, args.delta)
+        if args.delta:
+            print(f"✅ Merged delta from '{args.delta}'.")
         print("✅ Tokenizer and model loaded successfully.")
     except Exception as e:
         print(f"❌ Failed to load model: {e}")
@@ -33,15 +188,8 @@ def main():
 
     # --- 1. Trace the model with a sample input ---
     print("Tracing the model with a sample input...")
-    # The tokenizer returns a dictionary with 'input_ids', 'attention_mask', etc.
-    # The model expects these as separate arguments or unpacked from a dictionary.
-    # We will trace it with a sample sentence.
-    sample_text = "play music by a new artist"
-    inputs = tokenizer(sample_text, return_tensors="pt")
-    
-    # The traced_model will be a ScriptModule that we can convert.
     try:
-        traced_model = torch.jit.trace(model, (inputs['input_ids'], inputs['attention_mask']))
+        traced_model = trace(model, tokenizer)
         print("✅ Model traced successfully.")
     except Exception as e:
         print(f"❌ Failed to trace model: {e}")
@@ -49,43 +197,19 @@ def main():
 
     # --- 2. Convert the traced model to Core ML ---
     print("Converting the traced model to Core ML...")
-    
-    # Define the input features for the Core ML model.
-    # The input name 'input_ids' should match the name used during tracing.
-    # Shape is (1, sequence_length), where sequence length is variable.
-    # We use a Shape object with a RangeDim to specify a flexible sequence length.
-    shape = ct.Shape(shape=(1, ct.RangeDim(lower_bound=1, upper_bound=tokenizer.model_max_length, default=128)))
-    input_ids = ct.TensorType(name="input_ids", shape=shape, dtype=numpy.int32)
-    attention_mask = ct.TensorType(name="attention_mask", shape=shape, dtype=numpy.int32)
-
-    # Convert the model
+    lengths = sorted(args.lengths) if args.lengths else None
+    if args.config and not lengths:
+        lengths = enumerated_lengths(args.config, tokenizer, args.max_shapes)
     try:
-        # The output of a token classification model is typically 'logits'
-        mlmodel = ct.convert(
-            traced_model,
-            inputs=[input_ids, attention_mask],
-            # If your model has a different output name, change 'logits' here.
-            # You can inspect the model output to find the correct name.
-            outputs=[ct.TensorType(name="logits")],
-            minimum_deployment_target=ct.target.iOS18, # Use a recent deployment target
-            compute_units=ct.ComputeUnit.ALL,
-        )
+        mlmodel = build_variant(traced_model, tokenizer.model_max_length, lengths)
         print("✅ Model converted to Core ML format.")
     except Exception as e:
         print(f"❌ Core ML conversion failed: {e}")
         return
 
-    
     # --- 3. Set model metadata ---
     print("Setting model metadata...")
-    mlmodel.short_description = "MusicNER: Recognizes artists and works of art in text."
-    mlmodel.author = "Sunny"
-    mlmodel.license = "MIT"
-
-    # You can also add detailed input/output descriptions
-    mlmodel.input_description["input_ids"] = "Tokenized input text (indices of tokens in the vocabulary)."
-    mlmodel.input_description["attention_mask"] = "Mask to avoid performing attention on padding token indices."
-    mlmodel.output_description["logits"] = "The raw, unnormalized output for each token in the sequence."
+    set_metadata(mlmodel, lengths)
 
     # --- 4. Save the Core ML package ---
     print(f"Saving Core ML model to '{output_path}'...")
@@ -94,6 +218,31 @@ def main():
         print(f"✅ Core ML model saved successfully to {output_path}")
     except Exception as e:
         print(f"❌ Failed to save Core ML model: {e}")
+        return
+
+    # --- 5. Compressed variants ---
+    # Palettization and int8 start from the fp16 program (the ML program
+    # default); check their accuracy on Linux with compression_check.py.
+    if not args.variants:
+        return
+    sizes = {"default": package_size(output_path)}
+    for variant in args.variants:
+        try:
+            variant_model = build_variant(traced_model, tokenizer.model_max_length, lengths, variant)
+            variant_path = output_path.with_name(f"{output_path.stem}-{variant}{output_path.suffix}")
+            set_metadata(variant_model, lengths).save(str(variant_path))
+            sizes[variant] = package_size(variant_path)
+            print(f"✅ Saved {variant} variant to {variant_path}")
+        except Exception as e:
+            print(f"❌ Failed to build {variant} variant: {e}")
+
+    print(f"\n{'variant':<12} {'size MB':>9} {'vs default':>11}")
+    for variant, size in sizes.items():
+        print(f"{variant:<12} {size / 1e6:>9.2f} {size / sizes['default']:>10.0%}")
+    sizes_path = output_path.with_name(f"{output_path.stem}-sizes.json")
+    with open(sizes_path, 'w', encoding='utf-8') as f:
+        json.dump(sizes, f, indent=2)
+    print(f"Sizes written to {sizes_path}")
 
 if __name__ == "__main__":
     main()
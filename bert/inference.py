@@ -0,0 +1,128 @@
+import os
+import sys
+
+import numpy
+import torch
+
+from decoding import decode_batch, word_id_matrix
+from ner_runtime import artifact_is_fresh, default_artifact_path
+
+# One predict(text) interface over the runtimes the token classifier ships
+# in: eager PyTorch, ONNX Runtime (Linux servers) and Core ML (macOS only).
+# Every backend is called like the PyTorch model, with input_ids and
+# attention_mask, and returns an object with .logits.
+#
+#   predictor = load_predictor("./model", backend="onnx")
+#   predictor.predict("play Hey Jude by the Beatles")
+
+BACKENDS = ("pytorch", "onnx", "coreml")
+
+
+class CoreMLModel:
+    """A Core ML package called like the PyTorch token classifier, one query at a time."""
+
+    def __init__(self, package_path, pad_token_id=0):
+        import coremltools as ct
+        from coreml_shapes import model_lengths
+
+        if sys.platform != "darwin":
+            raise RuntimeError("Core ML predictions need macOS")
+        self.mlmodel = ct.models.MLModel(str(package_path))
+        self.lengths = model_lengths(self.mlmodel)
+        self.pad_token_id = pad_token_id
+
+    def __call__(self, input_ids, attention_mask):
+        from transformers.modeling_outputs import TokenClassifierOutput
+        from coreml_shapes import pad_to_bucket
+
+        input_ids = numpy.asarray(input_ids)
+        attention_mask = numpy.asarray(attention_mask)
+        rows = []
+        for ids, mask in zip(input_ids, attention_mask):
+            real = ids[mask.astype(bool)]
+            if self.lengths:
+                inputs = pad_to_bucket(real, self.lengths, self.pad_token_id)
+            else:
+                inputs = {"input_ids": real[None].astype(numpy.int32),
+                          "attention_mask": numpy.ones((1, len(real)), dtype=numpy.int32)}
+            logits = self.mlmodel.predict(inputs)["logits"][0, :len(real)]
+            row = numpy.zeros((input_ids.shape[1], logits.shape[-1]), dtype=numpy.float32)
+            row[:len(real)] = logits
+            rows.append(row)
+        return TokenClassifierOutput(logits=torch.from_numpy(numpy.stack(rows)))
+
+    def eval(self):
+        return self
+
+
+class NERPredictor:
+    """Tokenizes, runs any backend model and decodes entities."""
+
+    def __init__(self, model, tokenizer, id2label):
+        self.model = model.eval()
+        self.tokenizer = tokenizer
+        self.id2label = {int(k): v for k, v in id2label.items()}
+
+    def logits(self, texts):
+        """Logits (batch, tokens, labels) and the padded encoding, with offsets, for a list of texts."""
+        inputs = self.tokenizer(texts, padding=True, truncation=True, return_offsets_mapping=True, return_tensors="pt")
+        with torch.inference_mode():
+            logits = self.model(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"]).logits
+        return logits, inputs
+
+    def predict(self, text):
+        """{"text", "tokens": [(token, label)], "entities": [...]} for one query (see decoding.decode_batch)."""
+        logits, inputs = self.logits([text])
+        length = int(inputs["attention_mask"][0].sum())
+        tokens = self.tokenizer.convert_ids_to_tokens(inputs["input_ids"][0][:length])
+        labels = [self.id2label.get(int(i), f"ID:{int(i)}") for i in logits[0, :length].argmax(-1)]
+        entities = decode_batch([text], logits.float().numpy(), word_id_matrix(inputs),
+                                inputs["offset_mapping"].numpy(), self.id2label)[0]
+        return {"text": text, "tokens": list(zip(tokens, labels)), "entities": entities}
+
+
+def load_backend(model_dir, backend="pytorch", path=None, num_threads=None, tokenizer=None):
+    """
+    The model of `model_dir` in one runtime.
+
+    `path` is the .onnx file or .mlpackage for those backends. A missing
+    ONNX file is exported from `model_dir` first (default: <model_dir>.onnx,
+    beside the directory so its weights and fingerprint stay unchanged, and
+    re-exported when older than the model).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'; expected one of {', '.join(BACKENDS)}")
+    from prune import load_model
+
+    if backend == "pytorch":
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        return load_model(model_dir).eval()
+    if backend == "onnx":
+        from onnx_export import OnnxRuntimeModel, export_onnx
+
+        stale = False
+        if not path:
+            path = default_artifact_path(model_dir, "onnx")
+            # Re-export the default file after the model is retrained
+            stale = os.path.exists(path) and not artifact_is_fresh(model_dir, path)
+        if stale or not os.path.exists(path):
+            from transformers import AutoTokenizer
+
+            tokenizer = tokenizer or AutoTokenizer.from_pretrained(model_dir)
+            export_onnx(load_model(model_dir, torchscript=True), tokenizer, path)
+        return OnnxRuntimeModel(path, num_threads)
+    if not path:
+        raise ValueError("The coreml backend needs the path of an .mlpackage")
+    from transformers import AutoTokenizer
+
+    tokenizer = tokenizer or AutoTokenizer.from_pretrained(model_dir)
+    return CoreMLModel(path, tokenizer.pad_token_id)
+
+
+def load_predictor(model_dir, backend="pytorch", path=None, num_threads=None):
+    from transformers import AutoConfig, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = load_backend(model_dir, backend, path, num_threads, tokenizer)
+    return NERPredictor(model, tokenizer, AutoConfig.from_pretrained(model_dir).id2label)
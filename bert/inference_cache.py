@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Result cache in front of NER inference. Voice traffic repeats the same few
+# thousand requests, so entities are cached under the query as the model sees
+# it: whitespace collapsed, and lowercased when the tokenizer lowercases
+# anyway. Only queries the model cannot tell apart share an entry. Entries
+# are evicted least-recently-used past the entry or byte limits, expire after
+# a TTL, and can be saved to disk; a saved cache is discarded when the model
+# fingerprint changes.
+#
+#   cache = InferenceCache(max_entries=100_000, ttl_seconds=86_400, path="./cache/ner_results.json",
+#                          fingerprint=model_fingerprint("./model"))
+#   predict = cached_predict_batch(predict_batch, cache, tokenizer_lowercases(tokenizer))
+
+CACHE_VERSION = 1
+
+
+def model_fingerprint(model_dir, backend="pytorch"):
+    from build_coreml import directory_fingerprint
+
+    return f"{directory_fingerprint(model_dir)}:{backend}:{CACHE_VERSION}"
+
+
+def tokenizer_lowercases(tokenizer):
+    """Whether the fast tokenizer's normalizer lowercases its input."""
+    normalizer = getattr(tokenizer, "backend_tokenizer", None) and tokenizer.backend_tokenizer.normalizer
+    return bool(normalizer) and normalizer.normalize_str("A") == "a"
+
+
+def normalize_query(text, lowercase=False):
+    """
+    (normalized text, positions): whitespace runs become one space, ends are
+    stripped and, if `lowercase`, letters are lowercased. positions[i] is the
+    index in `text` of normalized character i.
+    """
+    chars, positions = [], []
+    space_at = None
+    for i, char in enumerate(text):
+        if char.isspace():
+            if chars and space_at is None:
+                space_at = i
+            continue
+        if space_at is not None:
+            chars.append(" ")
+            positions.append(space_at)
+            space_at = None
+        for normalized in (char.lower() if lowercase else char):
+            chars.append(normalized)
+            positions.append(i)
+    return "".join(chars), positions
+
+
+def restore_spans(entities, text, positions):
+    """Entities found in the normalized text, with spans and text mapped back onto `text`."""
+    restored = []
+    for entity in entities:
+        start = positions[entity["start"]] if entity["start"] < len(positions) else len(text)
+        end = positions[entity["end"] - 1] + 1 if entity["end"] > 0 else start
+        restored.append({**entity, "entity": text[start:end], "start": start, "end": end})
+    return restored
+
+
+class InferenceCache:
+    """Thread-safe LRU/TTL cache of JSON-serializable values with entry and byte limits."""
+
+    def __init__(self, max_entries=100_000, max_bytes=64 << 20, ttl_seconds=None, path=None, fingerprint=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.fingerprint = fingerprint
+        self.entries = OrderedDict()  # key -> (value, size in bytes, stored at)
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = self.expirations = 0
+        self.lock = threading.Lock()
+        if path:
+            self.load()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl_seconds is not None and time.time() - entry[2] > self.ttl_seconds:
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, stored_at=None):
+        size = len(key.encode("utf-8")) + len(json.dumps(value).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, size, stored_at or time.time())
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def save(self):
+        """Write the entries to `path` atomically, oldest first so a reload keeps the LRU order."""
+        if not self.path:
+            return
+        with self.lock:
+            entries = [[key, value, stored_at] for key, (value, _, stored_at) in self.entries.items()]
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp-{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"fingerprint": self.fingerprint, "entries": entries}, f)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        """Read entries saved for the same fingerprint; a different model starts empty."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        if saved.get("fingerprint") != self.fingerprint:
+            return
+        now = time.time()
+        for key, value, stored_at in saved.get("entries", []):
+            if self.ttl_seconds is None or now - stored_at <= self.ttl_seconds:
+                self.put(key, value, stored_at)
+
+
+def cached_predict_batch(predict_batch, cache, lowercase=False):
+    """
+    Wrap `predict_batch(texts) -> entity lists` with `cache`.
+
+    Misses are normalized, de-duplicated and predicted in one call; every
+    result is mapped back onto the caller's own text.
+    """
+    def predict(texts):
+        normalized = [normalize_query(text, lowercase) for text in texts]
+        results = [cache.get(key) for key, _ in normalized]
+        missing = list(dict.fromkeys(key for (key, _), result in zip(normalized, results) if result is None))
+        if missing:
+            found = dict(zip(missing, predict_batch(missing)))
+            for key, entities in found.items():
+                cache.put(key, entities)
+            results = [found[key] if result is None else result for (key, _), result in zip(normalized, results)]
+        return [restore_spans(entities, text, positions)
+                for text, (_, positions), entities in zip(texts, normalized, results)]
+
+    return predict
@@ -0,0 +1,239 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Lightweight NER inference for serverless and CLI use, where cold start
+# dominates. Only the standard library is imported up front; each backend
+# imports just what it needs when the model is loaded:
+#
+#   onnx          onnxruntime + tokenizers (no torch, no transformers)
+#   torchscript   torch + tokenizers (a frozen traced model, no transformers)
+#   eager         torch + transformers, weights read through prune.load_model
+#                 (from_pretrained, or a full load_file copy for pruned models)
+#
+# Only the onnx and torchscript backends meet the sub-second cold-start
+# target: eager still imports transformers and builds the model, and measured
+# 10.7 s against 10.0 s for inference.py, so it is a fallback, not a fast path.
+#
+# The tokenizer is read straight from tokenizer.json with the `tokenizers`
+# library and labels from config.json. Artifacts are written next to the
+# model directory by `export` (<model>.onnx, <model>.pt).
+#
+#   python ner_runtime.py export --model ./model --backend onnx
+#   python ner_runtime.py predict "play Hey Jude by the Beatles" --backend onnx
+#   python ner_runtime.py coldstart --model ./model
+
+BACKENDS = ("onnx", "torchscript", "eager")
+ARTIFACT_SUFFIXES = {"onnx": ".onnx", "torchscript": ".pt"}
+
+
+def default_artifact_path(model_dir, backend="onnx"):
+    """Where `export` writes a backend's artifact: beside the model directory, e.g. ./model.onnx."""
+    return os.path.normpath(str(model_dir)) + ARTIFACT_SUFFIXES[backend]
+
+
+def artifact_is_fresh(model_dir, path):
+    """Whether `path` exists and was written after every file of the model directory (i.e. after retraining)."""
+    return os.path.exists(path) and os.path.getmtime(path) >= max(
+        os.path.getmtime(os.path.join(model_dir, name)) for name in os.listdir(model_dir))
+
+
+def available_backend(model_dir):
+    """The fastest backend with an up-to-date exported artifact, else eager."""
+    for backend in ("onnx", "torchscript"):
+        path = default_artifact_path(model_dir, backend)
+        if artifact_is_fresh(model_dir, path):
+            return backend
+        if os.path.exists(path):
+            print(f"⚠️  {path} is older than {model_dir}; skipping it. Re-run `python ner_runtime.py export`.",
+                  file=sys.stderr)
+    return "eager"
+
+
+class NERRuntime:
+    """Tokenizer, model and decoder for one backend; predict(text) returns entities with spans and scores."""
+
+    def __init__(self, model_dir, backend="auto", artifact=None, num_threads=None):
+        from tokenizers import Tokenizer
+
+        self.model_dir = model_dir
+        self.backend = available_backend(model_dir) if backend == "auto" else backend
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{self.backend}'; expected auto or one of {', '.join(BACKENDS)}")
+        with open(os.path.join(model_dir, "config.json"), encoding="utf-8") as f:
+            config = json.load(f)
+        self.id2label = {int(k): v for k, v in config["id2label"].items()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(config.get("max_position_embeddings", 512))
+        self.pad_token_id = config.get("pad_token_id") or 0
+        if self.backend != "eager" and not artifact:
+            artifact = default_artifact_path(model_dir, self.backend)
+            if not artifact_is_fresh(model_dir, artifact):
+                raise ValueError(f"{artifact} is missing or older than {model_dir}; "
+                                 f"run `python ner_runtime.py export --backend {self.backend}`")
+        self._run = getattr(self, f"_load_{self.backend}")(artifact, num_threads)
+
+    def _load_onnx(self, path, num_threads):
+        import numpy
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        return lambda input_ids, attention_mask: session.run(["logits"], {
+            "input_ids": input_ids.astype(numpy.int64), "attention_mask": attention_mask.astype(numpy.int64)})[0]
+
+    def _load_torchscript(self, path, num_threads):
+        import torch
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        module = torch.jit.load(path, map_location="cpu").eval()
+
+        def run(input_ids, attention_mask):
+            with torch.inference_mode():
+                return module(torch.from_numpy(input_ids), torch.from_numpy(attention_mask))[0].float().numpy()
+        return run
+
+    def _load_eager(self, path, num_threads):
+        import torch
+        from prune import load_model
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        # Pruned checkpoints are copied into memory by safetensors' load_file, not memory-mapped
+        model = load_model(path or self.model_dir).eval()
+
+        def run(input_ids, attention_mask):
+            with torch.inference_mode():
+                return model(input_ids=torch.from_numpy(input_ids),
+                             attention_mask=torch.from_numpy(attention_mask)).logits.float().numpy()
+        return run
+
+    def predict_batch(self, texts):
+        import numpy
+        from decoding import decode_batch
+
+        encodings = self.tokenizer.encode_batch(list(texts))
+        length = max((len(e.ids) for e in encodings), default=0)
+        input_ids = numpy.full((len(encodings), length), self.pad_token_id, dtype=numpy.int64)
+        attention_mask = numpy.zeros_like(input_ids)
+        word_ids = numpy.full_like(input_ids, -1)
+        offsets = numpy.zeros((len(encodings), length, 2), dtype=numpy.int64)
+        for row, encoding in enumerate(encodings):
+            size = len(encoding.ids)
+            input_ids[row, :size] = encoding.ids
+            attention_mask[row, :size] = 1
+            word_ids[row, :size] = [-1 if w is None else w for w in encoding.word_ids]
+            offsets[row, :size] = encoding.offsets
+        logits = self._run(input_ids, attention_mask)
+        return decode_batch(texts, logits, word_ids, offsets, self.id2label)
+
+    def predict(self, text):
+        return self.predict_batch([text])[0]
+
+
+def export(model_dir, backend, output=None):
+    """Write the ONNX or TorchScript artifact for `model_dir`."""
+    from transformers import AutoTokenizer
+    from prune import load_model
+
+    output = output or default_artifact_path(model_dir, backend)
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = load_model(model_dir, torchscript=True).eval()
+    if backend == "onnx":
+        from onnx_export import export_onnx
+        export_onnx(model, tokenizer, output)
+    else:
+        from quantize import save_torchscript
+        save_torchscript(model, tokenizer, output)
+    return output
+
+
+def fresh_process(arguments, runs=3):
+    """(best wall seconds, its stdout) for running `python <arguments>` `runs` times from cold."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, *arguments], check=True, capture_output=True, text=True,
+                                env={**os.environ, "PYTHONPATH": here}).stdout
+        wall = time.perf_counter() - start
+        if best is None or wall < best[0]:
+            best = (wall, output)
+    return best
+
+
+def cold_start(model_dir, backend, query, runs=3):
+    """
+    Best-of-`runs` cold start in a fresh interpreter: wall time from process
+    launch to the first prediction, and the load and first-prediction times
+    measured inside it.
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ner_runtime.py")
+    wall, output = fresh_process([script, "predict", query, "--model", model_dir, "--backend", backend, "--timing"],
+                                 runs)
+    return {"backend": backend, "wall_seconds": round(wall, 3), **json.loads(output.strip().splitlines()[-1])["timing"]}
+
+
+def main():
+    started = time.perf_counter()
+    parser = argparse.ArgumentParser(description="Fast-starting NER inference.")
+    parser.add_argument("command", choices=("predict", "export", "coldstart"))
+    parser.add_argument("text", nargs="?", default="play Hey Jude by the Beatles", help="predict: query to label")
+    parser.add_argument("--model", type=str, default="./model", help="Path to the model directory (default: ./model)")
+    parser.add_argument("--backend", type=str, default="auto",
+                        help="predict: auto, onnx, torchscript or eager; export: onnx or torchscript (default: auto)")
+    parser.add_argument("--artifact", type=str, default=None, help="ONNX/TorchScript file (default: beside the model)")
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads")
+    parser.add_argument("--timing", action="store_true", help="predict: include load and first-prediction times")
+    parser.add_argument("--runs", type=int, default=3, help="coldstart: fresh processes per backend (default: 3)")
+    parser.add_argument("--report", type=str, default="./coldstart_report.json", help="coldstart: where to write the report")
+    args = parser.parse_args()
+
+    if args.command == "predict":
+        runtime = NERRuntime(args.model, args.backend, args.artifact, args.threads)
+        loaded = time.perf_counter()
+        result = {"query": args.text, "backend": runtime.backend, "entities": runtime.predict(args.text)}
+        if args.timing:
+            result["timing"] = {"load_seconds": round(loaded - started, 3),
+                                "first_prediction_seconds": round(time.perf_counter() - loaded, 3)}
+        print(json.dumps(result, ensure_ascii=False))
+        return
+
+    if args.command == "export":
+        backends = ["onnx", "torchscript"] if args.backend == "auto" else [args.backend]
+        for backend in backends:
+            if backend not in ARTIFACT_SUFFIXES:
+                parser.error(f"Cannot export '{backend}'; choose onnx or torchscript")
+            print(f"✅ Wrote {export(args.model, backend, args.artifact if len(backends) == 1 else None)}")
+        return
+
+    # "baseline" is the previous path: transformers tokenizer, from_pretrained and eager PyTorch
+    rows = []
+    for backend in [b for b in BACKENDS if b == "eager" or artifact_is_fresh(args.model, default_artifact_path(args.model, b))]:
+        rows.append(cold_start(args.model, backend, args.text, args.runs))
+    baseline_script = "import sys\nfrom inference import load_predictor\nload_predictor(sys.argv[1]).predict(sys.argv[2])\n"
+    baseline, _ = fresh_process(["-c", baseline_script, args.model, args.text], args.runs)
+    rows.append({"backend": "baseline (test_model.py path)", "wall_seconds": round(baseline, 3)})
+    if len(rows) == 2:
+        print("⚠️  No up-to-date ONNX or TorchScript artifact; run `python ner_runtime.py export` to measure them.")
+
+    print(f"\n{'backend':<30} {'to first prediction s':>22} {'load s':>8} {'first predict s':>16}")
+    for row in rows:
+        print(f"{row['backend']:<30} {row['wall_seconds']:>22.3f} {row.get('load_seconds', float('nan')):>8.3f} "
+              f"{row.get('first_prediction_seconds', float('nan')):>16.3f}")
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump({"model": args.model, "query": args.text, "runs": args.runs, "backends": rows}, f, indent=2)
+    print(f"\nReport written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
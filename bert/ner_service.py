@@ -0,0 +1,383 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from inference_cache import InferenceCache, model_fingerprint, normalize_query, restore_spans
+
+# Everything is local: never reach for the Hugging Face Hub
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+# Local NER HTTP service answering the same request as lambdas/musicner:
+# POST {"query": "..."} and get back the fields the assistant returned
+# ("Artist Name", "Work Of Art", "Title") plus the raw entities, without any
+# network round trips. Concurrent requests are queued and grouped into
+# micro-batches of up to --max-batch-size queries, waiting at most
+# --max-wait-ms for a batch to fill. Standard library only besides the model.
+#
+#   python ner_service.py serve --port 8080
+#   curl -d '{"query": "play Hey Jude by the Beatles"}' localhost:8080/
+#   python ner_service.py bench --concurrency 32 --requests 5000   # in-process server under load, uncached
+#   python ner_service.py bench --cache-entries 100000               # the same with the result cache on
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))] if sorted_values else 0.0
+
+
+def latency_summary(latencies_ms, elapsed_seconds):
+    values = sorted(latencies_ms)
+    return {
+        "requests": len(values),
+        "qps": round(len(values) / elapsed_seconds, 1) if elapsed_seconds else 0.0,
+        "p50_ms": round(percentile(values, 0.50), 3),
+        "p99_ms": round(percentile(values, 0.99), 3),
+        "mean_ms": round(statistics.fmean(values), 3) if values else 0.0,
+    }
+
+
+def lambda_response(entities):
+    """The body lambdas/musicner returns, filled from the first Artist and WoA entities."""
+    artist = next((e["entity"] for e in entities if e["label"] == "Artist"), None)
+    title = next((e["entity"] for e in entities if e["label"] == "WoA"), None)
+    # The model finds titles but not whether they are songs or albums
+    return {"Artist Name": artist, "Work Of Art": None, "Title": title, "entities": entities}
+
+
+class MicroBatcher:
+    """Queues queries and runs them through `predict_batch(texts)` in micro-batches."""
+
+    def __init__(self, predict_batch, max_batch_size=32, max_wait_ms=5.0):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        # One model call at a time; intra-op threads parallelize within it
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.batch_sizes = Counter()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        self.executor.shutdown(wait=False)
+
+    async def predict(self, text):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((text, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            self.batch_sizes[len(batch)] += 1
+            texts = [text for text, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.predict_batch, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+def load_batch_predictor(model_dir, backend="pytorch", path=None, num_threads=None):
+    """(predict_batch(texts) -> entity lists, whether the tokenizer lowercases), loading the model once."""
+    from transformers import AutoConfig, AutoTokenizer
+    from batch_predict import run_batch
+    from inference import load_backend
+    from inference_cache import tokenizer_lowercases
+
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = load_backend(model_dir, backend, path, num_threads, tokenizer)
+    id2label = {int(k): v for k, v in AutoConfig.from_pretrained(model_dir).id2label.items()}
+
+    def predict_batch(texts):
+        encoding = tokenizer(texts, truncation=True, return_offsets_mapping=True)
+        results = run_batch(model, encoding, texts, range(len(texts)), id2label, tokenizer.pad_token_id)
+        return [entities for _, entities in results]
+
+    return predict_batch, tokenizer_lowercases(tokenizer)
+
+
+class NERServer:
+    """
+    Minimal HTTP/1.1 server (keep-alive, Content-Length bodies) in front of a
+    MicroBatcher, answering repeated queries from an optional InferenceCache
+    without queueing them.
+    """
+
+    def __init__(self, batcher, cache=None, lowercase=False):
+        self.batcher = batcher
+        self.cache = cache
+        self.lowercase = lowercase
+        self.latencies_ms = deque(maxlen=100_000)
+        self.started = time.perf_counter()
+
+    async def handle(self, method, path, body):
+        if path == "/health":
+            return 200, {"status": "ok"}
+        if path == "/metrics":
+            metrics = latency_summary(self.latencies_ms, time.perf_counter() - self.started)
+            metrics["batch_sizes"] = dict(sorted(self.batcher.batch_sizes.items()))
+            if self.cache is not None:
+                metrics["cache"] = self.cache.stats()
+            return 200, metrics
+        if path not in ("/", "/musicner"):
+            return 404, "Not found"
+        if method != "POST":
+            return 405, "Use POST with a JSON body"
+        # Same checks and messages as lambdas/musicner
+        try:
+            request = json.loads(body or b"null")
+        except ValueError:
+            return 400, "Invalid request body"
+        query = request.get("query", "") if isinstance(request, dict) else None
+        if not isinstance(query, str):
+            return 400, "Invalid request body"
+        if not query:
+            return 400, "Query not found in request body"
+        start = time.perf_counter()
+        if self.cache is None:
+            entities = await self.batcher.predict(query)
+        else:
+            key, positions = normalize_query(query, self.lowercase)
+            entities = self.cache.get(key)
+            if entities is None:
+                entities = await self.batcher.predict(key)
+                self.cache.put(key, entities)
+            entities = restore_spans(entities, query, positions)
+        self.latencies_ms.append((time.perf_counter() - start) * 1000)
+        return 200, lambda_response(entities)
+
+    async def serve_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+                try:
+                    status, payload = await self.handle(method.upper(), path.split("?")[0], body)
+                except Exception as e:
+                    status, payload = 500, f"Error running the model: {e}"
+                if isinstance(payload, str):
+                    content, content_type = payload.encode("utf-8"), "text/plain; charset=utf-8"
+                else:
+                    content, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+                keep_alive = headers.get("connection", "").lower() != "close" and version != "HTTP/1.0"
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(content)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                    .encode("latin-1") + content
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def start_server(args, predictor=None, sock=None):
+    """
+    Load the model (unless `predictor` is a loaded (predict_batch, lowercase))
+    and listen on --host/--port, or on the already bound `sock`.
+    """
+    predict_batch, lowercase = predictor or load_batch_predictor(args.model, args.backend, args.path, args.threads)
+    # Compile/warm the model before the first request
+    predict_batch(["play music by a new artist"])
+    batcher = MicroBatcher(predict_batch, args.max_batch_size, args.max_wait_ms)
+    batcher.start()
+    cache = None
+    if args.cache_entries > 0:
+        cache = InferenceCache(args.cache_entries, int(args.cache_mb * (1 << 20)), args.cache_ttl, args.cache_path,
+                               model_fingerprint(args.model, args.backend) if args.cache_path else None)
+    server = NERServer(batcher, cache, lowercase)
+    if sock is not None:
+        tcp_server = await asyncio.start_server(server.serve_connection, sock=sock)
+    else:
+        tcp_server = await asyncio.start_server(server.serve_connection, args.host, args.port)
+    return server, batcher, tcp_server
+
+
+async def post_query(reader, writer, host, query):
+    body = json.dumps({"query": query}).encode("utf-8")
+    writer.write(f"POST / HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def load_test(host, port, queries, concurrency, total):
+    """Client-side latencies (ms) and wall time for `total` requests over `concurrency` keep-alive connections."""
+    latencies, errors = [], 0
+    counter = iter(range(total))
+
+    async def client():
+        nonlocal errors
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for i in counter:
+                start = time.perf_counter()
+                if await post_query(reader, writer, host, queries[i % len(queries)]) != 200:
+                    errors += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start, errors
+
+
+async def serve(args):
+    server, batcher, tcp_server = await start_server(args)
+    print(f"✅ Serving MusicNER on http://{args.host}:{args.port} "
+          f"(max batch {args.max_batch_size}, max wait {args.max_wait_ms} ms)")
+    saver = None
+    if server.cache is not None and args.cache_path:
+        async def save_periodically():
+            while True:
+                await asyncio.sleep(args.cache_save_seconds)
+                server.cache.save()
+        saver = asyncio.get_running_loop().create_task(save_periodically())
+    try:
+        async with tcp_server:
+            await tcp_server.serve_forever()
+    finally:
+        if saver:
+            saver.cancel()
+            server.cache.save()
+
+
+async def bench(args):
+    from evaluation import LATENCY_QUERIES
+
+    queries = LATENCY_QUERIES
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    host, port = args.host, args.port
+    server = batcher = tcp_server = None
+    if not args.url:
+        args.port = 0
+        server, batcher, tcp_server = await start_server(args)
+        port = tcp_server.sockets[0].getsockname()[1]
+    else:
+        host, _, port = args.url.split("//")[-1].rstrip("/").partition(":")
+        port = int(port or 80)
+
+    rows = []
+    for concurrency in args.concurrency:
+        if batcher:
+            batcher.batch_sizes.clear()
+        latencies, elapsed, errors = await load_test(host, port, queries, concurrency, args.requests)
+        row = {"concurrency": concurrency, **latency_summary(latencies, elapsed), "errors": errors}
+        if server and server.cache is not None:
+            row["cache_hit_rate"] = server.cache.stats()["hit_rate"]
+        if batcher:
+            sizes = batcher.batch_sizes
+            row["mean_batch_size"] = round(sum(k * v for k, v in sizes.items()) / max(1, sum(sizes.values())), 2)
+        rows.append(row)
+        print(f"concurrency {concurrency:>4}: {row['qps']:>8.1f} QPS  p50 {row['p50_ms']:>7.2f} ms  "
+              f"p99 {row['p99_ms']:>7.2f} ms  mean batch {row.get('mean_batch_size', '-')}  "
+              + (f"cache hits {row['cache_hit_rate']:.0%}  " if "cache_hit_rate" in row else "") + f"errors {errors}")
+
+    if tcp_server:
+        tcp_server.close()
+        await tcp_server.wait_closed()
+        await batcher.stop()
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump({"max_batch_size": args.max_batch_size, "max_wait_ms": args.max_wait_ms,
+                   "backend": args.backend, "cache_entries": args.cache_entries, "results": rows}, f, indent=2)
+    print(f"\nReport written to {args.report}")
+    if any(row["errors"] for row in rows):
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local micro-batching NER service compatible with lambdas/musicner.")
+    parser.add_argument("command", choices=("serve", "bench"), help="Run the service, or load-test it")
+    parser.add_argument("--model", type=str, default="./model", help="Path to the model directory (default: ./model)")
+    parser.add_argument("--backend", choices=("pytorch", "onnx"), default="pytorch", help="Runtime (default: pytorch)")
+    parser.add_argument("--path", type=str, default=None, help="ONNX file for the onnx backend (default: <model>.onnx)")
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads (default: torch's)")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="Port to bind (default: 8080)")
+    parser.add_argument("--max-batch-size", type=int, default=32, help="Most queries per model call (default: 32)")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                        help="Longest a query waits for its batch to fill (default: 5)")
+    parser.add_argument("--cache-entries", type=int, default=None,
+                        help="Most cached query results; 0 disables the cache "
+                             "(default: 100000 for serve, 0 for bench so it measures the model)")
+    parser.add_argument("--cache-mb", type=float, default=64, help="Most cached bytes, in MiB (default: 64)")
+    parser.add_argument("--cache-ttl", type=float, default=None, help="Seconds a cached result stays valid (default: forever)")
+    parser.add_argument("--cache-path", type=str, default=None,
+                        help="Persist the cache here across restarts; reset when the model changes")
+    parser.add_argument("--cache-save-seconds", type=float, default=300, help="How often to persist the cache (default: 300)")
+    parser.add_argument("--url", type=str, default=None, help="bench: load-test a running service instead of an in-process one")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32],
+                        help="bench: concurrent clients, one run each (default: 1 8 32)")
+    parser.add_argument("--requests", type=int, default=2000, help="bench: requests per run (default: 2000)")
+    parser.add_argument("--queries", type=str, default=None, help="bench: text file of queries, one per line")
+    parser.add_argument("--report", type=str, default="./service_report.json", help="bench: where to write the report")
+    args = parser.parse_args()
+    if args.cache_entries is None:
+        # bench replays a small query set, so a cache would turn it into a measurement of cache hits
+        args.cache_entries = 0 if args.command == "bench" else 100_000
+
+    try:
+        asyncio.run(serve(args) if args.command == "serve" else bench(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+import argparse
+import asyncio
+import gc
+import json
+import os
+import queue
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+# Multi-process CPU serving for the NER service: a supervisor binds the port
+# and preforks --workers copies of ner_service's server, which all accept on
+# that socket. Each worker is pinned to its own share of the cores
+# (sched_setaffinity) and runs that many intra-op threads, so workers do not
+# oversubscribe the CPU the way several default-threaded processes would.
+#
+# Weights are shared between workers rather than copied:
+#
+#   prefork   the supervisor imports torch/transformers and loads the model
+#             once, then forks; weights and the interpreter's heap are
+#             copy-on-write and rarely written, so every worker reads the same
+#             physical memory (PyTorch backend only)
+#   mmap      each worker loads after the fork and only file-backed pages
+#             (safetensors, ONNX, shared libraries) are shared through the
+#             page cache; required for onnx, whose session thread pools do
+#             not survive a fork
+#
+# The pool only reports that it is serving once every worker is; if any fails
+# to start, all are stopped and the supervisor exits non-zero. Crashed workers
+# are restarted after a backoff that doubles with each crash, and a worker
+# crashing more than --max-restarts times within RESTART_WINDOW seconds stops
+# the pool the same way. `bench` compares aggregate throughput and host memory
+# (PSS, which splits shared pages between the processes that map them) of the
+# worker pool with one multi-threaded process.
+#
+#   python ner_supervisor.py serve --workers 4 --port 8080
+#   python ner_supervisor.py bench --workers 4 --concurrency 32 --requests 5000
+
+SHARE_MODES = ("prefork", "mmap")
+# Crashes older than this no longer count towards --max-restarts or the backoff
+RESTART_WINDOW = 60.0
+RESTART_BACKOFF = 0.5
+MAX_RESTART_BACKOFF = 10.0
+
+
+def core_split(workers, cpus=None):
+    """Disjoint, contiguous core lists per worker; with more workers than cores they share round-robin."""
+    cpus = sorted(cpus or os.sched_getaffinity(0))
+    if workers >= len(cpus):
+        return [[cpus[i % len(cpus)]] for i in range(workers)]
+    per_worker, extra = divmod(len(cpus), workers)
+    split, start = [], 0
+    for i in range(workers):
+        size = per_worker + (i < extra)
+        split.append(cpus[start:start + size])
+        start += size
+    return split
+
+
+def process_memory(pid):
+    """RSS and PSS (proportional set size) of a process in MiB, from /proc/<pid>/smaps_rollup."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if value.strip().endswith("kB"):
+                fields[name] = int(value.split()[0])
+    return {"rss_mb": round(fields.get("Rss", 0) / 1024, 1), "pss_mb": round(fields.get("Pss", 0) / 1024, 1)}
+
+
+def child_pids(pid):
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; fields after it are fixed
+                if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                    children.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return children
+
+
+def host_memory(pid):
+    """Memory of a supervisor and its workers: per-process figures and the PSS total."""
+    processes = {}
+    for p in [pid] + child_pids(pid):
+        try:
+            processes[p] = process_memory(p)
+        except OSError:
+            continue
+    return {
+        "total_pss_mb": round(sum(m["pss_mb"] for m in processes.values()), 1),
+        "total_rss_mb": round(sum(m["rss_mb"] for m in processes.values()), 1),
+        "processes": {str(p): m for p, m in processes.items()},
+    }
+
+
+def run_worker(args, index, cores, sock, predictor, ready_fd):
+    """Body of a forked worker: pin, size the thread pools, serve until SIGTERM."""
+    from ner_service import load_batch_predictor, start_server
+
+    if cores:
+        os.sched_setaffinity(0, cores)
+    threads = args.threads_per_worker or len(cores or os.sched_getaffinity(0))
+    if args.backend == "pytorch":
+        import torch
+        torch.set_num_threads(threads)
+    if predictor is None:
+        predictor = load_batch_predictor(args.model, args.backend, args.path, threads)
+
+    async def serve():
+        args.threads = threads
+        _, batcher, tcp_server = await start_server(args, predictor, sock)
+        if ready_fd is not None:
+            os.write(ready_fd, b"1")
+            os.close(ready_fd)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+        loop.add_signal_handler(signal.SIGINT, stop.set)
+        await stop.wait()
+        tcp_server.close()
+        await batcher.stop()
+
+    asyncio.run(serve())
+
+
+class Supervisor:
+    """Prefork process manager: forks the workers, restarts any that die and stops them all on SIGTERM/SIGINT."""
+
+    def __init__(self, args):
+        self.args = args
+        self.cores = core_split(args.workers) if args.pin else [None] * args.workers
+        self.workers = {}  # pid -> worker index
+        self.crashes = {}  # worker index -> times of its recent crashes
+        self.stopping = False
+        self.predictor = None
+
+    def bind(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.args.host, self.args.port))
+        sock.listen(1024)
+        sock.setblocking(False)
+        return sock
+
+    def preload(self):
+        """Load the model in the supervisor so workers inherit it copy-on-write."""
+        import torch
+        from ner_service import load_batch_predictor
+
+        # No intra-op thread pool may exist at fork time; each worker sizes its own
+        torch.set_num_threads(1)
+        self.predictor = load_batch_predictor(self.args.model, self.args.backend, self.args.path, 1)
+        # Keep the loaded objects out of the collector, so collections in the
+        # workers do not write to (and so copy) the pages holding them
+        gc.collect()
+        gc.freeze()
+
+    def spawn(self, index, ready_fd=None):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                run_worker(self.args, index, self.cores[index], self.sock, self.predictor, ready_fd)
+            except BaseException as e:
+                print(f"❌ Worker {index} failed: {e}", file=sys.stderr, flush=True)
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = index
+        return pid
+
+    def stop(self, *_):
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def shut_down(self):
+        """Stop every worker and wait for them to exit."""
+        self.stop()
+        while self.workers:
+            try:
+                self.workers.pop(os.wait()[0], None)
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+        self.sock.close()
+
+    def restart_delay(self, index):
+        """Seconds to wait before restarting worker `index`, or None once it is crash-looping."""
+        now = time.monotonic()
+        crashes = [t for t in self.crashes.get(index, []) if now - t < RESTART_WINDOW] + [now]
+        self.crashes[index] = crashes
+        if len(crashes) > self.args.max_restarts:
+            return None
+        return min(MAX_RESTART_BACKOFF, RESTART_BACKOFF * 2 ** (len(crashes) - 1))
+
+    def run(self):
+        self.sock = self.bind()
+        port = self.sock.getsockname()[1]
+        if self.args.share == "prefork":
+            self.preload()
+        ready_read, ready_write = os.pipe()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.args.workers):
+            self.spawn(index, ready_write)
+        # Each worker writes one byte once it serves; the pipe closes early if they all exit first
+        os.close(ready_write)
+        ready = 0
+        while ready < self.args.workers:
+            chunk = os.read(ready_read, self.args.workers)
+            if not chunk:
+                break
+            ready += len(chunk)
+        os.close(ready_read)
+        if ready < self.args.workers:
+            interrupted = self.stopping
+            self.shut_down()
+            if interrupted:
+                return
+            print(f"❌ Only {ready} of {self.args.workers} workers started; stopping", file=sys.stderr, flush=True)
+            sys.exit(1)
+        pinning = ", ".join(f"{cores}" for cores in self.cores) if self.args.pin else "unpinned"
+        print(f"✅ {self.args.workers} workers ({self.args.share}, cores {pinning}) serving MusicNER on "
+              f"http://{self.args.host}:{port}", flush=True)
+
+        while self.workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            index = self.workers.pop(pid, None)
+            if index is None or self.stopping:
+                continue
+            delay = self.restart_delay(index)
+            if delay is None:
+                print(f"❌ Worker {index} crashed {len(self.crashes[index])} times in {RESTART_WINDOW:g}s; stopping",
+                      file=sys.stderr, flush=True)
+                self.shut_down()
+                sys.exit(1)
+            print(f"⚠️  Worker {index} (pid {pid}) exited with status {status}; restarting in {delay:g}s", flush=True)
+            time.sleep(delay)
+            if not self.stopping:
+                self.spawn(index)
+        self.sock.close()
+
+
+def free_port(host):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def bench_setup(args, name, workers, share, pin, threads_per_worker, queries):
+    """Start a supervisor for one setup in a subprocess, load-test it, and measure its memory."""
+    from ner_service import latency_summary, load_test
+
+    port = free_port(args.host)
+    command = [sys.executable, os.path.abspath(__file__), "serve", "--model", args.model, "--backend", args.backend,
+               "--workers", str(workers), "--share", share, "--host", args.host, "--port", str(port),
+               "--max-batch-size", str(args.max_batch_size), "--max-wait-ms", str(args.max_wait_ms),
+               "--cache-entries", "0"]
+    if args.path:
+        command += ["--path", args.path]
+    if not pin:
+        command.append("--no-pin")
+    if threads_per_worker:
+        command += ["--threads-per-worker", str(threads_per_worker)]
+    here = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True, env={**os.environ, "PYTHONPATH": here})
+    # Read the supervisor's output on a thread, so waiting for readiness can time out and the pipe never fills
+    lines = queue.Queue()
+    threading.Thread(target=lambda: [lines.put(line) for line in process.stdout] + [lines.put(None)],
+                     daemon=True).start()
+    try:
+        deadline = time.monotonic() + args.timeout
+        while True:
+            try:
+                line = lines.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise RuntimeError(f"{name}: workers not ready after {args.timeout:g}s")
+            if line is None:
+                raise RuntimeError(f"{name}: the supervisor exited (status {process.wait()}) before its workers were ready")
+            if "serving MusicNER" in line:
+                break
+        idle = host_memory(process.pid)
+        rows = []
+        for concurrency in args.concurrency:
+            try:
+                latencies, elapsed, errors = asyncio.run(asyncio.wait_for(
+                    load_test(args.host, port, queries, concurrency, args.requests), args.timeout))
+            except asyncio.TimeoutError:
+                raise RuntimeError(f"{name}: load test at concurrency {concurrency} took over {args.timeout:g}s")
+            row = {"concurrency": concurrency, **latency_summary(latencies, elapsed), "errors": errors}
+            rows.append(row)
+            print(f"{name:<28} concurrency {concurrency:>4}: {row['qps']:>8.1f} QPS  p50 {row['p50_ms']:>7.2f} ms  "
+                  f"p99 {row['p99_ms']:>7.2f} ms  errors {errors}")
+        loaded = host_memory(process.pid)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return {
+        "setup": name,
+        "workers": workers,
+        "share": share,
+        "pinned": pin,
+        "idle_pss_mb": idle["total_pss_mb"],
+        "pss_mb": loaded["total_pss_mb"],
+        "rss_mb": loaded["total_rss_mb"],
+        "processes": loaded["processes"],
+        "results": rows,
+    }
+
+
+def bench(args):
+    from evaluation import LATENCY_QUERIES
+
+    queries = LATENCY_QUERIES
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    cores = len(os.sched_getaffinity(0))
+    setups = [("single process, all cores", 1, "mmap", False, cores)]
+    shares = ("prefork", "mmap") if args.backend == "pytorch" else ("mmap",)
+    setups += [(f"{args.workers} workers, {share}", args.workers, share, True, None) for share in shares]
+    reports = [bench_setup(args, *setup, queries) for setup in setups]
+
+    baseline = reports[0]
+    print(f"\n{'setup':<28} {'host PSS MB':>12} {'sum RSS MB':>11} " +
+          " ".join(f"{'QPS@' + str(c):>9}" for c in args.concurrency) + f" {'vs single':>10}")
+    for report in reports:
+        best = max(row["qps"] for row in report["results"])
+        report["throughput_vs_single"] = round(best / max(row["qps"] for row in baseline["results"]), 2)
+        report["memory_vs_single"] = round(report["pss_mb"] / baseline["pss_mb"], 2)
+        print(f"{report['setup']:<28} {report['pss_mb']:>12.1f} {report['rss_mb']:>11.1f} " +
+              " ".join(f"{row['qps']:>9.1f}" for row in report["results"]) +
+              f" {report['throughput_vs_single']:>9.2f}x")
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump({"model": args.model, "backend": args.backend, "cores": cores, "requests": args.requests,
+                   "max_batch_size": args.max_batch_size, "max_wait_ms": args.max_wait_ms, "setups": reports},
+                  f, indent=2)
+    print(f"\nReport written to {args.report}")
+    if any(row["errors"] for report in reports for row in report["results"]):
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prefork multi-worker MusicNER serving on CPU.")
+    parser.add_argument("command", choices=("serve", "bench"), help="Run the worker pool, or compare it with one process")
+    parser.add_argument("--model", type=str, default="./model", help="Path to the model directory (default: ./model)")
+    parser.add_argument("--backend", choices=("pytorch", "onnx"), default="pytorch", help="Runtime (default: pytorch)")
+    parser.add_argument("--path", type=str, default=None, help="ONNX file for the onnx backend (default: <model>.onnx)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (default: one per core)")
+    parser.add_argument("--share", choices=SHARE_MODES, default=None,
+                        help="How workers share weights (default: prefork for pytorch, mmap for onnx)")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="Intra-op threads per worker (default: its number of cores)")
+    parser.add_argument("--no-pin", dest="pin", action="store_false", help="Do not pin workers to cores")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="Port to bind (default: 8080)")
+    parser.add_argument("--max-batch-size", type=int, default=32, help="Most queries per model call (default: 32)")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                        help="Longest a query waits for its batch to fill (default: 5)")
+    parser.add_argument("--max-restarts", type=int, default=5,
+                        help=f"Crashes of one worker within {RESTART_WINDOW:g}s before the pool stops (default: 5)")
+    parser.add_argument("--cache-entries", type=int, default=100_000,
+                        help="Results cached per worker; 0 disables the cache (default: 100000)")
+    parser.add_argument("--cache-mb", type=float, default=64, help="Most cached bytes per worker, in MiB (default: 64)")
+    parser.add_argument("--cache-ttl", type=float, default=None, help="Seconds a cached result stays valid (default: forever)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32],
+                        help="bench: concurrent clients per run (default: 8 32)")
+    parser.add_argument("--requests", type=int, default=2000, help="bench: requests per run (default: 2000)")
+    parser.add_argument("--queries", type=str, default=None, help="bench: text file of queries, one per line")
+    parser.add_argument("--report", type=str, default="./supervisor_report.json", help="bench: where to write the report")
+    parser.add_argument("--timeout", type=float, default=300,
+                        help="bench: seconds to wait for the workers to start, and for each load-test run (default: 300)")
+    args = parser.parse_args()
+
+    args.share = args.share or ("prefork" if args.backend == "pytorch" else "mmap")
+    if args.share == "prefork" and args.backend != "pytorch":
+        parser.error("--share prefork needs the pytorch backend; ONNX Runtime sessions do not survive a fork")
+    # Every worker would overwrite a cache file, so caches stay in memory
+    args.cache_path = None
+    args.threads = None
+
+    if args.command == "bench":
+        bench(args)
+    else:
+        Supervisor(args).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import sys
+
+import torch
+
+from compression_check import compare_logits
+from evaluation import cpu_latency, cpu_throughput, entity_f1
+
+# Parity and speed of the runtime backends against eager PyTorch on the BIO
+# test sets: largest logit difference, argmax agreement and entity F1, plus
+# single-query latency and batched throughput. Exits 1 when ONNX logits
+# differ by more than --atol.
+#
+#   python onnx_check.py configs/finetune.json --model ./model
+#   python onnx_check.py configs/finetune.json --coreml ./MusicNER.mlpackage   # macOS only
+
+
+def measure(name, model, tokenizer, tokenized_test, label_list, batch_size, baseline=None):
+    latency = cpu_latency(model, tokenizer)
+    row = {
+        "backend": name,
+        "p50_ms": round(latency["p50_ms"], 3),
+        "p95_ms": round(latency["p95_ms"], 3),
+        "queries_per_second": round(cpu_throughput(model, tokenized_test, batch_size), 1),
+        "entity_f1": round(entity_f1(model, tokenized_test, label_list, batch_size)["f1"], 4),
+    }
+    if baseline is not None:
+        worst, agreement = compare_logits(baseline, model, tokenized_test, batch_size)
+        row["max_logit_difference"] = worst
+        row["argmax_agreement"] = round(agreement, 5)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ONNX Runtime (and Core ML) with eager PyTorch.")
+    parser.add_argument("config", help="train.py JSON config whose test splits are scored")
+    parser.add_argument("--model", type=str, default="./model", help="Fine-tuned model directory (default: ./model)")
+    parser.add_argument("--onnx", type=str, default=None,
+                        help="ONNX model (default: <model>.onnx, exported when missing)")
+    parser.add_argument("--coreml", type=str, default=None, help="Also compare this .mlpackage (macOS only)")
+    parser.add_argument("--atol", type=float, default=1e-4, help="Largest allowed ONNX logit difference (default: 1e-4)")
+    parser.add_argument("--batch-size", type=int, default=32, help="Batch size for parity and throughput (default: 32)")
+    parser.add_argument("--threads", type=int, default=None, help="Threads for every backend (default: torch's)")
+    parser.add_argument("--report", type=str, default="./onnx_report.json", help="Where to write the report")
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+    from bio_data import LABEL_LIST, list_dataset_dirs, load_bio_splits
+    from inference import load_backend
+    from tokenized_data import tokenize_dataset
+    from train import load_config
+
+    config = load_config(args.config, [])
+    dataset_dirs = list(config["dataset_dirs"]) + list_dataset_dirs(config["base_dataset_dirs"])
+    _, test_dataset = load_bio_splits(dataset_dirs, LABEL_LIST)
+    if test_dataset is None or len(test_dataset) == 0:
+        print("❌ Error: No testing data was loaded. Please check the dataset paths. Exiting.")
+        sys.exit(1)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    tokenized_test = tokenize_dataset(test_dataset, tokenizer)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    threads = torch.get_num_threads()
+
+    baseline = load_backend(args.model, "pytorch")
+    rows = [measure("pytorch eager", baseline, tokenizer, tokenized_test, LABEL_LIST, args.batch_size)]
+    onnx_model = load_backend(args.model, "onnx", args.onnx, threads, tokenizer)
+    rows.append(measure("onnxruntime", onnx_model, tokenizer, tokenized_test, LABEL_LIST, args.batch_size, baseline))
+    if args.coreml:
+        if sys.platform == "darwin":
+            coreml_model = load_backend(args.model, "coreml", args.coreml, tokenizer=tokenizer)
+            rows.append(measure("coreml", coreml_model, tokenizer, tokenized_test, LABEL_LIST, args.batch_size, baseline))
+        else:
+            print("⚠️  Skipping Core ML: predictions need macOS.")
+
+    eager = rows[0]
+    print(f"\n{'backend':<14} {'p50 ms':>8} {'p95 ms':>8} {'queries/s':>10} {'speedup':>8} {'entity F1':>10} "
+          f"{'max |Δlogit|':>13} {'argmax agree':>13}")
+    for row in rows:
+        row["throughput_speedup"] = round(row["queries_per_second"] / eager["queries_per_second"], 2)
+        parity = (f"{row['max_logit_difference']:>13.2e} {row['argmax_agreement']:>13.2%}"
+                  if "max_logit_difference" in row else f"{'-':>13} {'-':>13}")
+        print(f"{row['backend']:<14} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['queries_per_second']:>10.1f} "
+              f"{row['throughput_speedup']:>7.2f}x {row['entity_f1']:>10.4f} {parity}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.report)), exist_ok=True)
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump({"model": args.model, "threads": threads, "batch_size": args.batch_size, "atol": args.atol,
+                   "backends": rows}, f, indent=2)
+    print(f"\nReport written to {args.report}")
+    # Core ML runs in fp16 by default, so only ONNX is held to --atol
+    if rows[1]["max_logit_difference"] > args.atol:
+        print(f"❌ ONNX logits differ from PyTorch by {rows[1]['max_logit_difference']:.2e} (> {args.atol})")
+        sys.exit(1)
+    print(f"✅ ONNX Runtime matches PyTorch within {args.atol}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import os
+
+import numpy
+import torch
+from transformers.modeling_outputs import TokenClassifierOutput
+
+# ONNX export of the token classifier with dynamic batch and sequence axes,
+# and a thin ONNX Runtime wrapper that can stand in for the PyTorch model in
+# evaluation.py (it is called with input_ids/attention_mask and returns .logits).
+#
+#   python onnx_export.py --model ./model --output ./MusicNER.onnx
+
+INPUT_NAMES = ["input_ids", "attention_mask"]
+OUTPUT_NAMES = ["logits"]
+DYNAMIC_AXES = {name: {0: "batch", 1: "sequence"} for name in INPUT_NAMES + OUTPUT_NAMES}
+OPSET_VERSION = 17
+
+
+def export_onnx(model, tokenizer, output_path, opset_version=OPSET_VERSION):
+    """Export `model` (any module returning logits first) to ONNX with dynamic batch/sequence axes."""
+    sample = tokenizer(["play music by a new artist", "play Hey Jude"], padding=True, return_tensors="pt")
+    model.eval()
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with torch.inference_mode():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            output_path,
+            input_names=INPUT_NAMES,
+            output_names=OUTPUT_NAMES,
+            dynamic_axes=DYNAMIC_AXES,
+            opset_version=opset_version,
+            dynamo=False,
+        )
+    return output_path
+
+
+class OnnxRuntimeModel:
+    """An ONNX Runtime session called like the PyTorch token classifier."""
+
+    def __init__(self, model_path, num_threads=None):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads or torch.get_num_threads()
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, input_ids, attention_mask):
+        logits = self.session.run(OUTPUT_NAMES, {
+            "input_ids": numpy.asarray(input_ids, dtype=numpy.int64),
+            "attention_mask": numpy.asarray(attention_mask, dtype=numpy.int64),
+        })[0]
+        return TokenClassifierOutput(logits=torch.from_numpy(logits))
+
+    def eval(self):
+        return self
+
+
+def main():
+    from transformers import AutoTokenizer
+    from prune import load_model
+
+    parser = argparse.ArgumentParser(description="Export the token classifier to ONNX.")
+    parser.add_argument("--model", type=str, default="./model", help="Path to the model directory (default: ./model)")
+    parser.add_argument("--output", type=str, default="./MusicNER.onnx", help="Output .onnx path")
+    parser.add_argument("--opset", type=int, default=OPSET_VERSION, help=f"ONNX opset (default: {OPSET_VERSION})")
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = load_model(args.model, torchscript=True)
+    export_onnx(model, tokenizer, args.output, args.opset)
+    print(f"✅ ONNX model saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import torch
+from transformers import Trainer
+
+# Sequence packing for fine-tuning on short music queries: several tokenized
+# queries share one sequence, each with its own position IDs and a
+# block-diagonal attention mask so no query attends across a boundary.
+#
+# Use pack_dataset() on the tokenized train/test datasets, PackedDataCollator
+# as the data collator and PackedTrainer in place of Trainer. Requires a
+# transformers version whose DistilBERT accepts `position_ids` and 4D masks.
+
+
+def pack_examples(lengths, max_length):
+    """
+    Group example indices into packs of at most `max_length` tokens.
+
+    Best-fit decreasing: longest examples first, each into the fullest pack
+    that still has room. Examples longer than `max_length` get a pack of
+    their own.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    packs = []
+    # open_packs[room] holds indices of packs with exactly `room` tokens free
+    open_packs = [[] for _ in range(max_length + 1)]
+    for i in order:
+        length = lengths[i]
+        if length >= max_length:
+            packs.append([i])
+            continue
+        room = next((r for r in range(length, max_length + 1) if open_packs[r]), None)
+        if room is None:
+            pack_index = len(packs)
+            packs.append([i])
+            room = max_length
+        else:
+            pack_index = open_packs[room].pop()
+            packs[pack_index].append(i)
+        remaining = room - length
+        if remaining > 0:
+            open_packs[remaining].append(pack_index)
+    return packs
+
+
+def pack_dataset(dataset, max_length=128):
+    """
+    Pack a tokenized dataset (`input_ids`, `labels`) into multi-query sequences.
+
+    Each packed row has `input_ids` and `labels` concatenated per segment,
+    `position_ids` restarting at 0 for every segment, and `segment_ids`
+    numbering the segments from 1 (0 is reserved for padding).
+    """
+    from datasets import Dataset
+
+    input_ids = dataset["input_ids"]
+    labels = dataset["labels"]
+    packed = {"input_ids": [], "labels": [], "position_ids": [], "segment_ids": []}
+    for pack in pack_examples([len(ids) for ids in input_ids], max_length):
+        row = {key: [] for key in packed}
+        for segment, i in enumerate(pack, start=1):
+            length = len(input_ids[i])
+            row["input_ids"].extend(input_ids[i])
+            row["labels"].extend(labels[i])
+            row["position_ids"].extend(range(length))
+            row["segment_ids"].extend([segment] * length)
+        for key, values in row.items():
+            packed[key].append(values)
+    return Dataset.from_dict(packed)
+
+
+class PackedDataCollator:
+    """Pads packed rows to the longest in the batch; padding gets segment 0 and label -100."""
+
+    def __init__(self, tokenizer, pad_to_multiple_of=None):
+        self.pad_token_id = tokenizer.pad_token_id
+        self.pad_to_multiple_of = pad_to_multiple_of
+
+    def __call__(self, features):
+        length = max(len(f["input_ids"]) for f in features)
+        if self.pad_to_multiple_of:
+            length = -(-length // self.pad_to_multiple_of) * self.pad_to_multiple_of
+        padding_values = {"input_ids": self.pad_token_id, "labels": -100, "position_ids": 0, "segment_ids": 0}
+        batch = {}
+        for key, pad_value in padding_values.items():
+            batch[key] = torch.tensor(
+                [list(f[key]) + [pad_value] * (length - len(f[key])) for f in features],
+                dtype=torch.long,
+            )
+        return batch
+
+
+def block_diagonal_mask(segment_ids, attn_implementation="sdpa", dtype=torch.float32):
+    """
+    (batch, 1, seq, seq) mask letting each token attend only within its segment.
+
+    Boolean for SDPA, additive (0 / dtype minimum) for eager attention.
+    Padding positions attend to themselves so no softmax row is empty.
+    """
+    same_segment = segment_ids[:, :, None] == segment_ids[:, None, :]
+    real = (segment_ids > 0)[:, :, None] & (segment_ids > 0)[:, None, :]
+    diagonal = torch.eye(segment_ids.shape[1], dtype=torch.bool, device=segment_ids.device)
+    allowed = ((same_segment & real) | diagonal)[:, None, :, :]
+    if attn_implementation == "eager":
+        mask = torch.zeros(allowed.shape, dtype=dtype, device=segment_ids.device)
+        return mask.masked_fill(~allowed, torch.finfo(dtype).min)
+    return allowed
+
+
+class PackedTrainer(Trainer):
+    """Trainer that turns the `segment_ids` of packed batches into a block-diagonal attention mask."""
+
+    def _set_signature_columns_if_needed(self):
+        super()._set_signature_columns_if_needed()
+        if "segment_ids" not in self._signature_columns:
+            self._signature_columns = list(self._signature_columns) + ["segment_ids"]
+
+    def _prepare_inputs(self, inputs):
+        inputs = super()._prepare_inputs(inputs)
+        segment_ids = inputs.pop("segment_ids", None)
+        if segment_ids is not None:
+            model = self.accelerator.unwrap_model(self.model)
+            inputs["attention_mask"] = block_diagonal_mask(
+                segment_ids, model.config._attn_implementation, model.dtype
+            )
+        return inputs
+
+
+def packed_logits(model, packed_batch):
+    """Run a model on a collated packed batch and return its logits."""
+    mask = block_diagonal_mask(packed_batch["segment_ids"], model.config._attn_implementation, model.dtype)
+    with torch.inference_mode():
+        return model(
+            input_ids=packed_batch["input_ids"], attention_mask=mask, position_ids=packed_batch["position_ids"]
+        ).logits
+
+
+if __name__ == "__main__":
+    # Check packed and unpacked forward passes agree, and count forward passes per epoch
+    import argparse
+    from transformers import AutoTokenizer, AutoModelForTokenClassification
+    from bio_data import load_bio_dataset
+    from tokenized_data import tokenize_dataset
+
+    parser = argparse.ArgumentParser(description="Verify sequence packing against unpacked inference.")
+    parser.add_argument("bio_file", help="A tokenizable .bio/.IOB file, e.g. data/dataset1/test.bio")
+    parser.add_argument("--model", type=str, default="./model", help="Path to the model directory (default: ./model)")
+    parser.add_argument("--max-length", type=int, default=128, help="Tokens per packed sequence (default: 128)")
+    parser.add_argument("--batch-size", type=int, default=16, help="Rows per forward pass (default: 16)")
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForTokenClassification.from_pretrained(args.model).eval()
+    dataset = tokenize_dataset(load_bio_dataset(args.bio_file), tokenizer)
+    packs = pack_examples([len(ids) for ids in dataset["input_ids"]], args.max_length)
+    packed = pack_dataset(dataset, args.max_length)
+    collator = PackedDataCollator(tokenizer)
+
+    worst = 0.0
+    for pack_index, pack in enumerate(packs):
+        logits = packed_logits(model, collator([packed[pack_index]]))[0]
+        offset = 0
+        for i in pack:
+            ids = torch.tensor([dataset[i]["input_ids"]])
+            with torch.inference_mode():
+                expected = model(input_ids=ids).logits[0]
+            worst = max(worst, (logits[offset:offset + len(expected)] - expected).abs().max().item())
+            offset += len(expected)
+
+    unpacked_passes = -(-len(dataset) // args.batch_size)
+    packed_passes = -(-len(packed) // args.batch_size)
+    print(f"\nMax |logit difference| packed vs unpacked: {worst:.2e}")
+    print(f"{len(dataset)} examples -> {len(packed)} packed sequences of up to {args.max_length} tokens")
+    print(f"Forward passes per epoch at batch size {args.batch_size}: {unpacked_passes} unpacked, {packed_passes} packed "
+          f"({unpacked_passes / packed_passes:.1f}x fewer)")
@@ -0,0 +1,297 @@
+import argparse
+import json
+import os
+import time
+
+import torch
+from torch import nn
+
+from adapters import transformer_layers
+from evaluation import cpu_latency, entity_f1
+
+# Structured pruning of the fine-tuned token classifier: attention heads and
+# feed-forward neurons are scored by first-order (Taylor) importance on a dev
+# slice held out from the training data (--dev-fraction) and physically
+# removed, so the remaining matrices are smaller and FLOPs fall. Each round
+# prunes, optionally recovers with a short fine-tune on the rest of the
+# training data, and reports entity-F1 and latency deltas on the test set
+# against the unpruned model.
+#
+#   python prune.py configs/finetune.json --model ./model --output ./model_pruned \
+#       --head-fraction 0.25 --ffn-fraction 0.3 --rounds 2 --recovery-epochs 1
+#
+# Pruned layers differ in size, which a DistilBERT config cannot express, so
+# the kept sizes go into config.json as "pruned_shapes"; load_model() rebuilds
+# them (export_coreml.py uses it).
+
+PRUNED_SHAPES = "pruned_shapes"
+
+
+def _linear(linear, index, dim):
+    """A copy of `linear` keeping only `index` along its output (dim 0) or input (dim 1) features."""
+    weight = linear.weight.index_select(dim, index).detach().clone()
+    bias = linear.bias
+    if bias is not None and dim == 0:
+        bias = bias.index_select(0, index)
+    pruned = nn.Linear(weight.shape[1], weight.shape[0], bias=bias is not None,
+                       device=weight.device, dtype=weight.dtype)
+    pruned.weight.data.copy_(weight)
+    if bias is not None:
+        pruned.bias.data.copy_(bias.detach())
+    return pruned
+
+
+def prune_heads(attention, keep):
+    """Keep only the heads numbered in `keep` in a DistilBERT self-attention module."""
+    size = attention.attention_head_size
+    index = torch.cat([torch.arange(h * size, (h + 1) * size) for h in sorted(keep)])
+    for name in ("q_lin", "k_lin", "v_lin"):
+        setattr(attention, name, _linear(getattr(attention, name), index, 0))
+    attention.out_lin = _linear(attention.out_lin, index, 1)
+    attention.n_heads = len(keep)
+
+
+def prune_ffn(ffn, keep):
+    """Keep only the intermediate neurons in `keep` of a DistilBERT feed-forward module."""
+    index = torch.tensor(sorted(keep))
+    ffn.lin1 = _linear(ffn.lin1, index, 0)
+    ffn.lin2 = _linear(ffn.lin2, index, 1)
+
+
+def pruned_shapes(model):
+    layers = transformer_layers(model)
+    return {
+        "heads": [layer.attention.q_lin.out_features // layer.attention.attention_head_size for layer in layers],
+        "ffn": [layer.ffn.lin1.out_features for layer in layers],
+    }
+
+
+def apply_shapes(model, shapes):
+    """Shrink a freshly built model to saved pruned sizes (weights are loaded afterwards)."""
+    for layer, heads, ffn_dim in zip(transformer_layers(model), shapes["heads"], shapes["ffn"]):
+        prune_heads(layer.attention, range(heads))
+        prune_ffn(layer.ffn, range(ffn_dim))
+
+
+def load_model(model_path, **kwargs):
+    """AutoModelForTokenClassification.from_pretrained that also restores pruned layer sizes."""
+    from safetensors.torch import load_file
+    from transformers import AutoConfig, AutoModelForTokenClassification
+
+    if kwargs.pop("torchscript", False):
+        # Tuple outputs for torch.jit.trace; transformers 5 no longer accepts `torchscript`
+        kwargs["return_dict"] = False
+    config = AutoConfig.from_pretrained(model_path, **kwargs)
+    shapes = getattr(config, PRUNED_SHAPES, None)
+    if not shapes:
+        return AutoModelForTokenClassification.from_pretrained(model_path, **kwargs)
+    model = AutoModelForTokenClassification.from_config(config)
+    apply_shapes(model, shapes)
+    state = load_file(os.path.join(model_path, "model.safetensors"))
+    missing, unexpected = model.load_state_dict(state, strict=False)
+    # Tied or derived parameters may be absent from the file; anything else is an error
+    if unexpected or any("transformer.layer" in name for name in missing):
+        raise ValueError(f"Pruned weights do not match {PRUNED_SHAPES} in {model_path}: "
+                         f"missing {missing[:5]}, unexpected {unexpected[:5]}")
+    return model.eval()
+
+
+def save_model(model, tokenizer, output_path):
+    setattr(model.config, PRUNED_SHAPES, pruned_shapes(model))
+    model.save_pretrained(output_path)
+    tokenizer.save_pretrained(output_path)
+
+
+def importance_scores(model, tokenized_dataset, data_collator, batch_size=32):
+    """
+    Per-layer head and FFN-neuron importance, |sum over tokens of activation x gradient|.
+
+    Heads are scored at the input of out_lin, neurons at the input of lin2,
+    accumulated over the dev set. Head scores are L2-normalised per layer so
+    they compare across layers.
+    """
+    layers = transformer_layers(model)
+    head_scores = [torch.zeros(layer.attention.q_lin.out_features // layer.attention.attention_head_size)
+                   for layer in layers]
+    ffn_scores = [torch.zeros(layer.ffn.lin1.out_features) for layer in layers]
+    captured = {}
+
+    def capture(key):
+        def hook(module, inputs):
+            activation = inputs[0]
+            activation.register_hook(lambda grad: captured.__setitem__(key, (activation.detach(), grad.detach())))
+        return hook
+
+    handles = []
+    for i, layer in enumerate(layers):
+        handles.append(layer.attention.out_lin.register_forward_pre_hook(capture(("head", i))))
+        handles.append(layer.ffn.lin2.register_forward_pre_hook(capture(("ffn", i))))
+
+    model.eval()
+    columns = ["input_ids", "attention_mask", "labels"]
+    try:
+        for start in range(0, len(tokenized_dataset), batch_size):
+            rows = tokenized_dataset[start:start + batch_size]
+            features = [{key: rows[key][i] for key in columns if key in rows} for i in range(len(rows["input_ids"]))]
+            batch = data_collator(features)
+            model.zero_grad()
+            model(**batch).loss.backward()
+            for i, layer in enumerate(layers):
+                activation, grad = captured[("head", i)]
+                size = layer.attention.attention_head_size
+                contribution = (activation * grad).sum(dim=(0, 1))
+                head_scores[i] += contribution.view(-1, size).sum(-1).abs()
+                activation, grad = captured[("ffn", i)]
+                ffn_scores[i] += (activation * grad).sum(dim=(0, 1)).abs()
+    finally:
+        for handle in handles:
+            handle.remove()
+        model.zero_grad()
+    head_scores = [scores / (scores.norm() + 1e-12) for scores in head_scores]
+    return head_scores, ffn_scores
+
+
+def prune_model(model, head_scores, ffn_scores, head_fraction, ffn_fraction):
+    """
+    Physically remove the least important heads (ranked across all layers)
+    and the least important `ffn_fraction` of neurons in every layer.
+    Each layer keeps at least one head and one neuron.
+    """
+    layers = transformer_layers(model)
+    ranked = sorted((float(score), i, h) for i, scores in enumerate(head_scores) for h, score in enumerate(scores))
+    remove = {i: set() for i in range(len(layers))}
+    for _, i, h in ranked[:int(len(ranked) * head_fraction)]:
+        if len(remove[i]) < len(head_scores[i]) - 1:
+            remove[i].add(h)
+
+    for i, layer in enumerate(layers):
+        heads = len(head_scores[i])
+        if remove[i]:
+            prune_heads(layer.attention, [h for h in range(heads) if h not in remove[i]])
+        neurons = len(ffn_scores[i])
+        keep_count = max(1, neurons - int(neurons * ffn_fraction))
+        if keep_count < neurons:
+            prune_ffn(layer.ffn, torch.topk(ffn_scores[i], keep_count).indices.tolist())
+    return model
+
+
+def measure(model, tokenizer, tokenized_test, label_list):
+    model.eval()
+    latency = cpu_latency(model, tokenizer)
+    return {
+        "parameters": sum(p.numel() for p in model.parameters()),
+        "entity_f1": round(entity_f1(model, tokenized_test, label_list)["f1"], 4),
+        "p50_ms": round(latency["p50_ms"], 3),
+        **pruned_shapes(model),
+    }
+
+
+def recover(model, config, tokenizer, tokenized_train, tokenized_test, epochs, output_dir):
+    """Short fine-tune of the pruned model on the training set (minus the dev slice)."""
+    from transformers import TrainingArguments, DataCollatorForTokenClassification
+    from batching import TokenBudgetTrainer
+
+    training_args = TrainingArguments(
+        output_dir=output_dir,
+        save_strategy="no",
+        learning_rate=config["learning_rate"],
+        num_train_epochs=epochs,
+        weight_decay=config["weight_decay"],
+        logging_steps=config["logging_steps"],
+        seed=config["seed"],
+        use_cpu=True,
+        bf16=config["bf16"],
+        dataloader_num_workers=config["dataloader_num_workers"],
+        report_to=[],
+    )
+    TokenBudgetTrainer(
+        model=model,
+        args=training_args,
+        train_dataset=tokenized_train,
+        eval_dataset=tokenized_test,
+        data_collator=DataCollatorForTokenClassification(tokenizer),
+        max_tokens=config["max_tokens"],
+    ).train()
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prune attention heads and FFN neurons of the MusicNER model.")
+    parser.add_argument("config", help="train.py JSON config supplying data and fine-tuning settings")
+    parser.add_argument("--model", type=str, default="./model", help="Fine-tuned model directory (default: ./model)")
+    parser.add_argument("--output", type=str, default="./model_pruned", help="Where to save the pruned model")
+    parser.add_argument("--head-fraction", type=float, default=0.25,
+                        help="Share of remaining heads removed per round, ranked across layers (default: 0.25)")
+    parser.add_argument("--ffn-fraction", type=float, default=0.25,
+                        help="Share of remaining FFN neurons removed per layer per round (default: 0.25)")
+    parser.add_argument("--rounds", type=int, default=1, help="Prune/recover rounds (default: 1)")
+    parser.add_argument("--recovery-epochs", type=float, default=1,
+                        help="Fine-tuning epochs after each round, 0 to skip (default: 1)")
+    parser.add_argument("--dev-fraction", type=float, default=0.1,
+                        help="Share of the training data held out to score importance; the test set only "
+                             "reports F1 (default: 0.1)")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE",
+                        help="Override a config value, as in train.py")
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer, DataCollatorForTokenClassification
+    from bio_data import LABEL_LIST, list_dataset_dirs, load_bio_splits
+    from tokenized_data import tokenize_dataset
+    from train import configure_threads, load_config
+
+    config = load_config(args.config, args.overrides)
+    configure_threads(config)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = load_model(args.model)
+    dataset_dirs = list(config["dataset_dirs"]) + list_dataset_dirs(config["base_dataset_dirs"])
+    train_dataset, test_dataset = load_bio_splits(dataset_dirs, LABEL_LIST)
+    if not train_dataset or not test_dataset:
+        print("❌ Error: No training or testing data was loaded. Please check the dataset paths. Exiting.")
+        return
+    split = train_dataset.train_test_split(test_size=args.dev_fraction, seed=config["seed"])
+    tokenized_train = tokenize_dataset(split["train"], tokenizer)
+    tokenized_dev = tokenize_dataset(split["test"], tokenizer)
+    tokenized_test = tokenize_dataset(test_dataset, tokenizer)
+    data_collator = DataCollatorForTokenClassification(tokenizer)
+
+    baseline = measure(model, tokenizer, tokenized_test, LABEL_LIST)
+    steps = [{"step": "baseline", **baseline}]
+
+    def report(step):
+        result = {"step": step, **measure(model, tokenizer, tokenized_test, LABEL_LIST)}
+        result["f1_delta"] = round(result["entity_f1"] - baseline["entity_f1"], 4)
+        result["latency_delta"] = round(result["p50_ms"] / baseline["p50_ms"] - 1, 4)
+        steps.append(result)
+        print(f"{step}: {result['parameters']:,} parameters, heads {result['heads']}, "
+              f"entity F1 {result['entity_f1']:.4f} ({result['f1_delta']:+.4f}), "
+              f"p50 {result['p50_ms']:.2f} ms ({result['latency_delta']:+.1%})")
+
+    print(f"baseline: {baseline['parameters']:,} parameters, entity F1 {baseline['entity_f1']:.4f}, "
+          f"p50 {baseline['p50_ms']:.2f} ms")
+    for round_index in range(1, args.rounds + 1):
+        start = time.perf_counter()
+        head_scores, ffn_scores = importance_scores(model, tokenized_dev, data_collator)
+        prune_model(model, head_scores, ffn_scores, args.head_fraction, args.ffn_fraction)
+        print(f"\nRound {round_index}: scored and pruned in {time.perf_counter() - start:.1f}s")
+        report(f"round {round_index} pruned")
+        if args.recovery_epochs:
+            recover(model, config, tokenizer, tokenized_train, tokenized_test, args.recovery_epochs,
+                    os.path.join(args.output, "recovery"))
+            report(f"round {round_index} recovered")
+
+    save_model(model, tokenizer, args.output)
+    report_path = os.path.join(args.output, "prune_report.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "model": args.model,
+            "head_fraction": args.head_fraction,
+            "ffn_fraction": args.ffn_fraction,
+            "recovery_epochs": args.recovery_epochs,
+            "dev_fraction": args.dev_fraction,
+            "steps": steps,
+        }, f, indent=2)
+    print(f"\n✅ Pruned model saved to '{args.output}'; report written to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
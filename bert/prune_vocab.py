@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import Counter
+
+import torch
+from torch import nn
+
+from evaluation import model_size_bytes
+
+# Domain vocabulary pruning: count which word-pieces the training corpora and
+# the Apple Music catalog names actually use, keep only those (plus special
+# tokens and single characters as a fallback), and rebuild the tokenizer and
+# embedding matrix with the surviving IDs renumbered in their original order.
+#
+# WordPiece tokenizes greedily by longest match, so any input whose pieces
+# were all kept tokenizes to the same pieces as before; the script checks
+# that those inputs get identical predictions and reports size and cold-load
+# time before and after.
+#
+#   python prune_vocab.py configs/finetune.json --model ./model --output ./model_small_vocab \
+#       --feed ../apple-music-feed/songs.parquet
+
+CATALOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "apple-music-feed")
+
+
+def catalog_texts(feed_path, limit=None):
+    """Song, artist and album names from an Apple Music parquet feed."""
+    sys.path.insert(0, CATALOG_DIR)
+    from catalog import Catalog
+
+    texts = set()
+    for song in Catalog.from_feed(feed_path, limit=limit):
+        texts.update(text for text in (song.name, song.artist, song.album) if text)
+    return sorted(texts)
+
+
+def count_tokens(tokenizer, word_sequences=(), texts=(), batch_size=1000):
+    """Counter of token IDs over pre-split BIO sentences and raw catalog texts."""
+    counts = Counter()
+    word_sequences, texts = list(word_sequences), list(texts)
+    for start in range(0, len(word_sequences), batch_size):
+        encoded = tokenizer(word_sequences[start:start + batch_size], is_split_into_words=True)
+        for ids in encoded["input_ids"]:
+            counts.update(ids)
+    for start in range(0, len(texts), batch_size):
+        for ids in tokenizer(texts[start:start + batch_size])["input_ids"]:
+            counts.update(ids)
+    return counts
+
+
+def kept_token_ids(tokenizer, counts, min_count=1, keep_characters=True):
+    """Sorted old IDs to keep: used tokens, special tokens and optionally every single character."""
+    vocab = tokenizer.get_vocab()
+    prefix = tokenizer.backend_tokenizer.model.continuing_subword_prefix
+    kept = {token_id for token_id, count in counts.items() if count >= min_count}
+    kept.update(tokenizer.all_special_ids)
+    if keep_characters:
+        kept.update(i for token, i in vocab.items() if len(token.removeprefix(prefix)) == 1)
+    return sorted(kept)
+
+
+def remap_tokenizer_json(tokenizer_json, old_to_new, id_to_token):
+    """Rewrite a WordPiece tokenizer.json (as a dict) to the kept, renumbered vocabulary."""
+    tokenizer_json["model"]["vocab"] = {id_to_token[old]: new for old, new in old_to_new.items()}
+    for added in tokenizer_json.get("added_tokens") or []:
+        added["id"] = old_to_new[added["id"]]
+    post_processor = tokenizer_json.get("post_processor") or {}
+    processors = post_processor.get("processors", [post_processor])
+    for processor in processors:
+        for special in (processor.get("special_tokens") or {}).values():
+            special["ids"] = [old_to_new[i] for i in special["ids"]]
+        for key in ("cls", "sep"):
+            if isinstance(processor.get(key), list):
+                processor[key][1] = old_to_new[processor[key][1]]
+    if tokenizer_json.get("padding"):
+        tokenizer_json["padding"]["pad_id"] = old_to_new[tokenizer_json["padding"]["pad_id"]]
+    return tokenizer_json
+
+
+def save_pruned_tokenizer(tokenizer, kept_ids, output_path):
+    """Save `tokenizer` to `output_path` reduced to `kept_ids`, and return the reloaded tokenizer."""
+    from transformers import AutoTokenizer
+
+    old_to_new = {old: new for new, old in enumerate(kept_ids)}
+    id_to_token = {i: token for token, i in tokenizer.get_vocab().items()}
+    tokenizer.save_pretrained(output_path)
+
+    tokenizer_json = json.loads(tokenizer.backend_tokenizer.to_str())
+    with open(os.path.join(output_path, "tokenizer.json"), 'w', encoding='utf-8') as f:
+        json.dump(remap_tokenizer_json(tokenizer_json, old_to_new, id_to_token), f, ensure_ascii=False)
+
+    vocab_path = os.path.join(output_path, "vocab.txt")
+    if os.path.exists(vocab_path):
+        with open(vocab_path, 'w', encoding='utf-8') as f:
+            f.writelines(f"{id_to_token[old]}\n" for old in kept_ids)
+
+    config_path = os.path.join(output_path, "tokenizer_config.json")
+    with open(config_path, 'r', encoding='utf-8') as f:
+        tokenizer_config = json.load(f)
+    if "added_tokens_decoder" in tokenizer_config:
+        tokenizer_config["added_tokens_decoder"] = {
+            str(old_to_new[int(i)]): token for i, token in tokenizer_config["added_tokens_decoder"].items()
+        }
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(tokenizer_config, f, indent=2, ensure_ascii=False)
+    return AutoTokenizer.from_pretrained(output_path)
+
+
+def prune_embeddings(model, kept_ids, new_pad_id):
+    """Keep only the rows of the input embedding matrix for `kept_ids`, in order."""
+    old = model.get_input_embeddings()
+    embeddings = nn.Embedding(len(kept_ids), old.embedding_dim, padding_idx=new_pad_id,
+                              device=old.weight.device, dtype=old.weight.dtype)
+    with torch.no_grad():
+        embeddings.weight.copy_(old.weight[torch.tensor(kept_ids)])
+    model.set_input_embeddings(embeddings)
+    model.config.vocab_size = len(kept_ids)
+    model.config.pad_token_id = new_pad_id
+    return model
+
+
+def verify_predictions(old_model, old_tokenizer, new_model, new_tokenizer, word_sequences, old_to_new, batch_size=64):
+    """
+    Compare the original and pruned models on BIO sentences whose pieces were all kept.
+
+    Returns coverage, whether every covered sentence tokenized to the remapped
+    original IDs, and the largest logit difference and prediction mismatches.
+    """
+    covered = token_mismatches = prediction_mismatches = 0
+    worst = 0.0
+    for start in range(0, len(word_sequences), batch_size):
+        chunk = word_sequences[start:start + batch_size]
+        old_ids = old_tokenizer(chunk, is_split_into_words=True, truncation=True)["input_ids"]
+        new_ids = new_tokenizer(chunk, is_split_into_words=True, truncation=True)["input_ids"]
+        pairs = [(old, new) for old, new in zip(old_ids, new_ids) if all(i in old_to_new for i in old)]
+        if not pairs:
+            continue
+        covered += len(pairs)
+        token_mismatches += sum([old_to_new[i] for i in old] != new for old, new in pairs)
+        length = max(len(old) for old, _ in pairs)
+        old_batch = torch.full((len(pairs), length), old_tokenizer.pad_token_id)
+        new_batch = torch.full((len(pairs), length), new_tokenizer.pad_token_id)
+        mask = torch.zeros((len(pairs), length), dtype=torch.long)
+        for i, (old, new) in enumerate(pairs):
+            old_batch[i, :len(old)] = torch.tensor(old)
+            new_batch[i, :len(new)] = torch.tensor(new)
+            mask[i, :len(old)] = 1
+        with torch.inference_mode():
+            old_logits = old_model(input_ids=old_batch, attention_mask=mask)[0]
+            new_logits = new_model(input_ids=new_batch, attention_mask=mask)[0]
+        real = mask.bool()
+        worst = max(worst, (old_logits - new_logits)[real].abs().max().item())
+        prediction_mismatches += int((old_logits.argmax(-1) != new_logits.argmax(-1))[real].sum())
+    return {
+        "sentences": len(word_sequences),
+        "covered": covered,
+        "coverage": round(covered / len(word_sequences), 4) if word_sequences else 0.0,
+        "token_mismatches": token_mismatches,
+        "prediction_mismatches": prediction_mismatches,
+        "max_logit_difference": worst,
+    }
+
+
+def cold_load_seconds(model_path, runs=3):
+    """Best-of-`runs` time to load tokenizer and model in a fresh interpreter (imports excluded)."""
+    script = (
+        "import sys, time\n"
+        "from transformers import AutoTokenizer\n"
+        "from prune import load_model\n"
+        "start = time.perf_counter()\n"
+        "AutoTokenizer.from_pretrained(sys.argv[1]); load_model(sys.argv[1])\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", script, model_path], check=True, capture_output=True,
+                                text=True, env={**os.environ, "PYTHONPATH": here}).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prune the tokenizer vocabulary to the word-pieces music queries use.")
+    parser.add_argument("config", help="train.py JSON config naming the training corpora")
+    parser.add_argument("--model", type=str, default="./model", help="Fine-tuned model directory (default: ./model)")
+    parser.add_argument("--output", type=str, default="./model_small_vocab", help="Where to save the pruned model")
+    parser.add_argument("--feed", action="append", default=[], help="Apple Music parquet feed to count names from")
+    parser.add_argument("--feed-limit", type=int, default=None, help="Read at most this many songs per feed")
+    parser.add_argument("--min-count", type=int, default=1, help="Keep tokens used at least this often (default: 1)")
+    parser.add_argument("--no-characters", action="store_true",
+                        help="Do not keep every single-character piece as a fallback for unseen words")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE",
+                        help="Override a config value, as in train.py")
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+    from bio_data import LABEL_LIST, list_dataset_dirs, load_bio_splits
+    from prune import load_model
+    from train import load_config
+
+    config = load_config(args.config, args.overrides)
+    dataset_dirs = list(config["dataset_dirs"]) + list_dataset_dirs(config["base_dataset_dirs"])
+    train_dataset, test_dataset = load_bio_splits(dataset_dirs, LABEL_LIST)
+    if train_dataset is None or test_dataset is None:
+        print("❌ Error: No training or testing data was loaded. Please check the dataset paths. Exiting.")
+        sys.exit(1)
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    names = [text for feed in args.feed for text in catalog_texts(feed, args.feed_limit)]
+    print(f"Counting word-pieces over {len(train_dataset)} training sentences and {len(names)} catalog names...")
+    counts = count_tokens(tokenizer, train_dataset["tokens"], names)
+    kept_ids = kept_token_ids(tokenizer, counts, args.min_count, not args.no_characters)
+    old_to_new = {old: new for new, old in enumerate(kept_ids)}
+    print(f"Keeping {len(kept_ids):,} of {len(tokenizer):,} tokens ({len(kept_ids) / len(tokenizer):.1%})")
+
+    model = load_model(args.model).eval()
+    new_tokenizer = save_pruned_tokenizer(tokenizer, kept_ids, args.output)
+    pruned = prune_embeddings(load_model(args.model), kept_ids, old_to_new[tokenizer.pad_token_id]).eval()
+    pruned.save_pretrained(args.output)
+
+    verification = verify_predictions(model, tokenizer, pruned, new_tokenizer, test_dataset["tokens"], old_to_new)
+    # The training sentences were counted, so they are all covered
+    train_check = verify_predictions(model, tokenizer, pruned, new_tokenizer,
+                                     train_dataset.select(range(min(1000, len(train_dataset))))["tokens"], old_to_new)
+    size_before, size_after = model_size_bytes(args.model), model_size_bytes(args.output)
+    load_before, load_after = cold_load_seconds(args.model), cold_load_seconds(args.output)
+
+    report = {
+        "model": args.model,
+        "output": args.output,
+        "feeds": args.feed,
+        "vocab_before": len(tokenizer),
+        "vocab_after": len(kept_ids),
+        "size_mb_before": round(size_before / 1e6, 2),
+        "size_mb_after": round(size_after / 1e6, 2),
+        "cold_load_seconds_before": round(load_before, 3),
+        "cold_load_seconds_after": round(load_after, 3),
+        "test_verification": verification,
+        "train_verification": train_check,
+    }
+    with open(os.path.join(args.output, "vocab_report.json"), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\nVocabulary: {report['vocab_before']:,} -> {report['vocab_after']:,} tokens")
+    print(f"Weights:    {report['size_mb_before']:.2f} MB -> {report['size_mb_after']:.2f} MB")
+    print(f"Cold load:  {report['cold_load_seconds_before']:.3f}s -> {report['cold_load_seconds_after']:.3f}s")
+    print(f"Test sentences covered: {verification['covered']}/{verification['sentences']} "
+          f"({verification['coverage']:.1%}); max |logit difference| {verification['max_logit_difference']:.2e}")
+    failures = sum(check["token_mismatches"] + check["prediction_mismatches"] for check in (verification, train_check))
+    if failures:
+        print(f"❌ {failures} covered inputs tokenized or predicted differently after pruning")
+        sys.exit(1)
+    print(f"✅ Identical tokens and predictions on all covered inputs; saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
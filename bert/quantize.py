@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import sys
+
+import torch
+from torch import nn
+from transformers.modeling_outputs import TokenClassifierOutput
+
+from evaluation import cpu_latency, entity_f1, model_size_bytes
+from onnx_export import OnnxRuntimeModel, export_onnx
+
+# Post-training int8 quantization of the fine-tuned token classifier for the
+# CPU inference path. Produces, next to an fp32 baseline:
+#
+#   model_int8_dynamic.pt     TorchScript, dynamic int8 Linear layers
+#   model.onnx                fp32 ONNX
+#   model_int8_dynamic.onnx   ONNX Runtime dynamic int8
+#   model_int8_static.onnx    ONNX Runtime static int8 (QDQ), calibrated on the BIO test sets
+#
+# and fails (exit code 1) when any variant's entity F1 drops more than
+# --max-f1-drop below fp32.
+#
+#   python quantize.py configs/finetune.json --model ./model --output-dir ./quantized
+
+
+class TracedModel:
+    """A TorchScript (or return_dict=False) token classifier called like the eager model."""
+
+    def __init__(self, module):
+        self.module = module
+
+    @classmethod
+    def load(cls, path):
+        return cls(torch.jit.load(path, map_location="cpu"))
+
+    def __call__(self, input_ids, attention_mask):
+        return TokenClassifierOutput(logits=self.module(input_ids, attention_mask)[0])
+
+    def eval(self):
+        self.module.eval()
+        return self
+
+
+def quantize_dynamic_torch(model):
+    """Dynamic int8 quantization: int8 Linear weights, activations quantized on the fly."""
+    return torch.ao.quantization.quantize_dynamic(model.eval(), {nn.Linear}, dtype=torch.qint8)
+
+
+def save_torchscript(model, tokenizer, output_path):
+    sample = tokenizer("play music by a new artist", return_tensors="pt")
+    with torch.inference_mode():
+        traced = torch.jit.trace(model, (sample["input_ids"], sample["attention_mask"]), check_trace=False)
+    traced = torch.jit.freeze(traced.eval())
+    torch.jit.save(traced, output_path)
+    return output_path
+
+
+class BioCalibrationReader:
+    """onnxruntime CalibrationDataReader over padded batches of a tokenized BIO dataset."""
+
+    def __init__(self, tokenized_dataset, max_examples=256, batch_size=16):
+        import numpy
+
+        rows = tokenized_dataset.select(range(min(max_examples, len(tokenized_dataset))))["input_ids"]
+        self.batches = []
+        for start in range(0, len(rows), batch_size):
+            chunk = rows[start:start + batch_size]
+            length = max(len(ids) for ids in chunk)
+            input_ids = numpy.zeros((len(chunk), length), dtype=numpy.int64)
+            attention_mask = numpy.zeros_like(input_ids)
+            for i, ids in enumerate(chunk):
+                input_ids[i, :len(ids)] = ids
+                attention_mask[i, :len(ids)] = 1
+            self.batches.append({"input_ids": input_ids, "attention_mask": attention_mask})
+        self._iterator = iter(self.batches)
+
+    def get_next(self):
+        return next(self._iterator, None)
+
+    def rewind(self):
+        self._iterator = iter(self.batches)
+
+
+def quantize_onnx_dynamic(fp32_path, output_path):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(fp32_path, output_path, weight_type=QuantType.QInt8)
+    return output_path
+
+
+def quantize_onnx_static(fp32_path, output_path, calibration_reader):
+    """Static int8 of the MatMul/Gemm ops, activation ranges calibrated on `calibration_reader`."""
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+    quantize_static(
+        fp32_path,
+        output_path,
+        calibration_reader,
+        quant_format=QuantFormat.QDQ,
+        op_types_to_quantize=["MatMul", "Gemm"],
+        per_channel=True,
+        weight_type=QuantType.QInt8,
+        activation_type=QuantType.QUInt8,
+    )
+    return output_path
+
+
+def measure(name, model, size_bytes, tokenizer, tokenized_test, label_list):
+    latency = cpu_latency(model, tokenizer)
+    return {
+        "variant": name,
+        "size_mb": round(size_bytes / 1e6, 2),
+        "p50_ms": round(latency["p50_ms"], 3),
+        "p95_ms": round(latency["p95_ms"], 3),
+        "entity_f1": round(entity_f1(model, tokenized_test, label_list)["f1"], 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the MusicNER model to int8 and gate on entity F1.")
+    parser.add_argument("config", help="train.py JSON config whose test splits are used for calibration and F1")
+    parser.add_argument("--model", type=str, default="./model", help="Fine-tuned model directory (default: ./model)")
+    parser.add_argument("--output-dir", type=str, default="./quantized", help="Where artifacts and the report go")
+    parser.add_argument("--max-f1-drop", type=float, default=0.01,
+                        help="Largest allowed entity-F1 drop below fp32 (default: 0.01)")
+    parser.add_argument("--calibration-size", type=int, default=256,
+                        help="Test examples used to calibrate static quantization (default: 256)")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE",
+                        help="Override a config value, as in train.py")
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+    from bio_data import LABEL_LIST, list_dataset_dirs, load_bio_splits
+    from prune import load_model
+    from tokenized_data import tokenize_dataset
+    from train import configure_threads, load_config
+
+    config = load_config(args.config, args.overrides)
+    configure_threads(config)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = load_model(args.model, torchscript=True).eval()
+    dataset_dirs = list(config["dataset_dirs"]) + list_dataset_dirs(config["base_dataset_dirs"])
+    _, test_dataset = load_bio_splits(dataset_dirs, LABEL_LIST)
+    if test_dataset is None or len(test_dataset) == 0:
+        print("❌ Error: No testing data was loaded. Please check the dataset paths. Exiting.")
+        sys.exit(1)
+    tokenized_test = tokenize_dataset(test_dataset, tokenizer)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    tokenizer.save_pretrained(args.output_dir)
+    paths = {name: os.path.join(args.output_dir, name) for name in (
+        "model_int8_dynamic.pt", "model.onnx", "model_int8_dynamic.onnx", "model_int8_static.onnx")}
+
+    print("Quantizing PyTorch Linear layers (dynamic int8)...")
+    save_torchscript(quantize_dynamic_torch(load_model(args.model, torchscript=True)), tokenizer,
+                     paths["model_int8_dynamic.pt"])
+    print("Exporting fp32 ONNX and quantizing it (dynamic and static int8)...")
+    export_onnx(model, tokenizer, paths["model.onnx"])
+    quantize_onnx_dynamic(paths["model.onnx"], paths["model_int8_dynamic.onnx"])
+    quantize_onnx_static(paths["model.onnx"], paths["model_int8_static.onnx"],
+                         BioCalibrationReader(tokenized_test, args.calibration_size))
+
+    print("Measuring latency and entity F1...")
+    rows = [
+        measure("pytorch fp32", TracedModel(model), model_size_bytes(args.model), tokenizer, tokenized_test, LABEL_LIST),
+        measure("pytorch int8 dynamic", TracedModel.load(paths["model_int8_dynamic.pt"]),
+                os.path.getsize(paths["model_int8_dynamic.pt"]), tokenizer, tokenized_test, LABEL_LIST),
+    ]
+    for name, file_name in (("onnx fp32", "model.onnx"), ("onnx int8 dynamic", "model_int8_dynamic.onnx"),
+                            ("onnx int8 static", "model_int8_static.onnx")):
+        rows.append(measure(name, OnnxRuntimeModel(paths[file_name]), os.path.getsize(paths[file_name]),
+                            tokenizer, tokenized_test, LABEL_LIST))
+
+    baseline = rows[0]
+    failed = []
+    print(f"\n{'variant':<22} {'size MB':>9} {'p50 ms':>8} {'speedup':>8} {'entity F1':>10} {'F1 drop':>8}")
+    for row in rows:
+        row["speedup"] = round(baseline["p50_ms"] / row["p50_ms"], 2)
+        row["size_ratio"] = round(baseline["size_mb"] / row["size_mb"], 2) if row["size_mb"] else None
+        row["f1_drop"] = round(baseline["entity_f1"] - row["entity_f1"], 4)
+        row["passed"] = row["f1_drop"] <= args.max_f1_drop
+        if not row["passed"]:
+            failed.append(row["variant"])
+        print(f"{row['variant']:<22} {row['size_mb']:>9.2f} {row['p50_ms']:>8.2f} {row['speedup']:>7.2f}x "
+              f"{row['entity_f1']:>10.4f} {row['f1_drop']:>8.4f}{'' if row['passed'] else '  ❌'}")
+
+    report_path = os.path.join(args.output_dir, "quantize_report.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "model": args.model,
+            "max_f1_drop": args.max_f1_drop,
+            "threads": torch.get_num_threads(),
+            "variants": rows,
+        }, f, indent=2)
+    print(f"\nReport written to {report_path}")
+    if failed:
+        print(f"❌ Accuracy gate failed: entity F1 dropped more than {args.max_f1_drop} for {', '.join(failed)}")
+        sys.exit(1)
+    print(f"✅ All variants within {args.max_f1_drop} entity F1 of fp32")
+
+
+if __name__ == "__main__":
+    main()
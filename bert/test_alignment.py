@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from benchmark_alignment import align_lists, generate_batch
+from tokenized_data import align_labels, align_labels_loop, pad_labels, pad_word_ids
+
+# Parity of the vectorized label alignment with the per-token loop.
+#
+#   python -m pytest test_alignment.py
+
+
+@pytest.mark.parametrize("word_ids_batch, labels_batch", [
+    ([], []),
+    ([[None, None]], [[]]),
+    ([[None, 0, 0, 1, None], [None, 0, 1, 1, 1, None]], [[1, 2], [3, 4]]),
+    ([[0, 0, 1], [None, 0]], [[2, 0], [1]]),
+    # A word the tokenizer dropped entirely (no sub-words for word 1)
+    ([[None, 0, 2, 2, None]], [[1, 2, 3]]),
+])
+def test_edge_cases(word_ids_batch, labels_batch):
+    assert align_lists(word_ids_batch, labels_batch) == align_labels_loop(word_ids_batch, labels_batch)
+
+
+@pytest.mark.parametrize("max_length", [None, 16])
+def test_generated_corpus(max_length):
+    word_ids_batch, labels_batch = generate_batch(5000, max_length=max_length, seed=1)
+    assert align_lists(word_ids_batch, labels_batch) == align_labels_loop(word_ids_batch, labels_batch)
+
+
+def test_label_dtypes():
+    # Label IDs above int8 keep int32; small ones are narrowed and still match the loop
+    word_ids_batch, labels_batch = generate_batch(200, num_labels=300, seed=3)
+    assert pad_labels(labels_batch).dtype == np.int32
+    assert align_lists(word_ids_batch, labels_batch) == align_labels_loop(word_ids_batch, labels_batch)
+    small = [[label % 100 for label in labels] for labels in labels_batch]
+    assert align_labels(pad_word_ids(word_ids_batch), pad_labels(small)).dtype == np.int8
+    assert align_lists(word_ids_batch, small) == align_labels_loop(word_ids_batch, small)
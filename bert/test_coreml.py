@@ -4,6 +4,8 @@ import numpy as np
 from transformers import AutoTokenizer, AutoConfig
 import argparse
 from pathlib import Path
+from coreml_shapes import model_lengths, pad_to_bucket
+from decoding import decode_batch, word_id_matrix
 
 def main():
     """
@@ -30,6 +32,8 @@ def main():
     try:
         # Load the Core ML model
         mlmodel = ct.models.MLModel(str(model_path))
+        # Set when the model was exported with enumerated sequence lengths
+        sequence_lengths = model_lengths(mlmodel)
         
         # Load the tokenizer and config
         tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
@@ -44,48 +48,6 @@ def main():
         0: "O", 1: "B-Artist", 2: "I-Artist", 3: "B-WoA", 4: "I-WoA"
     }
     
-    def extract_entities(tokens, predictions):
-        """
-        Combines token predictions into full-word entities.
-        """
-        entities = []
-        current_entity_tokens = []
-        current_entity_label = None
-
-        for token, prediction in zip(tokens, predictions):
-            label_id = prediction
-            label_name = id2label.get(label_id)
-
-            if label_name and label_name.startswith("B-"):
-                if current_entity_tokens:
-                    entity_string = tokenizer.convert_tokens_to_string(current_entity_tokens)
-                    entities.append({"entity": entity_string, "label": current_entity_label})
-                
-                current_entity_tokens = [token]
-                current_entity_label = label_name[2:]
-
-            elif label_name and label_name.startswith("I-"):
-                if current_entity_label == label_name[2:]:
-                    current_entity_tokens.append(token)
-                else: # Malformed I- tag, reset
-                    if current_entity_tokens:
-                        entity_string = tokenizer.convert_tokens_to_string(current_entity_tokens)
-                        entities.append({"entity": entity_string, "label": current_entity_label})
-                    current_entity_tokens = []
-                    current_entity_label = None
-            else: # O-tag or something else
-                if current_entity_tokens:
-                    entity_string = tokenizer.convert_tokens_to_string(current_entity_tokens)
-                    entities.append({"entity": entity_string, "label": current_entity_label})
-                current_entity_tokens = []
-                current_entity_label = None
-
-        if current_entity_tokens:
-            entity_string = tokenizer.convert_tokens_to_string(current_entity_tokens)
-            entities.append({"entity": entity_string, "label": current_entity_label})
-            
-        return entities
-
     def predict(text):
         """
         Takes a string, runs it through the Core ML model, and prints the predictions.
@@ -93,11 +55,14 @@ def main():
         print(f"\n--- Predictions for: '{text}' ---")
         
         # 1. Tokenize the input
-        inputs = tokenizer(text, return_tensors="pt")
+        inputs = tokenizer(text, return_tensors="pt", return_offsets_mapping=True)
         input_ids = inputs["input_ids"].numpy().astype(np.int32)
         print(input_ids)
         print(input_ids.shape)
         attention_mask = inputs["attention_mask"].numpy().astype(np.int32)
+        if sequence_lengths:
+            padded = pad_to_bucket(input_ids[0], sequence_lengths, tokenizer.pad_token_id)
+            input_ids, attention_mask = padded["input_ids"], padded["attention_mask"]
         print(attention_mask)
         print(attention_mask.shape)
         
@@ -113,11 +78,12 @@ def main():
             
         # 3. Post-process the output
         logits = prediction_output['logits']
-        predictions = np.argmax(logits, axis=2)[0] # Get the first (and only) batch
+        real_length = int(attention_mask.sum())
+        predictions = np.argmax(logits, axis=2)[0][:real_length] # Get the first (and only) batch, without padding
         print(predictions)
         
         # 4. Align tokens and labels
-        tokens = tokenizer.convert_ids_to_tokens(input_ids[0])
+        tokens = tokenizer.convert_ids_to_tokens(input_ids[0][:real_length])
         print(tokens)
         
         print("\n[Token Predictions]")
@@ -130,11 +96,11 @@ def main():
         print("---------------------------------")
         
         # 5. Extract and print entities
-        entities = extract_entities(tokens, predictions)
+        entities = decode_batch([text], logits, word_id_matrix(inputs), inputs["offset_mapping"].numpy(), id2label)[0]
         if entities:
             print("\n[Extracted Entities]")
             for entity in entities:
-                print(f"- {entity['entity']} ({entity['label']})")
+                print(f"- {entity['entity']} ({entity['label']}, {entity['score']:.2f})")
             print("---------------------------------")
         else:
             print("\nNo entities found.")
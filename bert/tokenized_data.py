@@ -0,0 +1,182 @@
+import functools
+import hashlib
+import json
+import os
+from itertools import chain
+
+from bio_data import save_dataset_atomically
+
+# Tokenization and label alignment for the fine-tuning scripts, with an
+# on-disk cache so repeated experiments skip straight to training.
+
+DEFAULT_CACHE_DIR = "./cache/tokenized"
+
+# Below this many examples per process, multiprocessing costs more than it saves.
+MIN_EXAMPLES_PER_PROC = 2000
+
+
+def align_labels_loop(word_ids_batch, labels_batch):
+    """Reference per-token loop: label the first sub-word of each word, mask the rest with -100."""
+    aligned = []
+    for word_ids, label in zip(word_ids_batch, labels_batch):
+        previous_word_idx = None
+        label_ids = []
+        for word_idx in word_ids:
+            if word_idx is None:
+                label_ids.append(-100)
+            elif word_idx != previous_word_idx:
+                label_ids.append(label[word_idx])
+            else:
+                label_ids.append(-100)
+            previous_word_idx = word_idx
+        aligned.append(label_ids)
+    return aligned
+
+
+def align_labels(word_ids, labels):
+    """
+    Same labelling as `align_labels_loop`, computed for a whole batch with NumPy.
+
+    `word_ids` is a (batch, tokens) integer array with -1 for special and
+    padding tokens; `labels` is a (batch, words) signed integer array of label
+    IDs. Returns a (batch, tokens) array of the labels' dtype where the first
+    sub-word of each word holds that word's label and every other position is
+    -100. Narrow dtypes (int16 word IDs, int8 labels, as `pad_word_ids` and
+    `pad_labels` give) roughly halve the time, since the work is memory-bound.
+    """
+    import numpy as np
+
+    word_ids = np.asarray(word_ids)
+    labels = np.asarray(labels)
+    batch, width = word_ids.shape
+    aligned = np.full(batch * width, -100, dtype=labels.dtype)
+    if labels.size == 0:
+        return aligned.reshape(batch, width)
+    first = word_ids >= 0
+    first[:, 1:] &= word_ids[:, 1:] != word_ids[:, :-1]
+
+    # Gather only at first sub-words, from the flattened label matrix: row * words + word
+    positions = np.flatnonzero(first)
+    aligned[positions] = labels.ravel()[positions // width * labels.shape[1] + word_ids.ravel()[positions]]
+    return aligned.reshape(batch, width)
+
+
+def pad_word_ids(word_ids_batch):
+    """Convert tokenizer word IDs (lists with None) to the padded array `align_labels` expects."""
+    import numpy as np
+
+    lengths = np.fromiter(map(len, word_ids_batch), dtype=np.int64, count=len(word_ids_batch))
+    width = int(lengths.max(initial=0))
+    # A word ID is below the sequence length, so int16 holds it for any realistic query
+    dtype = np.int16 if width <= np.iinfo(np.int16).max else np.int32
+    flat = np.array([-1 if w is None else w for ids in word_ids_batch for w in ids], dtype=dtype)
+    padded = np.full((len(lengths), width), -1, dtype=dtype)
+    padded[np.arange(width) < lengths[:, None]] = flat
+    return padded
+
+
+def pad_labels(labels_batch):
+    """Convert per-word label lists to a (batch, max words) array padded with 0, int8 when the IDs fit."""
+    import numpy as np
+
+    lengths = np.fromiter(map(len, labels_batch), dtype=np.int64, count=len(labels_batch))
+    flat = np.fromiter(chain.from_iterable(labels_batch), dtype=np.int32, count=int(lengths.sum()))
+    if flat.max(initial=0) <= np.iinfo(np.int8).max:
+        flat = flat.astype(np.int8)
+    padded = np.zeros((len(lengths), int(lengths.max(initial=0))), dtype=flat.dtype)
+    padded[np.arange(padded.shape[1]) < lengths[:, None]] = flat
+    return padded
+
+
+def tokenize_and_align_labels(examples, tokenizer, truncation=True, max_length=None):
+    """Tokenize pre-split words and label only the first sub-word of each word."""
+    tokenized_inputs = tokenizer(
+        examples["tokens"], truncation=truncation, max_length=max_length,
+        is_split_into_words=True, padding=False,
+    )
+    word_ids_batch = [encoding.word_ids for encoding in tokenized_inputs.encodings]
+    # Converting these Python lists to arrays costs as much as the loop itself,
+    # so the per-token loop stays here; `align_labels` is for array inputs.
+    tokenized_inputs["labels"] = align_labels_loop(word_ids_batch, examples["ner_tags"])
+    return tokenized_inputs
+
+
+def tokenizer_fingerprint(tokenizer):
+    """Hash of everything about the tokenizer that affects its output IDs."""
+    h = hashlib.sha256(type(tokenizer).__name__.encode('utf-8'))
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        # Vocabulary, normalizer, pre-tokenizer and post-processor in one document.
+        # Truncation and padding are per-call state the tokenizer mutates itself.
+        state = json.loads(backend.to_str())
+        state.pop("truncation", None)
+        state.pop("padding", None)
+        h.update(json.dumps(state, sort_keys=True).encode('utf-8'))
+    else:
+        h.update(json.dumps(tokenizer.get_vocab(), sort_keys=True).encode('utf-8'))
+    h.update(json.dumps(tokenizer.special_tokens_map, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()[:32]
+
+
+def dataset_fingerprint(dataset, rows_per_batch=65536):
+    """
+    Hash of a dataset's column types and rows, independent of how it was built.
+
+    Rows are re-batched into fixed windows and serialized with Arrow IPC, so
+    the same rows hash the same whether the table is sliced, concatenated,
+    behind an indices mapping or split into chunks differently.
+    """
+    if dataset._indices is not None:
+        dataset = dataset.flatten_indices()
+    table = dataset.data.table
+    h = hashlib.sha256(table.schema.remove_metadata().to_string().encode('utf-8'))
+    for start in range(0, table.num_rows, rows_per_batch):
+        # One contiguous chunk per window; IPC writes only the window's part of sliced buffers
+        for batch in table.slice(start, rows_per_batch).combine_chunks().to_batches():
+            h.update(batch.serialize())
+    return h.hexdigest()[:32]
+
+
+def tokenize_dataset(dataset, tokenizer, truncation=True, max_length=None,
+                     cache_dir=DEFAULT_CACHE_DIR, num_proc=None):
+    """
+    Tokenize and label-align `dataset`, reusing an on-disk copy when possible.
+
+    The cache key covers the tokenizer vocabulary and configuration, the
+    truncation settings and the source data, so changing any of them misses
+    the cache. Misses tokenize with up to `num_proc` processes (default: all
+    cores) and save the result as Arrow for the next run.
+    """
+    from datasets import load_from_disk
+
+    if max_length is None:
+        max_length = tokenizer.model_max_length
+    key_parts = [
+        tokenizer_fingerprint(tokenizer),
+        dataset_fingerprint(dataset),
+        json.dumps({"truncation": truncation, "max_length": max_length}),
+    ]
+    key = hashlib.sha256("|".join(key_parts).encode('utf-8')).hexdigest()[:32]
+    cache_path = os.path.join(cache_dir, key)
+    if os.path.exists(os.path.join(cache_path, "dataset_info.json")):
+        print(f"Loaded tokenized dataset from cache ({cache_path}).")
+        return load_from_disk(cache_path)
+
+    if num_proc is None:
+        num_proc = os.cpu_count() or 1
+    num_proc = max(1, min(num_proc, len(dataset) // MIN_EXAMPLES_PER_PROC))
+    if num_proc > 1:
+        # Rust-level threads in forked workers would oversubscribe the cores
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+    tokenized = dataset.map(
+        functools.partial(tokenize_and_align_labels, tokenizer=tokenizer, truncation=truncation, max_length=max_length),
+        batched=True,
+        num_proc=num_proc if num_proc > 1 else None,
+        remove_columns=dataset.column_names,
+        new_fingerprint=key,
+    )
+
+    save_dataset_atomically(tokenized, cache_path)
+    print(f"Tokenized {len(dataset)} examples with {num_proc} process(es); cached at {cache_path}.")
+    return load_from_disk(cache_path)
@@ -0,0 +1,296 @@
+import argparse
+import json
+import os
+import time
+
+# Config-driven fine-tuning entry point, tuned for multi-core Linux CPU boxes.
+# configs/finetune*.json hold the former finetune.py / finetune2.py /
+# finetune3.py settings, which differ only in data paths, base model and
+# epochs; those scripts are now thin wrappers running train.py with them.
+#
+#   python train.py configs/finetune.json
+#   python train.py configs/finetune3.json --set epochs=1 --set bf16=false
+#
+# Data-parallel training over the gloo backend runs under torchrun, which
+# starts one process per rank; each rank trains on its shard of the batches
+# and only rank 0 writes checkpoints, the model and the report:
+#
+#   torchrun --standalone --nproc_per_node 4 train.py configs/finetune.json
+#   torchrun --nnodes 2 --nproc_per_node 4 --rdzv_backend c10d \
+#       --rdzv_endpoint host0:29400 train.py configs/finetune.json
+#
+# distributed.py measures scaling efficiency from 1 to N ranks.
+#
+# finetune_mode "lora" or "top_k" trains only adapters or the last layers plus
+# the classifier and writes just that delta to output_model_dir; merge it into
+# the base with adapters.py (see configs/finetune3_lora.json).
+
+DEFAULT_CONFIG = {
+    "base_model": "distilbert/distilbert-base-cased-distilled-squad",
+    "output_model_dir": "./model",
+    "results_dir": "./results",
+    # Dataset directories containing train/test .IOB or .bio files
+    "dataset_dirs": [],
+    # Base directories whose subdirectories are all dataset directories
+    "base_dataset_dirs": [],
+    "epochs": 3,
+    "learning_rate": 2e-5,
+    "weight_decay": 0.01,
+    "batch_size": 16,
+    "eval_batch_size": 16,
+    "gradient_accumulation_steps": 1,
+    "logging_steps": 50,
+    "seed": 42,
+    # "fixed" (batch_size examples), "token_budget" (max_tokens per batch) or "packed"
+    "batching": "token_budget",
+    "max_tokens": 512,
+    "pack_max_length": 128,
+    "bf16": True,
+    # 0 means one intra-op thread per core, split between the ranks on a host
+    "num_threads": 0,
+    "interop_threads": 1,
+    "dataloader_num_workers": 2,
+    "save_total_limit": 2,
+    "resume": True,
+    "ddp_backend": "gloo",
+    # "full", or a delta fine-tune: "lora" (adapters) or "top_k" (last layers)
+    "finetune_mode": "full",
+    "lora_rank": 8,
+    "lora_alpha": 16,
+    "lora_dropout": 0.0,
+    "lora_targets": ["q_lin", "k_lin", "v_lin", "out_lin"],
+    "top_k_layers": 2,
+}
+
+
+def load_config(path, overrides):
+    config = dict(DEFAULT_CONFIG)
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            config.update(json.load(f))
+    for override in overrides:
+        key, _, value = override.partition("=")
+        if key not in DEFAULT_CONFIG:
+            raise ValueError(f"Unknown config key '{key}'. Known keys: {', '.join(DEFAULT_CONFIG)}")
+        try:
+            config[key] = json.loads(value)
+        except json.JSONDecodeError:
+            config[key] = value
+    if config["batching"] not in ("fixed", "token_budget", "packed"):
+        raise ValueError(f"Unknown batching mode '{config['batching']}'")
+    if config["finetune_mode"] not in ("full", "lora", "top_k"):
+        raise ValueError(f"Unknown finetune mode '{config['finetune_mode']}'")
+    return config
+
+
+def configure_threads(config):
+    """Set intra-/inter-op thread counts before torch does any parallel work."""
+    import torch
+
+    local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", 1))
+    num_threads = config["num_threads"] or max(1, (os.cpu_count() or 1) // local_world_size)
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(config["interop_threads"])
+    except RuntimeError:
+        # Already fixed for this process (e.g. set by an importing script)
+        pass
+    return num_threads
+
+
+def loss_report_scale(trainer):
+    """
+    Factor by which Trainer's logged train and eval losses exceed the per-token loss.
+
+    With `average_tokens_across_devices` on and a model taking loss kwargs (or a
+    `compute_loss_func`), transformers' `Trainer.compute_loss` normalises by the
+    token count summed over all ranks and then multiplies the loss by the
+    number of data-parallel processes, so DDP's gradient mean comes out right.
+    Training and evaluation both log that scaled value. Otherwise the losses
+    are not rescaled and the factor is 1.
+    """
+    args = trainer.args
+    if not (args.average_tokens_across_devices and (trainer.model_accepts_loss_kwargs or trainer.compute_loss_func)):
+        return 1
+    if args.n_gpu > 1:
+        return args.n_gpu
+    tp_size = trainer.get_tp_size() if hasattr(trainer, "get_tp_size") else 1
+    return trainer.accelerator.num_processes // tp_size
+
+
+def build_trainer(config, model, tokenizer, tokenized_train, tokenized_test, training_args):
+    from transformers import Trainer, DataCollatorForTokenClassification
+
+    if config["batching"] == "packed":
+        from packing import PackedDataCollator, PackedTrainer, pack_dataset
+
+        return PackedTrainer(
+            model=model,
+            args=training_args,
+            train_dataset=pack_dataset(tokenized_train, config["pack_max_length"]),
+            eval_dataset=pack_dataset(tokenized_test, config["pack_max_length"]),
+            data_collator=PackedDataCollator(tokenizer),
+        )
+
+    data_collator = DataCollatorForTokenClassification(tokenizer)
+    if config["batching"] == "token_budget":
+        from batching import TokenBudgetTrainer
+
+        return TokenBudgetTrainer(
+            model=model,
+            args=training_args,
+            train_dataset=tokenized_train,
+            eval_dataset=tokenized_test,
+            data_collator=data_collator,
+            max_tokens=config["max_tokens"],
+        )
+    return Trainer(
+        model=model,
+        args=training_args,
+        train_dataset=tokenized_train,
+        eval_dataset=tokenized_test,
+        data_collator=data_collator,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fine-tune the MusicNER token classifier from a JSON config.")
+    parser.add_argument("config", nargs='?', default=None, help="Path to a JSON config (see configs/)")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE",
+                        help="Override a config value; VALUE is parsed as JSON when possible")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore existing checkpoints in results_dir")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    config = load_config(args.config, args.overrides)
+    if args.no_resume:
+        config["resume"] = False
+    num_threads = configure_threads(config)
+    print(f"Using {num_threads} intra-op and {config['interop_threads']} inter-op threads, "
+          f"{config['dataloader_num_workers']} data-loader workers.")
+
+    from transformers import AutoTokenizer, AutoModelForTokenClassification, TrainingArguments
+    from transformers.trainer_utils import get_last_checkpoint
+    from bio_data import LABEL_LIST, list_dataset_dirs, load_bio_splits
+    from tokenized_data import tokenize_dataset
+
+    label_list = LABEL_LIST
+    label2id = {label: i for i, label in enumerate(label_list)}
+    id2label = {i: label for i, label in enumerate(label_list)}
+
+    print(f"Loading tokenizer and model from {config['base_model']}...")
+    tokenizer = AutoTokenizer.from_pretrained(config["base_model"])
+    model = AutoModelForTokenClassification.from_pretrained(
+        config["base_model"],
+        num_labels=len(label_list),
+        id2label=id2label,
+        label2id=label2id,
+        ignore_mismatched_sizes=True
+    )
+    delta_config = None
+    delta_bytes = None
+    if config["finetune_mode"] != "full":
+        from adapters import prepare_model
+
+        delta_config = {"mode": config["finetune_mode"], "base_model": config["base_model"]}
+        delta_config.update({key: config[key] for key in DEFAULT_CONFIG if key.startswith(("lora_", "top_k_"))})
+        prepare_model(model, delta_config)
+        trainable = sum(p.numel() for p in model.parameters() if p.requires_grad)
+        total = sum(p.numel() for p in model.parameters())
+        print(f"Delta fine-tune ({config['finetune_mode']}): {trainable:,} of {total:,} parameters trainable "
+              f"({trainable / total:.2%})")
+
+    training_args = TrainingArguments(
+        output_dir=config["results_dir"],
+        eval_strategy="epoch",
+        save_strategy="epoch",
+        save_total_limit=config["save_total_limit"],
+        learning_rate=config["learning_rate"],
+        per_device_train_batch_size=config["batch_size"],
+        per_device_eval_batch_size=config["eval_batch_size"],
+        gradient_accumulation_steps=config["gradient_accumulation_steps"],
+        num_train_epochs=config["epochs"],
+        weight_decay=config["weight_decay"],
+        logging_steps=config["logging_steps"],
+        seed=config["seed"],
+        use_cpu=True,
+        bf16=config["bf16"],  # CPU autocast to bfloat16
+        dataloader_num_workers=config["dataloader_num_workers"],
+        dataloader_persistent_workers=config["dataloader_num_workers"] > 0,
+        # Only under torchrun; a backend without a process group fails in plain `python train.py`
+        ddp_backend=config["ddp_backend"] if "LOCAL_RANK" in os.environ else None,
+        ddp_find_unused_parameters=False,
+        report_to=[],
+    )
+    # Rank 0 parses and tokenizes first; the other ranks then hit its caches
+    with training_args.main_process_first(desc="dataset loading"):
+        dataset_dirs = list(config["dataset_dirs"]) + list_dataset_dirs(config["base_dataset_dirs"])
+        train_dataset, test_dataset = load_bio_splits(dataset_dirs, label_list)
+        if train_dataset and test_dataset:
+            tokenized_train = tokenize_dataset(train_dataset, tokenizer)
+            tokenized_test = tokenize_dataset(test_dataset, tokenizer)
+    if not train_dataset or not test_dataset:
+        print("❌ Error: No training or testing data was loaded. Please check the dataset paths. Exiting.")
+        return
+    print(f"\n✅ All datasets loaded: {len(train_dataset)} total train examples, {len(test_dataset)} total test examples")
+
+    trainer = build_trainer(config, model, tokenizer, tokenized_train, tokenized_test, training_args)
+
+    checkpoint = None
+    start_epoch = 0.0
+    if config["resume"] and os.path.isdir(config["results_dir"]):
+        checkpoint = get_last_checkpoint(config["results_dir"])
+        if checkpoint:
+            with open(os.path.join(checkpoint, "trainer_state.json"), 'r', encoding='utf-8') as f:
+                start_epoch = json.load(f).get("epoch") or 0.0
+            print(f"Resuming from {checkpoint} (epoch {start_epoch:g})")
+
+    print("Starting fine-tuning...")
+    train_start = time.perf_counter()
+    result = trainer.train(resume_from_checkpoint=checkpoint)
+    train_seconds = time.perf_counter() - train_start
+    print("Fine-tuning complete.")
+
+    if trainer.is_world_process_zero() and delta_config:
+        from adapters import save_delta
+
+        print(f"Saving {config['finetune_mode']} delta to {config['output_model_dir']}...")
+        delta_bytes = save_delta(model, config["output_model_dir"], delta_config)
+        print(f"Delta is {delta_bytes / 1e6:.2f} MB; merge it with "
+              f"`python adapters.py merge --base {config['base_model']} --delta {config['output_model_dir']} --output <dir>`")
+    elif trainer.is_world_process_zero():
+        print(f"Saving fine-tuned model to {config['output_model_dir']}...")
+        trainer.save_model(config["output_model_dir"])
+        tokenizer.save_pretrained(config["output_model_dir"])
+
+    # Undo Trainer's data-parallel loss scaling so 1-rank and N-rank reports compare
+    loss_scale = loss_report_scale(trainer)
+    train_loss = result.metrics.get("train_loss")
+    eval_metrics = trainer.evaluate()
+    if "eval_loss" in eval_metrics:
+        eval_metrics["eval_loss"] /= loss_scale
+    report = {
+        "config": config,
+        "world_size": training_args.world_size,
+        "trainable_parameters": sum(p.numel() for p in model.parameters() if p.requires_grad),
+        "delta_bytes": delta_bytes,
+        "resumed_from": checkpoint,
+        "wall_seconds": round(time.perf_counter() - start, 2),
+        "train_seconds": round(train_seconds, 2),
+        # Original examples, not packed rows, so batching modes compare fairly
+        "train_samples_per_second": round(len(tokenized_train) * (trainer.state.epoch - start_epoch) / train_seconds, 1),
+        "train_loss": train_loss / loss_scale if train_loss is not None else None,
+        "loss_scale_removed": loss_scale,
+        "eval": eval_metrics,
+    }
+    if trainer.is_world_process_zero():
+        os.makedirs(config["results_dir"], exist_ok=True)
+        with open(os.path.join(config["results_dir"], "run_report.json"), 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWall time: {report['wall_seconds']}s (training {report['train_seconds']}s), "
+              f"{report['train_samples_per_second']} samples/sec")
+        print(f"Report written to {os.path.join(config['results_dir'], 'run_report.json')}")
+
+
+if __name__ == "__main__":
+    main()